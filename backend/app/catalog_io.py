@@ -0,0 +1,264 @@
+# catalog_io.py
+# Потоковый импорт/экспорт каталога продавца (CSV и Parquet).
+# Файл читается пачками, каждая пачка валидируется pydantic-схемой и
+# вставляется одним executemany; ошибочные строки попадают в отчет и не
+# прерывают импорт. Нечитаемый файл (кодировка, CSV, Parquet) прерывает импорт
+# с ImportFileError, уже закоммиченные пачки остаются. Замер пропускной способности:
+#   python -m app.catalog_io bench --owner-id 1 [--rows 100000] [--chunk-size 1000]
+import argparse
+import csv
+import io
+import time
+from itertools import islice
+from types import SimpleNamespace
+from typing import IO, Iterable, Iterator
+
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+
+from .geo_tiles import listing_summary, queue_listing_updates
+from .models import Item, ProductCategory
+from .schemas import ItemImportError, ItemImportReport, ItemImportRow
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+EXPORT_COLUMNS = ("id", "title", "description", "price", "location", "category_id", "created_at", "updated_at")
+IMPORT_FORMATS = ("csv", "parquet")
+
+
+class ImportFileError(ValueError):
+    """Файл перестал читаться на строке row; imported строк до нее уже сохранены."""
+
+    def __init__(self, row: int, reason: str):
+        super().__init__(f"Строка {row}: файл не читается ({reason})")
+        self.row = row
+        self.imported = 0
+
+
+def detect_format(filename: str | None) -> str:
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValueError("Поддерживаются только файлы .csv и .parquet")
+    return extension
+
+
+def iter_csv_rows(stream: IO[bytes]) -> Iterator[dict]:
+    # Декодируем построчно, без упреждающего чтения: ошибка кодировки
+    # относится к той строке, где она есть
+    reader = csv.DictReader(line.decode("utf-8-sig") for line in stream)
+    row_number = 0
+    try:
+        for row in reader:
+            row_number += 1
+            yield {key: (value if value != "" else None) for key, value in row.items()}
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ImportFileError(row_number + 1, str(e)) from e
+
+
+def iter_parquet_rows(stream: IO[bytes], batch_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[dict]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    row_number = 0
+    try:
+        for batch in pq.ParquetFile(stream).iter_batches(batch_size=batch_size):
+            rows = batch.to_pylist()
+            row_number += len(rows)
+            yield from rows
+    except pa.ArrowInvalid as e:
+        raise ImportFileError(row_number + 1, str(e)) from e
+
+
+def iter_rows(stream: IO[bytes], file_format: str) -> Iterator[dict]:
+    if file_format == "parquet":
+        return iter_parquet_rows(stream)
+    return iter_csv_rows(stream)
+
+
+def _chunks(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _reject(report: ItemImportReport, row_number: int, errors: list[str]) -> None:
+    report.failed += 1
+    if len(report.errors) < MAX_REPORTED_ERRORS:
+        report.errors.append(ItemImportError(row=row_number, errors=errors))
+
+
+def _existing_categories(db, category_ids: set[int]) -> set[int]:
+    if not category_ids:
+        return set()
+    return set(db.execute(select(ProductCategory.id).where(ProductCategory.id.in_(category_ids))).scalars())
+
+
+def import_items(db, owner_id: int, rows: Iterable[dict], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 commit: bool = True) -> ItemImportReport:
+    """Импортирует товары продавца; номера строк в отчете считаются с 1."""
+    report = ItemImportReport(imported=0, failed=0, errors=[])
+    try:
+        _import_chunks(db, owner_id, rows, chunk_size, commit, report)
+    except ImportFileError as e:
+        e.imported = report.imported
+        raise
+    return report
+
+
+def _import_chunks(db, owner_id: int, rows: Iterable[dict], chunk_size: int, commit: bool,
+                   report: ItemImportReport) -> None:
+    row_number = 0
+    for chunk in _chunks(rows, chunk_size):
+        checked = []
+        for raw in chunk:
+            row_number += 1
+            try:
+                item = ItemImportRow.model_validate(raw)
+            except ValidationError as e:
+                _reject(report, row_number, [f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()])
+                continue
+            checked.append((row_number, {**item.model_dump(), "owner_id": owner_id}))
+
+        # Несуществующая категория иначе уронила бы всю пачку на внешнем ключе
+        categories = _existing_categories(db, {values["category_id"] for _, values in checked} - {None})
+        valid = []
+        for number, values in checked:
+            if values["category_id"] is not None and values["category_id"] not in categories:
+                _reject(report, number, [f"category_id: категория {values['category_id']} не найдена"])
+            else:
+                valid.append(values)
+
+        if valid:
+            items = Item.__table__
+            inserted = db.execute(
+                insert(items).returning(items.c.id, items.c.updated_at, sort_by_parameter_order=True),
+                valid,
+            ).all()
+            # Core-вставка не видна ORM-событиям, поэтому гео-тайлы обновляем явно
+            queue_listing_updates(db, (
+                (f"item:{row.id}", listing_summary("item", SimpleNamespace(**values, id=row.id, updated_at=row.updated_at)))
+                for values, row in zip(valid, inserted)
+            ))
+            if commit:
+                db.commit()
+            report.imported += len(valid)
+
+
+def _iter_catalog(db, owner_id: int, batch_size: int) -> Iterator[list]:
+    columns = [getattr(Item, name) for name in EXPORT_COLUMNS]
+    result = db.execute(
+        select(*columns).where(Item.owner_id == owner_id).order_by(Item.id),
+        execution_options={"yield_per": batch_size},
+    )
+    for partition in result.partitions():
+        yield partition
+
+
+def export_csv(owner_id: int, batch_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Отдает каталог продавца кусками CSV через серверный курсор."""
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for partition in _iter_catalog(db, owner_id, batch_size):
+            writer.writerows(partition)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+    finally:
+        db.close()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файловый объект для ParquetWriter: накапливает байты до выдачи клиенту."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def export_parquet(owner_id: int, batch_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Отдает каталог продавца в Parquet: одна row group на пачку курсора."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    from .database import SessionLocal
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("title", pa.string()),
+        ("description", pa.string()),
+        ("price", pa.int64()),
+        ("location", pa.string()),
+        ("category_id", pa.int64()),
+        ("created_at", pa.timestamp("us")),
+        ("updated_at", pa.timestamp("us")),
+    ])
+    sink = _ChunkSink()
+    db = SessionLocal()
+    try:
+        with pq.ParquetWriter(sink, schema) as writer:
+            for partition in _iter_catalog(db, owner_id, batch_size):
+                writer.write_table(pa.Table.from_pylist([row._asdict() for row in partition], schema=schema))
+                yield sink.drain()
+        yield sink.drain()
+    finally:
+        db.close()
+
+
+def _synthetic_csv(rows: int) -> io.BytesIO:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["title", "description", "price", "location"])
+    for i in range(rows):
+        writer.writerow([f"Товар {i}", "Синтетический товар для замера", 100 + i % 1000, "46.95,142.73"])
+    return io.BytesIO(buffer.getvalue().encode("utf-8"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Импорт/экспорт каталога")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench", help="Замер скорости импорта (строк/с), изменения откатываются")
+    bench_parser.add_argument("--owner-id", type=int, required=True)
+    bench_parser.add_argument("--rows", type=int, default=100_000)
+    bench_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        from .database import SessionLocal
+
+        stream = _synthetic_csv(args.rows)
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            report = import_items(db, args.owner_id, iter_csv_rows(stream), args.chunk_size, commit=False)
+            elapsed = time.perf_counter() - started
+            db.rollback()
+        finally:
+            db.close()
+        print(f"Импортировано {report.imported} строк за {elapsed:.2f} с: "
+              f"{report.imported / elapsed:,.0f} строк/с (пачка {args.chunk_size})")
+
+
+if __name__ == "__main__":
+    main()
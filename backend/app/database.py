@@ -1,12 +1,53 @@
+import threading
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from .config import settings
 
 DATABASE_URL = settings.DATABASE_URL
 
+# Модули с обработчиками событий сессии (after_flush/after_commit/after_rollback)
+LISTENER_MODULES = ("rollups", "realtime", "geo_tiles", "recommendations")
+
+_listeners_lock = threading.Lock()
+_listeners_installed = False
+
+
+def install_listeners() -> None:
+    """Регистрирует обработчики событий SessionLocal, один раз на процесс.
+
+    Вызывается при создании первой сессии, поэтому API, воркер, cron-задачи и
+    CLI получают одинаковый набор обработчиков независимо от того, какие
+    модули они импортировали.
+    """
+    global _listeners_installed
+    if _listeners_installed:
+        return
+    import importlib
+
+    with _listeners_lock:
+        if _listeners_installed:
+            return
+        for name in LISTENER_MODULES:
+            importlib.import_module(f"{__package__}.{name}").install_listeners(SessionLocal)
+        _listeners_installed = True
+
+
+class AppSession(Session):
+    def __init__(self, *args, **kwargs):
+        install_listeners()
+        super().__init__(*args, **kwargs)
+
+
 engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=AppSession, autocommit=False, autoflush=False, bind=engine)
+
+# Реплика для тяжелых чтений (отчеты); если не задана — основная БД
+replica_engine = (
+    create_engine(settings.DATABASE_REPLICA_URL, pool_pre_ping=True)
+    if settings.DATABASE_REPLICA_URL else engine
+)
 
 Base = declarative_base()
 
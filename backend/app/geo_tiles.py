@@ -0,0 +1,358 @@
+# geo_tiles.py
+# Предрассчитанные тайлы карты (z/x/y, Web Mercator) с объявлениями в Redis.
+# Ключи индекса живут в поколении G, на рабочее поколение указывает geo:gen:
+#   geo:G:t:{z}:{x}:{y}  — zset участников тайла (score = updated_at), отсюда count и top-N
+#   geo:G:c:{z}:{x}:{y}  — hash счетчиков по подтайлам z+2 для кластеров
+#   geo:G:listing        — hash "item:ID" -> JSON краткой карточки
+#   geo:G:pos            — hash "item:ID" -> "x,y" тайла на DEEP_ZOOM; из него
+#                          скрипт выводит все старые тайлы сдвигом координат
+# Изменение пачки объявлений — один Lua-скрипт (атомарно, без WATCH), после
+# коммита изменений Item/Service. Полная перестройка пишет новое поколение;
+# пока она идет (geo:build), обычные изменения пишутся в оба поколения и
+# помечаются в geo:B:dirty, чтобы снимок перестройки их не перезаписал.
+# В конце geo:gen атомарно переключается на новое поколение:
+#   python -m app.geo_tiles rebuild [--if-missing]
+# Скрипт обращается к ключам, которые вычисляет сам, поэтому нужен
+# одиночный Redis (не Redis Cluster).
+import argparse
+import json
+import logging
+import math
+from typing import Iterable, Optional
+
+from sqlalchemy import event, inspect, select
+
+from .database import SessionLocal
+from .models import Item, Service
+from .utils import get_redis
+
+logger = logging.getLogger("sakhshop")
+
+MIN_ZOOM = 4
+MAX_ZOOM = 16
+CLUSTER_DEPTH = 2  # тайл делится на 4x4 ячейки
+DEFAULT_TOP = 20
+MAX_TOP = 100
+MAX_LAT = 85.05112878
+
+DEEP_ZOOM = MAX_ZOOM + CLUSTER_DEPTH
+
+KEY_PREFIX = "geo"
+GENERATION_KEY = f"{KEY_PREFIX}:gen"
+BUILD_KEY = f"{KEY_PREFIX}:build"
+SEQUENCE_KEY = f"{KEY_PREFIX}:seq"
+CONTROL_KEYS = frozenset({GENERATION_KEY, BUILD_KEY, SEQUENCE_KEY})
+DEFAULT_GENERATION = "0"  # до первой перестройки изменения пишутся сюда
+BUILD_TTL_SECONDS = 3600  # продлевается на каждой пачке; брошенная перестройка истекает
+LISTING_MODELS = {"item": Item, "service": Service}
+
+
+def lat_lon_to_tile(lat: float, lon: float, z: int) -> tuple[int, int]:
+    lat = max(min(lat, MAX_LAT), -MAX_LAT)
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_to_lat_lon(x: float, y: float, z: int) -> tuple[float, float]:
+    n = 2 ** z
+    lon = x / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    return lat, lon
+
+
+def parse_location(location: Optional[str]) -> Optional[tuple[float, float]]:
+    try:
+        lat, lon = map(float, location.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def _tile_key(kind: str, generation: str, z: int, x: int, y: int) -> str:
+    return f"{KEY_PREFIX}:{generation}:{kind}:{z}:{x}:{y}"
+
+
+def listing_summary(listing_type: str, obj) -> Optional[dict]:
+    point = parse_location(obj.location)
+    if point is None:
+        return None
+    return {
+        "id": obj.id,
+        "type": listing_type,
+        "title": obj.title,
+        "price": obj.price,
+        "lat": point[0],
+        "lon": point[1],
+        "updated_at": obj.updated_at.timestamp() if obj.updated_at else 0,
+    }
+
+
+# KEYS[1] — префикс; ARGV: поколение перестройки ('' — обычное изменение),
+# MIN_ZOOM, MAX_ZOOM, CLUSTER_DEPTH, DEEP_ZOOM, поколение по умолчанию, затем четверки
+# member, "x,y" на DEEP_ZOOM ('' — удалить), score, JSON карточки
+_APPLY_SCRIPT = """
+local prefix = KEYS[1]
+local min_zoom, max_zoom = tonumber(ARGV[2]), tonumber(ARGV[3])
+local depth, deep = tonumber(ARGV[4]), tonumber(ARGV[5])
+
+local function place(gen, member, pos, score, sign)
+    local x, y = string.match(pos, '(%d+),(%d+)')
+    x, y = tonumber(x), tonumber(y)
+    for z = min_zoom, max_zoom do
+        local tile_div, cell_div = 2 ^ (deep - z), 2 ^ (deep - z - depth)
+        local suffix = z .. ':' .. math.floor(x / tile_div) .. ':' .. math.floor(y / tile_div)
+        local tile_key = prefix .. ':' .. gen .. ':t:' .. suffix
+        local cells_key = prefix .. ':' .. gen .. ':c:' .. suffix
+        local cell = math.floor(x / cell_div) .. ':' .. math.floor(y / cell_div)
+        if sign > 0 then
+            redis.call('ZADD', tile_key, score, member)
+            redis.call('HINCRBY', cells_key, cell, 1)
+        else
+            redis.call('ZREM', tile_key, member)
+            if redis.call('HINCRBY', cells_key, cell, -1) <= 0 then
+                redis.call('HDEL', cells_key, cell)
+            end
+        end
+    end
+end
+
+local function apply(gen, member, pos, score, summary)
+    local pos_key, listing_key = prefix .. ':' .. gen .. ':pos', prefix .. ':' .. gen .. ':listing'
+    local old = redis.call('HGET', pos_key, member)
+    if old then
+        place(gen, member, old, 0, -1)
+    end
+    if pos == '' then
+        redis.call('HDEL', pos_key, member)
+        redis.call('HDEL', listing_key, member)
+    else
+        place(gen, member, pos, score, 1)
+        redis.call('HSET', pos_key, member, pos)
+        redis.call('HSET', listing_key, member, summary)
+    end
+end
+
+local build = ARGV[1]
+local live = build == ''
+local generations = {build}
+if live then
+    generations = {redis.call('GET', prefix .. ':gen') or ARGV[6]}
+    build = redis.call('GET', prefix .. ':build')
+    if build then
+        table.insert(generations, build)
+    end
+end
+for i = 7, #ARGV, 4 do
+    local member, pos, score, summary = ARGV[i], ARGV[i + 1], ARGV[i + 2], ARGV[i + 3]
+    if live then
+        if build then
+            redis.call('SADD', prefix .. ':' .. build .. ':dirty', member)
+        end
+        for _, gen in ipairs(generations) do
+            apply(gen, member, pos, score, summary)
+        end
+    elseif redis.call('SISMEMBER', prefix .. ':' .. build .. ':dirty', member) == 0 then
+        apply(build, member, pos, score, summary)
+    end
+end
+return 1
+"""
+
+# Переключает geo:gen на собранное поколение, если перестройка все еще наша;
+# возвращает прежнее поколение
+_SWAP_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return false
+end
+local previous = redis.call('GET', KEYS[1]) or ''
+redis.call('SET', KEYS[1], ARGV[1])
+redis.call('DEL', KEYS[2])
+return previous
+"""
+
+
+def index_listings(entries: list[tuple[str, Optional[dict]]], client=None,
+                   generation: Optional[str] = None) -> None:
+    """Применяет пачку изменений [(member, summary | None)]; None — убрать из тайлов.
+
+    Без generation пишет в рабочее поколение (и в собираемое, если идет
+    перестройка); с generation — только в него, пропуская объявления,
+    измененные во время перестройки.
+    """
+    if not entries:
+        return
+    client = client or get_redis()
+    args = [generation or "", MIN_ZOOM, MAX_ZOOM, CLUSTER_DEPTH, DEEP_ZOOM, DEFAULT_GENERATION]
+    for member, summary in entries:
+        if summary is None:
+            args.extend((member, "", 0, ""))
+            continue
+        x, y = lat_lon_to_tile(summary["lat"], summary["lon"], DEEP_ZOOM)
+        args.extend((member, f"{x},{y}", summary["updated_at"], json.dumps(summary, ensure_ascii=False)))
+    client.register_script(_APPLY_SCRIPT)(keys=[KEY_PREFIX], args=args)
+
+
+def get_tile(z: int, x: int, y: int, top: int = DEFAULT_TOP) -> dict:
+    """Ответ тайла из Redis: счетчик, кластеры по ячейкам и top-N свежих объявлений."""
+    client = get_redis()
+    generation = client.get(GENERATION_KEY) or DEFAULT_GENERATION
+    tile_key, cells_key = _tile_key("t", generation, z, x, y), _tile_key("c", generation, z, x, y)
+    pipe = client.pipeline(transaction=False)
+    pipe.zcard(tile_key)
+    pipe.zrevrange(tile_key, 0, top - 1)
+    pipe.hgetall(cells_key)
+    count, members, cells = pipe.execute()
+
+    clusters = []
+    for cell, cell_count in cells.items():
+        cell_count = int(cell_count)
+        if cell_count <= 0:
+            continue
+        cx, cy = map(int, cell.split(":"))
+        lat, lon = tile_to_lat_lon(cx + 0.5, cy + 0.5, z + CLUSTER_DEPTH)
+        clusters.append({"lat": lat, "lon": lon, "count": cell_count})
+
+    listings_key = f"{KEY_PREFIX}:{generation}:listing"
+    items = [json.loads(raw) for raw in client.hmget(listings_key, members) if raw] if members else []
+    return {"z": z, "x": x, "y": y, "count": count, "clusters": clusters, "items": items}
+
+
+# --- Инкрементальные обновления ---------------------------------------------
+
+def queue_listing_updates(session, entries: Iterable[tuple[str, Optional[dict]]]) -> None:
+    """Ставит изменения в очередь сессии; в Redis они уходят после коммита."""
+    session.info.setdefault("geo_updates", {}).update(entries)
+
+
+def _collect_updates(session, flush_context):
+    updates = {}
+    for obj in [*session.new, *session.dirty, *session.deleted]:
+        listing_type = "item" if isinstance(obj, Item) else "service" if isinstance(obj, Service) else None
+        if listing_type is None:
+            continue
+        member = f"{listing_type}:{obj.id}"
+        if obj in session.deleted:
+            updates[member] = None
+        elif obj in session.new or any(inspect(obj).attrs[attr].history.has_changes()
+                                      for attr in ("location", "title", "price")):
+            updates[member] = listing_summary(listing_type, obj)
+    if updates:
+        queue_listing_updates(session, updates.items())
+
+
+def _apply_updates(session):
+    updates = session.info.pop("geo_updates", None)
+    if not updates:
+        return
+    from redis.exceptions import RedisError
+
+    try:
+        index_listings(list(updates.items()))
+    except RedisError as e:
+        # Индекс догонит ночная перестройка (infra/geo-tiles-cronjob.yaml)
+        logger.warning(f"Не удалось обновить гео-тайлы для {len(updates)} объявлений: {e}")
+
+
+def _discard_updates(session):
+    session.info.pop("geo_updates", None)
+
+
+def install_listeners(session_factory) -> None:
+    event.listen(session_factory, "after_flush", _collect_updates)
+    event.listen(session_factory, "after_commit", _apply_updates)
+    event.listen(session_factory, "after_rollback", _discard_updates)
+
+
+# --- Полная перестройка -----------------------------------------------------
+
+def _unlink_matching(client, pattern: str, keep=lambda key: False) -> None:
+    stale = []
+    for key in client.scan_iter(match=pattern, count=1000):
+        if keep(key):
+            continue
+        stale.append(key)
+        if len(stale) >= 1000:
+            client.unlink(*stale)
+            stale = []
+    if stale:
+        client.unlink(*stale)
+
+
+def _unlink_stale_generations(client) -> None:
+    """Удаляет ключи всех поколений, кроме рабочего и собираемого."""
+    generations = {client.get(GENERATION_KEY) or DEFAULT_GENERATION, client.get(BUILD_KEY)} - {None}
+    _unlink_matching(
+        client, f"{KEY_PREFIX}:*",
+        keep=lambda key: key in CONTROL_KEYS or key.split(":")[1] in generations,
+    )
+
+
+class RebuildInProgress(RuntimeError):
+    pass
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    client = get_redis()
+    generation = str(client.incr(SEQUENCE_KEY))
+    if not client.set(BUILD_KEY, generation, nx=True, ex=BUILD_TTL_SECONDS):
+        raise RebuildInProgress(f"Перестройка гео-тайлов уже идет (поколение {client.get(BUILD_KEY)})")
+
+    indexed = 0
+    db = SessionLocal()
+    try:
+        for listing_type, model in LISTING_MODELS.items():
+            result = db.execute(
+                select(model.id, model.title, model.price, model.location, model.updated_at),
+                execution_options={"yield_per": batch_size},
+            )
+            for partition in result.partitions():
+                entries = []
+                for row in partition:
+                    summary = listing_summary(listing_type, row)
+                    if summary is not None:
+                        entries.append((f"{listing_type}:{row.id}", summary))
+                index_listings(entries, client, generation=generation)
+                client.expire(BUILD_KEY, BUILD_TTL_SECONDS)
+                indexed += len(entries)
+        previous = client.register_script(_SWAP_SCRIPT)(keys=[GENERATION_KEY, BUILD_KEY], args=[generation])
+    except BaseException:
+        if client.get(BUILD_KEY) == generation:
+            client.delete(BUILD_KEY)
+        raise
+    finally:
+        db.close()
+    if previous is None:
+        raise RebuildInProgress(f"Перестройка поколения {generation} истекла до переключения")
+    _unlink_stale_generations(client)
+    logger.info(f"Гео-тайлы перестроены: {indexed} объявлений, поколение {generation}")
+    return indexed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Гео-тайлы карты объявлений")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="Перестроить тайлы из БД")
+    rebuild_parser.add_argument("--batch-size", type=int, default=1000)
+    rebuild_parser.add_argument("--if-missing", action="store_true",
+                                help="только если индекса еще нет (init-контейнер API)")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        if args.if_missing and get_redis().exists(GENERATION_KEY):
+            print("Гео-тайлы уже построены")
+            return
+        try:
+            print(f"Проиндексировано объявлений: {rebuild(args.batch_size)}")
+        except RebuildInProgress as e:
+            # Параллельный под уже строит индекс; для --if-missing этого достаточно
+            if not args.if_missing:
+                raise
+            print(e)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,270 @@
-# Создаем новый файл gosuslugi.py
-import requests
+# gosuslugi.py
+# Клиент ЕСИА (Госуслуги): OAuth-вход с подтверждением личности пользователя.
+# Один пул соединений httpx на воркер, жесткие таймауты и circuit breaker,
+# чтобы медленный или лежащий ЕСИА не занимал воркеры API. Результат проверки
+# сохраняется в users (gosuslugi_*) и действует GOSUSLUGI_VERIFICATION_TTL_SECONDS.
+# client_secret — откреплённая подпись PKCS#7 сертификатом системы, статический
+# секрет ни в браузер, ни в ЕСИА не передается.
+#
+# Локально и в тестах: python -m app.gosuslugi_mock  и
+# GOSUSLUGI_BASE_URL=http://localhost:9000
+import base64
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from urllib.parse import urlencode
+
+import httpx
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from jose import jwt
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
 
-GOSUSLUGI_API = "https://api.gosuslugi.ru/"
+from .config import settings
+from .database import SessionLocal
+from .models import User
 
-async def verify_user(passport_data: dict):
-    try:
-        response = requests.post(
-            f"{GOSUSLUGI_API}/verify",
-            json=passport_data,
-            headers={"Authorization": f"Bearer {os.getenv('GOSUSLUGI_TOKEN')}"}
+logger = logging.getLogger("sakhshop")
+
+AUTHORIZE_PATH = "/aas/oauth2/v2/ac"
+TOKEN_PATH = "/aas/oauth2/v3/te"
+PERSON_PATH = "/rs/prns/{oid}"
+OID_CLAIM = "urn:esia:sbj_id"
+
+
+class Verification(BaseModel):
+    oid: str
+    verified: bool
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    checked_at: datetime
+
+
+class GosuslugiUnavailable(Exception):
+    """ЕСИА не ответил, ответил ошибкой или breaker разомкнут."""
+
+
+class CircuitBreaker:
+    """После failure_threshold ошибок подряд запросы не отправляются reset_timeout
+    секунд; затем пропускается один пробный запрос (half-open)."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_request(self) -> bool:
+        """Пропускает запрос или бросает GosuslugiUnavailable; True — это пробный запрос."""
+        state = self.state
+        if state == "open" or (state == "half-open" and self.probing):
+            raise GosuslugiUnavailable("Госуслуги временно недоступны")
+        if state == "half-open":
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.error(f"ЕСИА: {self.failures} ошибок подряд, запросы приостановлены на {self.reset_timeout} с")
+            self.opened_at = time.monotonic()
+
+
+class GosuslugiClient:
+    def __init__(self, base_url: str = None):
+        self.base_url = (base_url or settings.GOSUSLUGI_BASE_URL).rstrip("/")
+        self.breaker = CircuitBreaker(
+            settings.GOSUSLUGI_BREAKER_FAILURES, settings.GOSUSLUGI_BREAKER_RESET_SECONDS
         )
-        return response.json().get("verified", False)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail="Ошибка верификации")
\ No newline at end of file
+        self._http: Optional[httpx.AsyncClient] = None
+        self._signer = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(settings.GOSUSLUGI_TIMEOUT_SECONDS, connect=settings.GOSUSLUGI_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            )
+        return self._http
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        probe = self.breaker.before_request()
+        try:
+            response = await self.http.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            raise GosuslugiUnavailable(f"ЕСИА: {type(e).__name__}") from e
+        finally:
+            # Отмененный пробный запрос (клиент ушел) не должен навсегда занять слот
+            if probe:
+                self.breaker.probing = False
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise GosuslugiUnavailable(f"ЕСИА ответил {response.status_code}")
+        # 4xx — ошибка запроса (неверный код и т.п.), а не сбой ЕСИА
+        self.breaker.record_success()
+        if response.status_code >= 400:
+            logger.warning(f"ЕСИА отклонил запрос {path}: {response.status_code} {response.text[:200]}")
+            raise HTTPException(status_code=400, detail="Госуслуги отклонили запрос")
+        return response.json()
+
+    # --- OAuth -------------------------------------------------------------
+
+    @staticmethod
+    def _timestamp() -> str:
+        return datetime.now(timezone.utc).strftime("%Y.%m.%d %H:%M:%S +0000")
+
+    def _load_signer(self):
+        from cryptography import x509
+        from cryptography.hazmat.primitives import serialization
+
+        if not (settings.GOSUSLUGI_CERT_PATH and settings.GOSUSLUGI_KEY_PATH):
+            logger.error("ЕСИА: не заданы GOSUSLUGI_CERT_PATH/GOSUSLUGI_KEY_PATH")
+            raise HTTPException(status_code=503, detail="Вход через Госуслуги не настроен")
+        with open(settings.GOSUSLUGI_CERT_PATH, "rb") as f:
+            certificate = x509.load_pem_x509_certificate(f.read())
+        with open(settings.GOSUSLUGI_KEY_PATH, "rb") as f:
+            key = serialization.load_pem_private_key(f.read(), password=None)
+        return certificate, key
+
+    def client_secret(self, scope: str, timestamp: str, state: str) -> str:
+        """Подпись scope + timestamp + client_id + state (PKCS#7 detached, base64url)."""
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.serialization import pkcs7
+
+        if self._signer is None:
+            self._signer = self._load_signer()
+        certificate, key = self._signer
+        message = f"{scope}{timestamp}{settings.GOSUSLUGI_CLIENT_ID}{state}".encode("utf-8")
+        signature = (
+            pkcs7.PKCS7SignatureBuilder()
+            .set_data(message)
+            .add_signer(certificate, key, hashes.SHA256())
+            .sign(serialization.Encoding.DER, [pkcs7.PKCS7Options.DetachedSignature])
+        )
+        return base64.urlsafe_b64encode(signature).decode("ascii")
+
+    def _signed_params(self, state: str) -> dict:
+        scope, timestamp = settings.GOSUSLUGI_SCOPE, self._timestamp()
+        return {
+            "client_id": settings.GOSUSLUGI_CLIENT_ID,
+            "client_secret": self.client_secret(scope, timestamp, state),
+            "redirect_uri": settings.GOSUSLUGI_REDIRECT_URI,
+            "scope": scope,
+            "state": state,
+            "timestamp": timestamp,
+        }
+
+    def authorization_url(self, state: str) -> str:
+        params = {**self._signed_params(state), "response_type": "code", "access_type": "online"}
+        return f"{self.base_url}{AUTHORIZE_PATH}?{urlencode(params)}"
+
+    async def exchange_code(self, code: str) -> str:
+        data = await self._request("POST", TOKEN_PATH, data={
+            **self._signed_params(str(uuid.uuid4())),
+            "grant_type": "authorization_code",
+            "code": code,
+            "token_type": "Bearer",
+        })
+        access_token = data.get("access_token")
+        if not access_token:
+            raise HTTPException(status_code=400, detail="Госуслуги не выдали токен доступа")
+        return access_token
+
+    async def fetch_person(self, access_token: str) -> Verification:
+        # Токен получен напрямую от ЕСИА по TLS, поэтому oid берем из claims без проверки подписи
+        try:
+            oid = str(jwt.get_unverified_claims(access_token)[OID_CLAIM])
+        except Exception:
+            raise HTTPException(status_code=400, detail="Некорректный токен Госуслуг")
+        person = await self._request(
+            "GET", PERSON_PATH.format(oid=oid), headers={"Authorization": f"Bearer {access_token}"}
+        )
+        return Verification(
+            oid=oid,
+            # Подтвержденная учетная запись ЕСИА: личность проверена
+            verified=bool(person.get("trusted")),
+            first_name=person.get("firstName"),
+            last_name=person.get("lastName"),
+            checked_at=datetime.utcnow(),
+        )
+
+    # --- Результат проверки ------------------------------------------------
+
+    async def verify_user(self, user_id: int, code: str) -> Verification:
+        """Завершает OAuth-вход: обменивает code на токен и проверяет учетную запись."""
+        try:
+            access_token = await self.exchange_code(code)
+            verification = await self.fetch_person(access_token)
+        except GosuslugiUnavailable as e:
+            logger.error(f"Проверка через Госуслуги для пользователя {user_id} не удалась: {e}")
+            raise HTTPException(status_code=503, detail="Госуслуги временно недоступны, попробуйте позже")
+        await run_in_threadpool(save_verification, user_id, verification)
+        return verification
+
+
+def save_verification(user_id: int, verification: Verification) -> None:
+    db = SessionLocal()
+    try:
+        db.query(User).filter(User.id == user_id).update({
+            User.gosuslugi_oid: verification.oid,
+            User.gosuslugi_verified: verification.verified,
+            User.gosuslugi_checked_at: verification.checked_at,
+        })
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.warning(f"Учетная запись ЕСИА {verification.oid} уже привязана к другому пользователю (запрос {user_id})")
+        raise HTTPException(status_code=409, detail="Эта учетная запись Госуслуг уже привязана к другому пользователю")
+    finally:
+        db.close()
+
+
+def is_verified(user: User, now: Optional[datetime] = None) -> bool:
+    """Подтверждение действует GOSUSLUGI_VERIFICATION_TTL_SECONDS с момента проверки."""
+    if not user.gosuslugi_verified or user.gosuslugi_checked_at is None:
+        return False
+    age = (now or datetime.utcnow()) - user.gosuslugi_checked_at
+    return age < timedelta(seconds=settings.GOSUSLUGI_VERIFICATION_TTL_SECONDS)
+
+
+_client: Optional[GosuslugiClient] = None
+
+
+def get_client() -> GosuslugiClient:
+    global _client
+    if _client is None:
+        _client = GosuslugiClient()
+    return _client
+
+
+async def close_client() -> None:
+    if _client is not None:
+        await _client.close()
@@ -0,0 +1,82 @@
+# gosuslugi_mock.py
+# Локальный mock ЕСИА для разработки и тестов клиента gosuslugi.py:
+#   python -m app.gosuslugi_mock [--port 9000] [--delay 0] [--fail-rate 0]
+# и GOSUSLUGI_BASE_URL=http://localhost:9000 для API.
+#
+# Авторизация сразу редиректит обратно с кодом; client_secret (подпись
+# клиента) обязателен, но не проверяется. Код вида "untrusted-..."
+# выдает неподтвержденную учетную запись, "invalid-..." — ошибку 400.
+# --delay и --fail-rate позволяют проверить таймауты и circuit breaker.
+import argparse
+import asyncio
+import random
+import secrets
+from urllib.parse import urlencode
+
+from fastapi import FastAPI, Form, Header, HTTPException
+from fastapi.responses import RedirectResponse
+from jose import jwt
+
+from .gosuslugi import AUTHORIZE_PATH, OID_CLAIM, PERSON_PATH, TOKEN_PATH
+
+MOCK_SIGNING_KEY = "gosuslugi-mock"
+
+app = FastAPI(title="ESIA mock")
+app.state.delay = 0.0
+app.state.fail_rate = 0.0
+app.state.tokens = {}
+
+
+async def _simulate_network():
+    if app.state.delay:
+        await asyncio.sleep(app.state.delay)
+    if random.random() < app.state.fail_rate:
+        raise HTTPException(status_code=503, detail="mock outage")
+
+
+@app.get(AUTHORIZE_PATH)
+async def authorize(redirect_uri: str, state: str, client_secret: str):
+    code = secrets.token_urlsafe(16)
+    return RedirectResponse(f"{redirect_uri}?{urlencode({'code': code, 'state': state})}")
+
+
+@app.post(TOKEN_PATH)
+async def token(code: str = Form(...), grant_type: str = Form(...), client_secret: str = Form(...)):
+    await _simulate_network()
+    if grant_type != "authorization_code" or code.startswith("invalid"):
+        raise HTTPException(status_code=400, detail="invalid_grant")
+    oid = str(random.randint(10 ** 8, 10 ** 9))
+    access_token = jwt.encode({OID_CLAIM: oid}, MOCK_SIGNING_KEY, algorithm="HS256")
+    app.state.tokens[access_token] = {
+        "trusted": not code.startswith("untrusted"),
+        "firstName": "Иван",
+        "lastName": "Иванов",
+    }
+    return {"access_token": access_token, "token_type": "Bearer", "expires_in": 3600}
+
+
+@app.get(PERSON_PATH)
+async def person(oid: str, authorization: str = Header(...)):
+    await _simulate_network()
+    access_token = authorization.removeprefix("Bearer ")
+    person = app.state.tokens.get(access_token)
+    if person is None or jwt.get_unverified_claims(access_token)[OID_CLAIM] != oid:
+        raise HTTPException(status_code=401, detail="invalid_token")
+    return {"oid": oid, **person}
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Mock ЕСИА")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--delay", type=float, default=0.0, help="задержка ответа, с")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="доля ответов 503")
+    args = parser.parse_args()
+    app.state.delay = args.delay
+    app.state.fail_rate = args.fail_rate
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# http_cache.py
+# Условные GET для каталога (ETag / Last-Modified / 304) и сжатие ответов.
+# Валидаторы коллекции — count(*) и max(updated_at) одним агрегатным запросом,
+# поэтому проверка «не изменилось» дешевле, чем выборка и сериализация строк.
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import func
+from starlette.middleware.gzip import GZipMiddleware, IdentityResponder
+from starlette.datastructures import Headers, MutableHeaders
+
+from .config import settings
+
+
+def collection_validators(db, model) -> tuple[int, Optional[datetime]]:
+    count, last_modified = db.query(func.count(model.id), func.max(model.updated_at)).one()
+    return count, last_modified
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _http_date(value: datetime) -> str:
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Слабое сравнение: префикс W/ не учитывается
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def _not_modified_since(header: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def cache_headers(etag: str, last_modified: Optional[datetime]) -> dict[str, str]:
+    headers = {
+        "ETag": etag,
+        "Cache-Control": (
+            f"public, max-age={settings.CATALOG_CACHE_MAX_AGE}, "
+            f"s-maxage={settings.CATALOG_CACHE_SHARED_MAX_AGE}, "
+            f"stale-while-revalidate={settings.CATALOG_CACHE_STALE_WHILE_REVALIDATE}"
+        ),
+    }
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> Optional[Response]:
+    """Возвращает готовый 304, если клиентская копия актуальна (RFC 9110, 13.2.2)."""
+    headers = cache_headers(etag, last_modified)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return None
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None and _not_modified_since(if_modified_since, last_modified):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int):
+        import brotli
+
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        data = self.compressor.process(body)
+        if more_body:
+            # Для потоковых ответов отдаем сжатые данные сразу, не копя весь ответ
+            return data + self.compressor.flush()
+        return data + self.compressor.finish()
+
+
+def _vary_accept_encoding(send):
+    # Vary: Accept-Encoding у любого ответа, включая несжатые и 304: иначе
+    # общий кэш может отдать сжатую копию клиенту без поддержки сжатия
+    async def wrapped(message):
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            vary = [part.strip() for part in headers.get("vary", "").split(",") if part.strip()]
+            headers["Vary"] = ", ".join(dict.fromkeys([*vary, "Accept-Encoding"]))
+        await send(message)
+
+    return wrapped
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """gzip из Starlette плюс brotli, если клиент его принимает и пакет установлен."""
+
+    def __init__(self, app, minimum_size: int = 1000, compresslevel: int = 6, brotli_quality: int = 4):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.brotli_quality = brotli_quality
+        try:
+            import brotli  # noqa: F401
+            self.brotli_available = True
+        except ImportError:
+            self.brotli_available = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            send = _vary_accept_encoding(send)
+        if scope["type"] == "http" and self.brotli_available:
+            accept_encoding = Headers(scope=scope).get("Accept-Encoding", "")
+            if "br" in [part.split(";")[0].strip() for part in accept_encoding.split(",")]:
+                responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+                await responder(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
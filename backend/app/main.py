@@ -1,57 +1,63 @@
 # main.py
-from fastapi import Depends, FastAPI, HTTPException, UploadFile, File, status, Request
+from fastapi import Depends, FastAPI, HTTPException, Query, UploadFile, File, status, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.routing import APIRouter
 from fastapi_limiter import FastAPILimiter
 from fastapi_limiter.depends import RateLimiter
 import redis.asyncio as redis
-from phonenumbers import parse, is_valid_number
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
+from jose import JWTError
+from datetime import date, datetime, timedelta
 from typing import Annotated, Optional
 import os
 import secrets
-import smtplib
-from email.mime.text import MIMEText
-import requests
+from functools import lru_cache
 from pydantic import BaseModel, EmailStr, Field
+from sqlalchemy import text
 from sqlalchemy.orm import Session
-from .models import User, Service, Item, Order 
-from .database import Base, SessionLocal, engine
-from .schemas import UserCreate, UserResponse
-from .utils import get_password_hash, create_access_token, create_refresh_token, send_verification_email
+from .models import User, Service, Item, Order, Report 
+from .rollups import seller_dashboard
+from . import gosuslugi, realtime, reports, token_store
+from .tasks import deliver_password_reset, deliver_sms_code, deliver_verification_email, enqueue
+from .geo_tiles import DEFAULT_TOP, MAX_TOP, MAX_ZOOM, MIN_ZOOM, get_tile
+from .recommendations import get_similarity_index, popular_near
+from .http_cache import CompressionMiddleware, cache_headers, collection_validators, make_etag, not_modified
+from .catalog_io import ImportFileError, detect_format, export_csv, export_parquet, import_items, iter_rows
+from .database import SessionLocal, engine
+from .schemas import ItemImportReport, ReportCreate, ReportResponse, SellerDashboardResponse, UserCreate, UserResponse, VerifySMSRequest
+from .phones import is_valid_phone, normalize_phone
+from .query_shaping import NO_LAZY_LOADS
+from .utils import get_password_hash, verify_password, create_access_token, create_refresh_token, decode_access_token, decode_refresh_token
 from fastapi.staticfiles import StaticFiles
 import shutil
-from yookassa import Configuration, Payment
-from yookassa.domain.request import PaymentRequest
 import uuid
 from redis.asyncio import Redis
 import logging
 from logging.config import dictConfig
 from .config import LogConfig, settings
-from geopy.distance import geodesic
 
 # Настройка логгирования
 dictConfig(LogConfig().dict())
 logger = logging.getLogger("sakhshop")
 
-SECRET_KEY = os.getenv("SECRET_KEY", secrets.token_urlsafe(32))
-REFRESH_SECRET_KEY = os.getenv("REFRESH_SECRET_KEY", secrets.token_urlsafe(32))
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-REFRESH_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 дней
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
+REFRESH_TOKEN_EXPIRE_MINUTES = settings.REFRESH_TOKEN_EXPIRE_MINUTES  # 7 дней
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# ЮKassa подгружается лениво: SDK тяжелый и нужен только при создании платежа
+@lru_cache(maxsize=1)
+def get_yookassa_payment():
+    from yookassa import Configuration, Payment
 
-# Настройка ЮKassa
-Configuration.account_id = os.getenv("YOOKASSA_SHOP_ID")
-Configuration.secret_key = os.getenv("YOOKASSA_SECRET_KEY")
+    Configuration.account_id = os.getenv("YOOKASSA_SHOP_ID")
+    Configuration.secret_key = os.getenv("YOOKASSA_SECRET_KEY")
+    return Payment
 
 app = FastAPI()
 
-Base.metadata.create_all(bind=engine)
+# Схема БД управляется только через Alembic (alembic upgrade head),
+# при импорте приложения к базе не подключаемся
 
 # Настройка CORS
 app.add_middleware(
@@ -60,7 +66,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE)
 
 def get_db():
     db = SessionLocal()
@@ -69,12 +77,57 @@ def get_db():
     finally:
         db.close()
 
-redis_connection = Redis(host="localhost", port=6379, decode_responses=True)
+redis_connection = Redis.from_url(settings.REDIS_URL, decode_responses=True)
 # Настройка rate limiting
 @app.on_event("startup")
 async def startup():
+    settings.check_jwt_keys()
     await FastAPILimiter.init(redis_connection)
 
+@app.on_event("shutdown")
+async def shutdown():
+    await realtime.hub.close()
+    await gosuslugi.close_client()
+
+if settings.EXPOSE_WORKER_PID:
+    @app.middleware("http")
+    async def worker_pid_header(request: Request, call_next):
+        response = await call_next(request)
+        response.headers["X-Worker-Pid"] = str(os.getpid())
+        return response
+
+# Пробы для Kubernetes: liveness не трогает внешние зависимости,
+# readiness проверяет доступность Postgres и Redis
+@app.get("/healthz", tags=["health"])
+async def liveness():
+    return {"status": "ok"}
+
+def _check_database() -> None:
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+@app.get("/readyz", tags=["health"])
+async def readiness():
+    checks = {}
+    try:
+        await run_in_threadpool(_check_database)
+        checks["database"] = "ok"
+    except Exception as e:
+        logger.warning(f"Readiness: база данных недоступна: {e}")
+        checks["database"] = "unavailable"
+    try:
+        await redis_connection.ping()
+        checks["redis"] = "ok"
+    except Exception as e:
+        logger.warning(f"Readiness: Redis недоступен: {e}")
+        checks["redis"] = "unavailable"
+
+    ready = all(value == "ok" for value in checks.values())
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "ready" if ready else "not_ready", "checks": checks},
+    )
+
 # Создание директории для загрузок
 os.makedirs("uploads", exist_ok=True)
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
@@ -85,14 +138,44 @@ users_router = APIRouter(prefix="/api/users", tags=["users"])
 payments_router = APIRouter(prefix="/api/payments", tags=["payments"])
 files_router = APIRouter(prefix="/api/files", tags=["files"])
 mobile_router = APIRouter(prefix="/api/mobile", tags=["mobile"])
-
+sellers_router = APIRouter(prefix="/api/sellers", tags=["sellers"])
+realtime_router = APIRouter(prefix="/api/realtime", tags=["realtime"])
+admin_router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+def _catalog_page(model, request: Request, response: Response, db: Session, limit: Optional[int], offset: int):
+    # Валидаторы считаются по всей коллекции: любое изменение сбрасывает все страницы
+    count, last_modified = collection_validators(db, model)
+    etag = make_etag(model.__tablename__, count, last_modified, limit, offset)
+    cached = not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+
+    response.headers.update(cache_headers(etag, last_modified))
+    query = db.query(model).options(*NO_LAZY_LOADS).order_by(model.id).offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+# Обработчики каталога синхронные: запросы к БД идут в пуле потоков, не в event loop
 @mobile_router.get("/products")
-async def get_products(db: Session = Depends(get_db)):
-    return db.query(Item).all()
+def get_products(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    return _catalog_page(Item, request, response, db, limit, offset)
 
 @mobile_router.get("/services")
-async def get_services(db: Session = Depends(get_db)):
-    return db.query(Service).all()
+def get_services(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    return _catalog_page(Service, request, response, db, limit, offset)
 
 
 # Модели для аутентификации
@@ -131,31 +214,42 @@ class ResetPasswordConfirm(BaseModel):
 
 
 
-def create_access_token(data: dict, expires_delta: timedelta | None = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Не удалось проверить учетные данные",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        inn = decode_access_token(token).get("sub")
+    except JWTError:
+        raise credentials_exception
+    if inn is None:
+        raise credentials_exception
+    user = db.query(User).filter(User.inn == inn).first()
+    if user is None or not user.is_active:
+        raise credentials_exception
+    return user
+
+def get_current_seller(current_user: User = Depends(get_current_user)) -> User:
+    if not current_user.is_seller:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступно только продавцам")
+    return current_user
 
-def create_refresh_token(data: dict, expires_delta: timedelta = timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + expires_delta
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, REFRESH_SECRET_KEY, algorithm=ALGORITHM)
+def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    if not current_user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Доступно только администраторам")
+    return current_user
 
 def verify_phone_number(phone: str) -> bool:
-    try:
-        parsed = parse(phone, "RU")
-        return is_valid_number(parsed)
-    except:
-        return False
+    return is_valid_phone(phone)
 
-# Эндпоинты аутентификации
+# Эндпоинты аутентификации. Обработчики с одноразовыми токенами — обычные def:
+# token_store синхронный (Redis/Postgres), FastAPI выполняет их в пуле потоков
 @app.post("/api/auth/register", response_model=UserResponse)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+def register_user(user: UserCreate, db: Session = Depends(get_db)):
     try:
         if len(user.inn) not in (10, 12):
             raise HTTPException(status_code=400, detail="ИНН должен содержать 10 или 12 цифр")
@@ -165,26 +259,24 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
             raise HTTPException(status_code=400, detail="Email уже зарегистрирован")
 
         hashed_password = get_password_hash(user.password)
-        verification_token = secrets.token_urlsafe(32)
         db_user = User(
             inn=user.inn,
             email=user.email,
             phone=user.phone,
+            phone_e164=normalize_phone(user.phone) if user.phone else None,
             name=user.name,
             hashed_password=hashed_password,
             is_seller=user.is_seller,
-            verification_token=verification_token,
-            verification_token_expires=datetime.utcnow() + timedelta(hours=24)
         )
         db.add(db_user)
+        db.flush()
+
+        # Письмо уходит через очередь задач в той же транзакции, что и пользователь;
+        # токен создает задача, в очереди лежит только id
+        enqueue(db, deliver_verification_email, user_id=db_user.id)
         db.commit()
         db.refresh(db_user)
 
-        # Отправка email (не прерывает регистрацию при ошибке)
-        verification_code = "123456"  # В реальном проекте генерируй случайный код
-        if not send_verification_email(db_user.email, verification_code):
-            print("Предупреждение: Не удалось отправить email верификации")
-
         access_token = create_access_token(
             data={"sub": db_user.inn},
             expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -196,26 +288,94 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Ошибка при регистрации пользователя")
     
 @auth_router.post("/verify-email")
-async def verify_email(request: VerifyEmailRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.verification_token == request.token).first()
+def verify_email(request: VerifyEmailRequest, db: Session = Depends(get_db)):
+    user_id = token_store.get_token_store().consume(token_store.EMAIL_VERIFICATION, request.token)
+    user = db.get(User, int(user_id)) if user_id else None
     if not user:
         raise HTTPException(status_code=400, detail="Неверный или устаревший токен")
-    
-    if user.verification_token_expires < datetime.utcnow():
-        raise HTTPException(status_code=400, detail="Токен истек")
 
     user.email_verified = True
-    user.verification_token = None
-    user.verification_token_expires = None
     db.commit()
     
     return {"message": "Email успешно подтвержден"}
 
+@auth_router.post("/password-reset/request", dependencies=[Depends(RateLimiter(times=5, minutes=15))])
+def request_password_reset(request: PasswordResetRequest, db: Session = Depends(get_db)):
+    user = db.query(User).filter(User.email == request.email).first()
+    if user:
+        enqueue(db, deliver_password_reset, user_id=user.id)
+        db.commit()
+    # Ответ не зависит от наличия email, чтобы нельзя было перебирать адреса
+    return {"message": "Если email зарегистрирован, на него отправлена ссылка для сброса пароля"}
+
+@auth_router.post("/password-reset/confirm")
+def confirm_password_reset(request: ResetPasswordConfirm, db: Session = Depends(get_db)):
+    user_id = token_store.get_token_store().consume(token_store.PASSWORD_RESET, request.token)
+    user = db.get(User, int(user_id)) if user_id else None
+    if not user:
+        raise HTTPException(status_code=400, detail="Неверный или устаревший токен")
+
+    user.hashed_password = get_password_hash(request.new_password)
+    user.refresh_token = None
+    db.commit()
+    return {"message": "Пароль успешно изменен"}
+
+@auth_router.post("/sms/send", dependencies=[Depends(RateLimiter(times=3, minutes=10))])
+def send_sms_code(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    enqueue(db, deliver_sms_code, user_id=current_user.id)
+    db.commit()
+    return {"message": "Код отправлен"}
+
+@auth_router.post("/sms/verify", dependencies=[Depends(RateLimiter(times=5, minutes=10))])
+def verify_sms_code(
+    request: VerifySMSRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if not token_store.get_token_store().consume(token_store.SMS_CODE, str(current_user.id), request.code):
+        raise HTTPException(status_code=400, detail="Неверный или устаревший код")
+
+    current_user.phone_verified = True
+    db.commit()
+    return {"message": "Телефон подтвержден"}
+
+# Подтверждение личности через Госуслуги (OAuth ЕСИА). state связывает
+# редирект с пользователем: в callback браузер приходит без нашего токена
+@auth_router.get("/gosuslugi/login")
+def gosuslugi_login(current_user: User = Depends(get_current_user)):
+    state = secrets.token_urlsafe(32)
+    token_store.get_token_store().issue(
+        token_store.GOSUSLUGI_STATE, state, str(current_user.id), token_store.GOSUSLUGI_STATE_TTL
+    )
+    return {"authorization_url": gosuslugi.get_client().authorization_url(state)}
+
+@auth_router.get("/gosuslugi/callback")
+async def gosuslugi_callback(state: str, code: Optional[str] = None, error: Optional[str] = None):
+    user_id = await run_in_threadpool(token_store.get_token_store().consume, token_store.GOSUSLUGI_STATE, state)
+    if not user_id:
+        raise HTTPException(status_code=400, detail="Неверный или устаревший запрос авторизации")
+    if error or not code:
+        raise HTTPException(status_code=400, detail="Вход через Госуслуги отменен")
+
+    verification = await gosuslugi.get_client().verify_user(int(user_id), code)
+    return {"verified": verification.verified}
+
+@auth_router.get("/gosuslugi/status")
+def gosuslugi_status(current_user: User = Depends(get_current_user)):
+    return {
+        "verified": gosuslugi.is_verified(current_user),
+        "checked_at": current_user.gosuslugi_checked_at,
+    }
+
 async def create_payment(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(Order).filter(Order.id == order_id).first()
+    # Дата заказа здесь неизвестна, поэтому секции orders не отсекаются: запрос
+    # делает по одному index scan ix_orders_id в каждой секции (~27 при хранении
+    # 24 мес.). Там, где дата известна, добавляйте условие по Order.created_at
+    order = db.query(Order).options(*NO_LAZY_LOADS).filter(Order.id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
     
+    Payment = get_yookassa_payment()
     payment = Payment.create({
         "amount": {
             "value": order.amount,
@@ -238,7 +398,7 @@ async def create_payment(order_id: int, db: Session = Depends(get_db)):
 async def login(user: UserLogin, db: Session = Depends(get_db)):
     db_user = db.query(User).filter(User.inn == user.inn).first()
     
-    if not db_user or not pwd_context.verify(user.password, db_user.hashed_password):
+    if not db_user or not verify_password(user.password, db_user.hashed_password):
         logger.warning(f"Неудачная попытка входа для ИНН: {user.inn}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -270,15 +430,46 @@ async def login(user: UserLogin, db: Session = Depends(get_db)):
         "refresh_token": refresh_token
     }
 
+# Тайл карты читается только из Redis (см. geo_tiles.py), без скана каталога
+@mobile_router.get("/tiles/{z}/{x}/{y}")
+def get_map_tile(z: int, x: int, y: int, top: int = Query(DEFAULT_TOP, ge=1, le=MAX_TOP)):
+    if not MIN_ZOOM <= z <= MAX_ZOOM:
+        raise HTTPException(status_code=400, detail=f"Зум должен быть от {MIN_ZOOM} до {MAX_ZOOM}")
+    if not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Неверные координаты тайла")
+    return get_tile(z, x, y, top)
+
+@mobile_router.get("/recommendations/similar/{listing_type}/{listing_id}")
+def get_similar_listings(listing_type: str, listing_id: int, limit: int = Query(10, ge=1, le=50)):
+    if listing_type not in ("item", "service"):
+        raise HTTPException(status_code=400, detail="Тип должен быть item или service")
+    index = get_similarity_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="Индекс рекомендаций еще не построен")
+    similar = index.similar(listing_type, listing_id, limit)
+    if similar is None:
+        raise HTTPException(status_code=404, detail="Объявление не найдено в индексе рекомендаций")
+    return similar
+
+@mobile_router.get("/recommendations/popular")
+def get_popular_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    limit: int = Query(20, ge=1, le=100)
+):
+    return popular_near(lat, lon, limit)
+
 @mobile_router.get("/search/nearby")
-async def search_nearby(
+def search_nearby(
     lat: float, 
     lon: float, 
     radius: int = 10,
     db: Session = Depends(get_db)
 ):
-    products = db.query(Item).all()
-    services = db.query(Service).all()
+    from geopy.distance import geodesic
+
+    products = db.query(Item).options(*NO_LAZY_LOADS).all()
+    services = db.query(Service).options(*NO_LAZY_LOADS).all()
     
     nearby_results = []
     
@@ -299,7 +490,7 @@ async def refresh_token(token: RefreshTokenRequest):
     )
     
     try:
-        payload = jwt.decode(token.refresh_token, REFRESH_SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_refresh_token(token.refresh_token)
         inn: str = payload.get("sub")
         if inn is None:
             raise credentials_exception
@@ -324,9 +515,158 @@ async def refresh_token(token: RefreshTokenRequest):
     except JWTError:
         raise credentials_exception
 
+@sellers_router.get("/me/dashboard", response_model=SellerDashboardResponse)
+async def get_seller_dashboard(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    current_user: User = Depends(get_current_seller),
+    db: Session = Depends(get_db)
+):
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or date_to - timedelta(days=29)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="Неверный период")
+    return seller_dashboard(db, current_user.id, date_from, date_to)
+
+# Синхронные обработчики: разбор файла и вставка идут в пуле потоков,
+# не блокируя event loop
+@sellers_router.post("/me/items/import", response_model=ItemImportReport)
+def import_seller_items(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_seller),
+    db: Session = Depends(get_db)
+):
+    try:
+        file_format = detect_format(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        report = import_items(db, current_user.id, iter_rows(file.file, file_format))
+    except ImportFileError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"{e}; импортировано строк до ошибки: {e.imported}")
+    logger.info(f"Импорт каталога продавца {current_user.id}: {report.imported} добавлено, {report.failed} с ошибками")
+    return report
+
+@sellers_router.get("/me/items/export")
+def export_seller_items(format: str = "csv", current_user: User = Depends(get_current_seller)):
+    if format == "parquet":
+        return StreamingResponse(
+            export_parquet(current_user.id),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": 'attachment; filename="catalog.parquet"'},
+        )
+    if format != "csv":
+        raise HTTPException(status_code=400, detail="Поддерживаются форматы csv и parquet")
+    return StreamingResponse(
+        export_csv(current_user.id),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="catalog.csv"'},
+    )
+
+def _service_ids(value: str) -> list[int]:
+    try:
+        service_ids = realtime.parse_service_ids(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not service_ids:
+        return service_ids
+    db = SessionLocal()
+    try:
+        found = {service_id for (service_id,) in db.query(Service.id).filter(Service.id.in_(service_ids))}
+    finally:
+        db.close()
+    missing = [service_id for service_id in service_ids if service_id not in found]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Услуги не найдены: {missing}")
+    return service_ids
+
+def _user_id_from_token(token: str) -> Optional[int]:
+    try:
+        inn = decode_access_token(token).get("sub")
+    except JWTError:
+        return None
+    # Короткая сессия: простаивающие соединения не должны держать подключение к БД
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.inn == inn).first()
+        return user.id if user and user.is_active else None
+    finally:
+        db.close()
+
+# Браузер не передает заголовки при открытии WebSocket, поэтому токен — в query
+@realtime_router.websocket("/ws")
+async def realtime_websocket(websocket: WebSocket, token: str, services: str = ""):
+    user_id = await run_in_threadpool(_user_id_from_token, token)
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    try:
+        channels = realtime.channels_for(user_id, await run_in_threadpool(_service_ids, services))
+    except HTTPException:
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+        return
+
+    await websocket.accept()
+    subscriber = realtime.Subscriber()
+    await realtime.hub.subscribe(subscriber, channels)
+    try:
+        await realtime.serve_websocket(websocket, subscriber)
+    finally:
+        realtime.hub.unsubscribe(subscriber, channels)
+
+@realtime_router.get("/events")
+async def realtime_events(services: str = "", current_user: User = Depends(get_current_user)):
+    channels = realtime.channels_for(current_user.id, await run_in_threadpool(_service_ids, services))
+    subscriber = realtime.Subscriber()
+    await realtime.hub.subscribe(subscriber, channels)
+    return StreamingResponse(
+        realtime.sse_events(subscriber, channels),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Отчеты строятся воркером (очередь "reports") на реплике; ссылка на файл
+# появляется в ответе, когда статус становится done
+def _report_response(report: Report) -> ReportResponse:
+    response = ReportResponse.model_validate(report)
+    response.download_url = reports.download_url(report)
+    return response
+
+@admin_router.post("/reports", response_model=ReportResponse, status_code=status.HTTP_202_ACCEPTED)
+def create_report(
+    request: ReportCreate,
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    if request.date_from > request.date_to:
+        raise HTTPException(status_code=400, detail="Неверный период")
+    params = {"date_from": request.date_from.isoformat(), "date_to": request.date_to.isoformat()}
+    report = reports.submit(db, current_user.id, request.kind, request.format, params)
+    return _report_response(report)
+
+@admin_router.get("/reports", response_model=list[ReportResponse])
+def list_reports(
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    rows = db.query(Report).options(*NO_LAZY_LOADS).order_by(Report.id.desc()).limit(limit).all()
+    return [_report_response(report) for report in rows]
+
+@admin_router.get("/reports/{report_id}", response_model=ReportResponse)
+def get_report(report_id: int, current_user: User = Depends(get_current_admin), db: Session = Depends(get_db)):
+    report = db.get(Report, report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Отчет не найден")
+    return _report_response(report)
+
 # Подключение роутеров
 app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(payments_router)
 app.include_router(files_router)
-app.include_router(mobile_router)
\ No newline at end of file
+app.include_router(mobile_router)
+app.include_router(sellers_router)
+app.include_router(realtime_router)
+app.include_router(admin_router)
\ No newline at end of file
@@ -1,6 +1,6 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, BigInteger, Integer, String, Boolean, Date, DateTime, ForeignKey, Float, Enum, Index, Text
+from sqlalchemy.orm import column_property, relationship
 from sqlalchemy.dialects.postgresql import JSON 
 from .database import Base
 import enum
@@ -20,6 +20,17 @@ class TransactionStatus(str, enum.Enum):
     DISPUTED = "disputed"
     REFUNDED = "refunded"
 
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DEAD = "dead"
+
+class ReportStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
 class UserRole(str, enum.Enum):
     BUYER = "buyer"
     SELLER = "seller"
@@ -32,6 +43,7 @@ class User(Base):
     inn = Column(String(12), unique=True, nullable=False)
     email = Column(String(255), unique=True, nullable=False)
     phone = Column(String(20), nullable=False)
+    phone_e164 = Column(String(16), nullable=True, index=True)  # Нормализованный номер для поиска
     name = Column(String(100), nullable=False)
     hashed_password = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True)
@@ -46,6 +58,10 @@ class User(Base):
     failed_login_attempts = Column(Integer, default=0)
     last_failed_login = Column(DateTime, nullable=True)
     refresh_token = Column(String(512), nullable=True)
+    # Подтверждение личности через Госуслуги (gosuslugi.py)
+    gosuslugi_oid = Column(String(32), nullable=True, unique=True, index=True)
+    gosuslugi_verified = Column(Boolean, default=False)
+    gosuslugi_checked_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -60,11 +76,20 @@ class PasswordResetToken(Base):
     id = Column(Integer, primary_key=True, index=True)
     token = Column(String(255), unique=True, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    expires_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
     is_used = Column(Boolean, default=False)
     
     user = relationship("User", back_populates="password_reset_tokens")
 
+# Запасное хранилище одноразовых токенов, когда Redis недоступен (token_store.py)
+class OneTimeToken(Base):
+    __tablename__ = "one_time_tokens"
+
+    kind = Column(String(32), primary_key=True)
+    key = Column(String(64), primary_key=True)  # sha256 от токена/ключа
+    value = Column(String(255), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
 class Item(Base):
     __tablename__ = "items"
     
@@ -124,36 +149,132 @@ class TimeSlot(Base):
     
     service = relationship("Service", back_populates="available_slots")
 
+# orders и transactions секционированы по месяцам (RANGE по created_at, см.
+# partitions.py), поэтому created_at входит в первичный ключ. Идентичность
+# объекта в ORM — по-прежнему только id. Поиск только по id проверяет индекс
+# каждой секции; ссылочную целостность transactions.order_id держат триггеры
+# (миграция e2a7c9d4b618)
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_buyer_id_created_at", "buyer_id", "created_at"),
+        Index("ix_orders_seller_id_created_at", "seller_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     buyer_id = Column(Integer, ForeignKey("users.id"))
     seller_id = Column(Integer, ForeignKey("users.id"))
     item_id = Column(Integer, ForeignKey("items.id"), nullable=True)
     service_id = Column(Integer, ForeignKey("services.id"), nullable=True)
-    status = Column(Enum(OrderStatus), default=OrderStatus.PENDING)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # active_history: старый статус загружается и у expired-объекта — он нужен
+    # роллапам (rollups.py) для дельты перехода
+    status = column_property(Column(Enum(OrderStatus), default=OrderStatus.PENDING), active_history=True)
+    created_at = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     buyer = relationship("User", back_populates="orders", foreign_keys=[buyer_id])
     seller = relationship("User", foreign_keys=[seller_id])
     item = relationship("Item")
     service = relationship("Service")
-    transaction = relationship("Transaction", uselist=False, back_populates="order")
+    transaction = relationship(
+        "Transaction", uselist=False, back_populates="order",
+        primaryjoin="Order.id == foreign(Transaction.order_id)",
+    )
+
+    __mapper_args__ = {"primary_key": [id]}
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_order_id", "order_id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    # Без внешнего ключа: секционированный orders уникален только по (id, created_at);
+    # существование заказа проверяет триггер transactions_check_order
+    order_id = Column(Integer)
     amount = Column(Float, nullable=False)
     platform_fee = Column(Float, default=0.05)  # 5% комиссии
-    status = Column(Enum(TransactionStatus), default=TransactionStatus.PENDING)
+    status = column_property(Column(Enum(TransactionStatus), default=TransactionStatus.PENDING), active_history=True)
     payment_id = Column(String(100))  # ID платежа в ЮKassa
     payment_method = Column(String(50), nullable=True)
     payment_metadata = Column(String(500), nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    order = relationship("Order", back_populates="transaction")
\ No newline at end of file
+    order = relationship(
+        "Order", back_populates="transaction",
+        primaryjoin="foreign(Transaction.order_id) == Order.id",
+    )
+
+    __mapper_args__ = {"primary_key": [id]}
+
+# Роллапы для дашборда продавца: обновляются инкрементально при изменении
+# заказов/транзакций (см. rollups.py) и сверяются ночным заданием
+class SellerDailyStats(Base):
+    __tablename__ = "seller_daily_stats"
+
+    seller_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    orders_pending = Column(Integer, nullable=False, default=0)
+    orders_confirmed = Column(Integer, nullable=False, default=0)
+    orders_delivered = Column(Integer, nullable=False, default=0)
+    orders_disputed = Column(Integer, nullable=False, default=0)
+    orders_cancelled = Column(Integer, nullable=False, default=0)
+    completed_transactions = Column(Integer, nullable=False, default=0)
+    gross_revenue = Column(Float, nullable=False, default=0)
+    platform_fees = Column(Float, nullable=False, default=0)
+
+class SellerProductDailySales(Base):
+    __tablename__ = "seller_product_daily_sales"
+
+    seller_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    product_type = Column(String(10), primary_key=True)  # "item" или "service"
+    product_id = Column(Integer, primary_key=True)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+
+# Очередь фоновых задач (tasks.py); успешно выполненные задачи удаляются
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(BigInteger, primary_key=True)
+    queue = Column(String(50), nullable=False)
+    task = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = Column(DateTime, nullable=True)
+    locked_by = Column(String(100), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_jobs_queue_run_at", "queue", "run_at", postgresql_where=(status == JobStatus.QUEUED)),
+        Index("ix_jobs_status_locked_at", "status", "locked_at"),
+    )
+
+# Отчеты администраторов (reports.py): строятся воркером на реплике,
+# файл лежит в Object Storage по object_key
+class Report(Base):
+    __tablename__ = "reports"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    format = Column(String(10), nullable=False)
+    params = Column(JSON, nullable=False)
+    status = Column(Enum(ReportStatus), nullable=False, default=ReportStatus.PENDING)
+    requested_by = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    object_key = Column(String(500), nullable=True)
+    row_count = Column(Integer, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
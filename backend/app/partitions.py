@@ -0,0 +1,227 @@
+# partitions.py
+# Помесячные секции orders и transactions (PARTITION BY RANGE (created_at)).
+# Секции создаются заранее на PARTITION_MONTHS_AHEAD месяцев вперед; строки вне
+# созданных диапазонов попадают в секцию <table>_default и переносятся в новую
+# секцию, когда для их месяца она создается. Секции старше
+# срока хранения отсоединяются, выгружаются в Object Storage (csv.gz) и удаляются:
+#   python -m app.partitions maintain [--months-ahead 3] [--retention-months 24]
+#   python -m app.partitions archive --dry-run
+import argparse
+import gzip
+import logging
+import re
+import tempfile
+from datetime import date, datetime
+from typing import Iterator
+
+from sqlalchemy import text
+
+from .config import settings
+from .database import engine
+from .utils import get_s3_client
+
+logger = logging.getLogger("sakhshop")
+
+PARTITIONED_TABLES = ("orders", "transactions")
+PARTITION_MONTHS_AHEAD = 3
+RETENTION_MONTHS = 24
+ARCHIVE_PREFIX = "archive"
+LOCK_TIMEOUT = "5s"  # DETACH ждет блокировку родителя не дольше, чем это
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def iter_months(start: date, end: date) -> Iterator[date]:
+    """Первые числа месяцев в [start, end)."""
+    month = month_start(start)
+    while month < end:
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def _parse_partition(table: str, name: str):
+    match = re.fullmatch(rf"{table}_p(\d{{4}})_(\d{{2}})", name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+def create_partition(connection, table: str, month: date) -> None:
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    ))
+
+
+def _default_has_rows(connection, table: str, month: date) -> bool:
+    return connection.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE created_at >= :start AND created_at < :end)"),
+        {"start": month, "end": add_months(month, 1)},
+    ).scalar()
+
+
+def create_partition_from_default(connection, table: str, month: date) -> int:
+    """Создает секцию month, перенося в нее строки этого месяца из <table>_default.
+
+    Пока в DEFAULT-секции есть строки диапазона, CREATE ... PARTITION OF падает,
+    поэтому DEFAULT отсоединяется, строки переносятся и она подключается обратно.
+    Все шаги — в транзакции connection; возвращает число перенесенных строк.
+    """
+    default, name = f"{table}_default", partition_name(table, month)
+    connection.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+    connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    create_partition(connection, table, month)
+    moved = connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {default} WHERE created_at >= :start AND created_at < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"start": month, "end": add_months(month, 1)},
+    ).rowcount
+    connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+    return moved
+
+
+def ensure_partitions(months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """Создает недостающие секции от текущего месяца на months_ahead вперед."""
+    current = month_start(datetime.utcnow().date())
+    months = list(iter_months(current, add_months(current, months_ahead + 1)))
+    created = 0
+    for table in PARTITIONED_TABLES:
+        with engine.begin() as connection:
+            existing = set(_partitions(connection, table))
+            for month in months:
+                if month in existing:
+                    continue
+                if _default_has_rows(connection, table, month):
+                    moved = create_partition_from_default(connection, table, month)
+                    logger.info(f"Создана секция {partition_name(table, month)}, из {table}_default перенесено {moved} строк")
+                else:
+                    create_partition(connection, table, month)
+                    logger.info(f"Создана секция {partition_name(table, month)}")
+                created += 1
+            default_rows = connection.execute(text(f"SELECT count(*) FROM {table}_default")).scalar()
+            if default_rows:
+                logger.warning(f"В {table}_default {default_rows} строк вне помесячных секций")
+    return created
+
+
+def _partitions(connection, table: str) -> dict[date, bool]:
+    """Все помесячные таблицы table: месяц -> подключена ли к родителю.
+
+    Отсоединенные, но еще не выгруженные секции тоже попадают в список.
+    """
+    rows = connection.execute(
+        text(
+            "SELECT relname, relispartition FROM pg_class "
+            "WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace AND relname LIKE :pattern"
+        ),
+        {"pattern": f"{table}\\_p%"},
+    )
+    partitions = {}
+    for name, attached in rows:
+        month = _parse_partition(table, name)
+        if month is not None:
+            partitions[month] = attached
+    return partitions
+
+
+def _export(table_name: str, key: str) -> int:
+    """COPY секции в gzip-файл и загрузка в Object Storage; возвращает размер."""
+    with tempfile.TemporaryFile() as buffer:
+        with gzip.GzipFile(fileobj=buffer, mode="wb") as compressed:
+            raw = engine.raw_connection()
+            try:
+                with raw.cursor() as cursor:
+                    cursor.copy_expert(f"COPY {table_name} TO STDOUT WITH (FORMAT csv, HEADER)", compressed)
+            finally:
+                raw.close()
+        size = buffer.tell()
+        buffer.seek(0)
+        get_s3_client().upload_fileobj(buffer, settings.YANDEX_S3_BUCKET, key)
+    return size
+
+
+def archive(retention_months: int = RETENTION_MONTHS, dry_run: bool = False) -> list[str]:
+    """Отсоединяет, выгружает и удаляет секции целиком старше retention_months.
+
+    Порядок шагов делает задачу повторяемой: если выгрузка упала, секция
+    остается отсоединенной и будет выгружена при следующем запуске.
+    """
+    cutoff = add_months(month_start(datetime.utcnow().date()), -retention_months)
+    archived = []
+    for table in PARTITIONED_TABLES:
+        with engine.connect() as connection:
+            candidates = sorted(
+                (month, attached) for month, attached in _partitions(connection, table).items()
+                if add_months(month, 1) <= cutoff
+            )
+        for month, attached in candidates:
+            name = partition_name(table, month)
+            key = f"{ARCHIVE_PREFIX}/{table}/{month:%Y}/{name}.csv.gz"
+            if dry_run:
+                logger.info(f"[dry-run] {name} -> s3://{settings.YANDEX_S3_BUCKET}/{key}")
+                archived.append(name)
+                continue
+            if attached:
+                with engine.begin() as connection:
+                    connection.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                    connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            size = _export(name, key)
+            with engine.begin() as connection:
+                connection.execute(text(f"DROP TABLE {name}"))
+            logger.info(f"Секция {name} выгружена в s3://{settings.YANDEX_S3_BUCKET}/{key} ({size} байт) и удалена")
+            archived.append(name)
+    return archived
+
+
+def restore_hint(table: str, month: date) -> str:
+    name = partition_name(table, month)
+    return (
+        f"CREATE TABLE {name} (LIKE {table}); "
+        f"\\copy {name} FROM PROGRAM 'gzip -dc {name}.csv.gz' WITH (FORMAT csv, HEADER); "
+        f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}');"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Секции orders/transactions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("create", "maintain"):
+        sub = subparsers.add_parser(command)
+        sub.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+        if command == "maintain":
+            sub.add_argument("--retention-months", type=int, default=RETENTION_MONTHS)
+    archive_parser = subparsers.add_parser("archive")
+    archive_parser.add_argument("--retention-months", type=int, default=RETENTION_MONTHS)
+    archive_parser.add_argument("--dry-run", action="store_true")
+    restore_parser = subparsers.add_parser("restore-hint", help="SQL для возврата секции из архива")
+    restore_parser.add_argument("table", choices=PARTITIONED_TABLES)
+    restore_parser.add_argument("month", help="YYYY-MM")
+    args = parser.parse_args()
+
+    from logging.config import dictConfig
+    from .config import LogConfig
+
+    dictConfig(LogConfig().dict())
+    if args.command in ("create", "maintain"):
+        print(f"Создано секций: {ensure_partitions(args.months_ahead)}")
+    if args.command == "maintain":
+        print(f"Архивировано: {archive(args.retention_months)}")
+    elif args.command == "archive":
+        print(f"Архивировано: {archive(args.retention_months, dry_run=args.dry_run)}")
+    elif args.command == "restore-hint":
+        print(restore_hint(args.table, datetime.strptime(args.month, "%Y-%m").date()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# phones.py
+# Нормализация телефонов в E.164 с кэшем разбора и пакетный бэкфилл:
+#   python -m app.phones backfill [--chunk-size 1000] [--processes 4]
+import argparse
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import bindparam, update
+
+logger = logging.getLogger("sakhshop")
+
+DEFAULT_REGION = "RU"
+PHONE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=PHONE_CACHE_SIZE)
+def normalize_phone(phone: str, region: str = DEFAULT_REGION) -> Optional[str]:
+    """Возвращает номер в формате E.164 или None, если номер невалиден."""
+    import phonenumbers
+
+    try:
+        parsed = phonenumbers.parse(phone, region)
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(parsed):
+        return None
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+
+def is_valid_phone(phone: str, region: str = DEFAULT_REGION) -> bool:
+    return normalize_phone(phone, region) is not None
+
+
+def normalize_batch(rows: list[tuple[int, str]]) -> list[tuple[int, Optional[str]]]:
+    """Нормализует пачку (id, phone); выполняется в дочернем процессе."""
+    return [(user_id, normalize_phone(phone) if phone else None) for user_id, phone in rows]
+
+
+def _iter_chunks(db, chunk_size: int):
+    from .models import User
+
+    last_id = 0
+    while True:
+        rows = (
+            db.query(User.id, User.phone)
+            .filter(User.id > last_id, User.phone_e164.is_(None))
+            .order_by(User.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield [(row.id, row.phone) for row in rows]
+
+
+def backfill(chunk_size: int = 1000, processes: Optional[int] = None) -> tuple[int, int]:
+    """Заполняет users.phone_e164 для всех пользователей, где оно пусто.
+
+    Чтение идет по ключу id пачками, разбор номеров — в пуле процессов,
+    запись — одним executemany UPDATE на пачку. Возвращает (обработано, невалидных).
+    """
+    from .database import SessionLocal
+
+    processes = processes or os.cpu_count() or 1
+    max_pending = processes * 2
+    processed = invalid = 0
+    db = SessionLocal()
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            # Держим в работе ограниченное число пачек, чтобы не читать
+            # всю таблицу в память раньше, чем успеваем ее записать
+            pending = deque()
+            for chunk in _iter_chunks(db, chunk_size):
+                pending.append(pool.submit(normalize_batch, chunk))
+                if len(pending) >= max_pending:
+                    stored = _store_batch(db, pending.popleft().result())
+                    processed, invalid = _log_progress(processed, invalid, *stored)
+            while pending:
+                stored = _store_batch(db, pending.popleft().result())
+                processed, invalid = _log_progress(processed, invalid, *stored)
+    finally:
+        db.close()
+    return processed, invalid
+
+
+def _store_batch(db, results: list[tuple[int, Optional[str]]]) -> tuple[int, int]:
+    from .models import User
+
+    users = User.__table__
+    params = [{"user_id": user_id, "e164": e164} for user_id, e164 in results if e164]
+    if params:
+        db.execute(
+            update(users)
+            .where(users.c.id == bindparam("user_id"))
+            .values(phone_e164=bindparam("e164")),
+            params,
+        )
+        db.commit()
+    return len(results), len(results) - len(params)
+
+
+def _log_progress(processed: int, invalid: int, batch_size: int, batch_invalid: int) -> tuple[int, int]:
+    processed += batch_size
+    invalid += batch_invalid
+    logger.info(f"Бэкфилл телефонов: обработано {processed}, невалидных {invalid}")
+    return processed, invalid
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нормализация телефонов пользователей")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Заполнить users.phone_e164")
+    backfill_parser.add_argument("--chunk-size", type=int, default=1000)
+    backfill_parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        processed, invalid = backfill(args.chunk_size, args.processes)
+        print(f"Обработано: {processed}, невалидных номеров: {invalid}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# query_shaping.py
+# Запрет ленивых загрузок на горячих эндпоинтах и бюджет SQL-запросов.
+# Ответы каталога, оплаты и списка отчетов строятся только из колонок своей
+# модели, поэтому любое обращение к ленивой связи бросает исключение вместо
+# тихого N+1:
+#   db.query(Item).options(*NO_LAZY_LOADS)
+# Понадобится связь — загружайте ее явно: options(selectinload(...), *NO_LAZY_LOADS).
+#
+# Бюджеты запросов эндпоинтов проверяются в tests/test_query_budgets.py
+# через assert_max_queries (фикстура api_queries).
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.orm import raiseload
+
+from .database import engine
+
+NO_LAZY_LOADS = (raiseload("*"),)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def count_queries(bind=engine) -> Iterator[list[str]]:
+    """Собирает SQL, выполненный через bind внутри блока."""
+    statements: list[str] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(bind, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        event.remove(bind, "before_cursor_execute", _record)
+
+
+@contextmanager
+def assert_max_queries(limit: int, bind=engine, label: str = "") -> Iterator[list[str]]:
+    """Фикстура для тестов: падает, если в блоке выполнено больше limit запросов.
+
+        with assert_max_queries(2, label="GET /api/mobile/products"):
+            client.get("/api/mobile/products?limit=50")
+    """
+    with count_queries(bind) as statements:
+        yield statements
+    if len(statements) > limit:
+        listing = "\n".join(f"  {i}. {statement.strip()[:200]}" for i, statement in enumerate(statements, 1))
+        raise QueryBudgetExceeded(f"{label or 'Блок'}: {len(statements)} запросов при бюджете {limit}\n{listing}")
+
@@ -0,0 +1,305 @@
+# realtime.py
+# Push-уведомления о слотах (TimeSlot.is_booked) и статусах заказов (Order.status).
+# Изменения собираются в after_flush и публикуются в Redis pub/sub после
+# коммита. Каждый воркер держит одно pub/sub-соединение (Hub) и раздает
+# события локальным подписчикам; у подписчика ограниченный буфер, в котором
+# события по одной сущности схлопываются до последнего состояния.
+# Публикация идет из фонового потока (Publisher): after_commit не ждет Redis.
+import asyncio
+import json
+import logging
+import queue
+import threading
+from collections import defaultdict
+from typing import AsyncIterator, Iterable
+
+from sqlalchemy import event, inspect
+
+from .config import settings
+from .models import Order, TimeSlot
+from .utils import get_redis
+
+logger = logging.getLogger("sakhshop")
+
+CHANNEL_PREFIX = "rt"
+HEARTBEAT_SECONDS = 25
+COALESCE_WINDOW_SECONDS = 0.1
+MAX_PENDING_EVENTS = 1000
+MAX_SERVICE_SUBSCRIPTIONS = 50  # каналов слотов на одно соединение
+PUBLISH_QUEUE_SIZE = 10000
+
+
+def service_slots_channel(service_id: int) -> str:
+    return f"{CHANNEL_PREFIX}:service:{service_id}:slots"
+
+
+def user_orders_channel(user_id: int) -> str:
+    return f"{CHANNEL_PREFIX}:user:{user_id}:orders"
+
+
+def parse_service_ids(value: str) -> list[int]:
+    """id услуг из query-параметра: положительные, без повторов, не больше MAX_SERVICE_SUBSCRIPTIONS."""
+    try:
+        service_ids = list(dict.fromkeys(int(part) for part in value.split(",") if part))
+    except ValueError:
+        raise ValueError("Ожидается список id через запятую")
+    if any(service_id <= 0 for service_id in service_ids):
+        raise ValueError("id услуг должны быть положительными")
+    if len(service_ids) > MAX_SERVICE_SUBSCRIPTIONS:
+        raise ValueError(f"Не больше {MAX_SERVICE_SUBSCRIPTIONS} услуг на соединение")
+    return service_ids
+
+
+def channels_for(user_id: int, service_ids: Iterable[int] = ()) -> list[str]:
+    return [user_orders_channel(user_id), *(service_slots_channel(service_id) for service_id in service_ids)]
+
+
+# --- Публикация -------------------------------------------------------------
+
+def _value(status):
+    return getattr(status, "value", status)
+
+
+def _changed(obj, attr: str) -> bool:
+    return inspect(obj).attrs[attr].history.has_changes()
+
+
+def _collect_events(session, flush_context):
+    events = session.info.setdefault("realtime_events", [])
+    for obj in [*session.new, *session.dirty]:
+        if isinstance(obj, TimeSlot) and obj.service_id is not None and (obj in session.new or _changed(obj, "is_booked")):
+            events.append((service_slots_channel(obj.service_id), {
+                "type": "slot", "id": obj.id, "service_id": obj.service_id, "is_booked": bool(obj.is_booked),
+            }))
+        elif isinstance(obj, Order) and (obj in session.new or _changed(obj, "status")):
+            payload = {"type": "order", "id": obj.id, "status": _value(obj.status)}
+            for user_id in {obj.buyer_id, obj.seller_id} - {None}:
+                events.append((user_orders_channel(user_id), payload))
+
+
+def _publish_events(session):
+    events = session.info.pop("realtime_events", None)
+    if events:
+        publisher.submit(events)
+
+
+def _discard_events(session):
+    session.info.pop("realtime_events", None)
+
+
+def install_listeners(session_factory) -> None:
+    event.listen(session_factory, "after_flush", _collect_events)
+    event.listen(session_factory, "after_commit", _publish_events)
+    event.listen(session_factory, "after_rollback", _discard_events)
+
+
+def publish(events: list[tuple[str, dict]]) -> None:
+    from redis.exceptions import RedisError
+
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for channel, payload in events:
+            pipe.publish(channel, json.dumps(payload))
+        pipe.execute()
+    except RedisError as e:
+        # Push — лучшее усилие: клиенты догонят состояние при переподключении
+        logger.warning(f"Не удалось опубликовать {len(events)} событий: {e}")
+
+
+class Publisher:
+    """Очередь публикации с одним фоновым потоком на процесс.
+
+    Поток стартует лениво, поэтому переживает fork воркеров gunicorn; при
+    переполнении очереди события отбрасываются — push остается лучшим усилием.
+    """
+
+    def __init__(self, max_size: int = PUBLISH_QUEUE_SIZE):
+        self.queue: queue.Queue = queue.Queue(max_size)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, events: list[tuple[str, dict]]) -> None:
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="realtime-publisher", daemon=True)
+                self.thread.start()
+        try:
+            self.queue.put_nowait(events)
+        except queue.Full:
+            logger.warning(f"Очередь публикации переполнена, {len(events)} событий отброшено")
+
+    def join(self) -> None:
+        self.queue.join()
+
+    def _run(self) -> None:
+        while True:
+            events = self.queue.get()
+            try:
+                publish(events)
+            except Exception as e:
+                logger.error(f"Ошибка публикации событий: {e}")
+            finally:
+                self.queue.task_done()
+
+
+publisher = Publisher()
+
+
+# --- Подписка ---------------------------------------------------------------
+
+class SlowConsumer(Exception):
+    pass
+
+
+class Subscriber:
+    """Буфер одного соединения; события схлопываются по (type, id)."""
+
+    def __init__(self, max_pending: int = MAX_PENDING_EVENTS):
+        self.max_pending = max_pending
+        self.pending: dict[tuple, dict] = {}
+        self.overflowed = False
+        self.closed = False
+        self._wakeup = asyncio.Event()
+
+    def push(self, payload: dict) -> None:
+        key = (payload["type"], payload["id"])
+        if key not in self.pending and len(self.pending) >= self.max_pending:
+            self.overflowed = True
+        else:
+            self.pending[key] = payload
+        self._wakeup.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._wakeup.set()
+
+    async def batches(self, heartbeat: float = HEARTBEAT_SECONDS) -> AsyncIterator[list[dict]]:
+        """Отдает пачки событий; пустая пачка означает heartbeat."""
+        while not self.closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield []
+                continue
+            # Небольшое окно, чтобы всплеск обновлений ушел одной пачкой
+            await asyncio.sleep(COALESCE_WINDOW_SECONDS)
+            self._wakeup.clear()
+            if self.closed:
+                return
+            if self.overflowed:
+                raise SlowConsumer()
+            batch, self.pending = list(self.pending.values()), {}
+            if batch:
+                yield batch
+
+
+class Hub:
+    """Одно pub/sub-соединение на воркер с подсчетом подписчиков на канал."""
+
+    def __init__(self):
+        self.channels: dict[str, set[Subscriber]] = defaultdict(set)
+        self.lock = asyncio.Lock()
+        self.client = None
+        self.pubsub = None
+        self.reader = None
+        self._tasks = set()
+
+    async def subscribe(self, subscriber: Subscriber, channels: list[str]) -> None:
+        async with self.lock:
+            if self.pubsub is None:
+                from redis.asyncio import Redis
+
+                self.client = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+                self.pubsub = self.client.pubsub()
+            new_channels = [channel for channel in channels if not self.channels.get(channel)]
+            for channel in channels:
+                self.channels[channel].add(subscriber)
+            if new_channels:
+                await self.pubsub.subscribe(*new_channels)
+            if self.reader is None:
+                self.reader = asyncio.create_task(self._read())
+
+    def unsubscribe(self, subscriber: Subscriber, channels: list[str]) -> None:
+        subscriber.close()
+        emptied = []
+        for channel in channels:
+            subscribers = self.channels.get(channel)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.channels[channel]
+                emptied.append(channel)
+        if emptied:
+            task = asyncio.get_running_loop().create_task(self._drop(emptied))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _drop(self, channels: list[str]) -> None:
+        async with self.lock:
+            idle = [channel for channel in channels if channel not in self.channels]
+            if idle and self.pubsub is not None:
+                await self.pubsub.unsubscribe(*idle)
+
+    async def _read(self) -> None:
+        while True:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Ошибка чтения Redis pub/sub: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None:
+                continue
+            payload = json.loads(message["data"])
+            for subscriber in list(self.channels.get(message["channel"], ())):
+                subscriber.push(payload)
+
+    async def close(self) -> None:
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        if self.pubsub is not None:
+            await self.pubsub.aclose()
+            await self.client.aclose()
+            self.pubsub = self.client = None
+        for subscribers in self.channels.values():
+            for subscriber in subscribers:
+                subscriber.close()
+        self.channels.clear()
+
+
+hub = Hub()
+
+
+async def serve_websocket(websocket, subscriber: Subscriber) -> None:
+    async def watch_disconnect():
+        try:
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            subscriber.close()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        async for batch in subscriber.batches():
+            await websocket.send_json({"events": batch} if batch else {"type": "ping"})
+    except SlowConsumer:
+        await websocket.close(code=1013)
+    finally:
+        watcher.cancel()
+
+
+async def sse_events(subscriber: Subscriber, channels: list[str]) -> AsyncIterator[str]:
+    try:
+        async for batch in subscriber.batches():
+            if batch:
+                yield f"event: update\ndata: {json.dumps(batch)}\n\n"
+            else:
+                yield ": ping\n\n"
+    except SlowConsumer:
+        yield "event: overflow\ndata: {}\n\n"
+    finally:
+        hub.unsubscribe(subscriber, channels)
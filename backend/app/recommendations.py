@@ -0,0 +1,431 @@
+# recommendations.py
+# Рекомендации: «похожие объявления» и «популярное рядом».
+#
+# Похожие: офлайн-задание строит TF-IDF по заголовку и описанию, сжимает его
+# случайной проекцией до DIM измерений, добавляет признаки категории и цены и
+# сохраняет L2-нормированную матрицу float32 (.npy, читается через mmap).
+# Приближенный поиск — LSH по случайным гиперплоскостям: кандидаты совпадают
+# хотя бы в одной из LSH_TABLES таблиц, точный косинус считается только по ним.
+#   python -m app.recommendations build
+#
+# Популярное рядом: zset-ы в Redis по ячейкам geohash, ZINCRBY при новом
+# заказе; периодическое задание пересчитывает их по истории заказов с затуханием
+# во временные ключи и переименовывает их поверх рабочих. Заказы, пришедшие во
+# время пересчета, доливаются в новые ключи при переключении.
+#   python -m app.recommendations popular [--days 30]
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import event, select
+
+from .config import settings
+from .database import SessionLocal
+from .geo_tiles import parse_location
+from .models import Item, Order, Service
+from .utils import get_redis
+
+logger = logging.getLogger("sakhshop")
+
+DIM = 128
+MAX_FEATURES = 50_000
+CATEGORY_WEIGHT = 0.5
+PRICE_WEIGHT = 0.3
+LSH_TABLES = 8
+LSH_BITS = 12
+RELOAD_INTERVAL_SECONDS = 60
+SEED = 20241019
+KEEP_VERSIONS = 2  # текущая и предыдущая: ее еще могут держать воркеры до перечитывания CURRENT
+
+POPULAR_PRECISIONS = (5, 4)  # ~5 км и ~20 км
+POPULAR_KEY_PREFIX = "reco:popular"
+POPULAR_TMP_PREFIX = "reco:popular_tmp"
+POPULAR_REFRESH_KEY = "reco:popular_refresh"  # флаг идущего пересчета
+POPULAR_PENDING_KEY = "reco:popular_pending"  # заказы за время пересчета: id -> [member, ключи]
+POPULAR_REFRESH_TTL_SECONDS = 3600
+POPULAR_HALF_LIFE_DAYS = 7
+POPULAR_MAX_MEMBERS = 500
+
+_TOKEN_RE = re.compile(r"\w{2,}")
+
+
+# --- Geohash ----------------------------------------------------------------
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat: float, lon: float, precision: int) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, rng = (lon, lon_range) if even else (lat, lat_range)
+        middle = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if target >= middle:
+            value |= 1
+            rng[0] = middle
+        else:
+            rng[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+# --- Построение индекса «похожих» -------------------------------------------
+
+def _tokens(*parts: Optional[str]) -> list[str]:
+    return _TOKEN_RE.findall(" ".join(part for part in parts if part).lower())
+
+
+def _load_listings(db) -> list[dict]:
+    listings = []
+    for listing_type, model in (("item", Item), ("service", Service)):
+        result = db.execute(
+            select(model.id, model.title, model.description, model.price, model.category_id),
+            execution_options={"yield_per": 1000},
+        )
+        for row in result:
+            listings.append({
+                "type": listing_type, "id": row.id, "title": row.title, "price": row.price,
+                "category": f"{listing_type}:{row.category_id}",
+                "tokens": _tokens(row.title, row.description),
+            })
+    return listings
+
+
+def build_similarity_index(output_dir: Optional[str] = None) -> str:
+    """Строит матрицу признаков и LSH-коды, возвращает путь к новой версии."""
+    import numpy as np
+
+    output_dir = output_dir or settings.RECOMMENDATIONS_DIR
+    db = SessionLocal()
+    try:
+        listings = _load_listings(db)
+    finally:
+        db.close()
+
+    n = len(listings)
+    document_frequency = Counter(term for listing in listings for term in set(listing["tokens"]))
+    vocabulary = {term: i for i, (term, _) in enumerate(document_frequency.most_common(MAX_FEATURES))}
+    idf = np.array([math.log((1 + n) / (1 + document_frequency[term])) + 1 for term in vocabulary], dtype=np.float32)
+    categories = {category: i for i, category in enumerate(sorted({listing["category"] for listing in listings}))}
+
+    rng = np.random.default_rng(SEED)
+    projection = (rng.standard_normal((len(vocabulary), DIM)) / math.sqrt(DIM)).astype(np.float32)
+    max_log_price = max((math.log1p(listing["price"] or 0) for listing in listings), default=1.0) or 1.0
+
+    vectors = np.zeros((n, DIM + len(categories) + 1), dtype=np.float32)
+    for row, listing in enumerate(listings):
+        counts = Counter(term for term in listing["tokens"] if term in vocabulary)
+        if counts:
+            columns = np.fromiter((vocabulary[term] for term in counts), dtype=np.int64, count=len(counts))
+            weights = np.fromiter((1 + math.log(count) for count in counts.values()), dtype=np.float32, count=len(counts))
+            weights *= idf[columns]
+            weights /= np.linalg.norm(weights)
+            vectors[row, :DIM] = weights @ projection[columns]
+        vectors[row, DIM + categories[listing["category"]]] = CATEGORY_WEIGHT
+        vectors[row, -1] = PRICE_WEIGHT * math.log1p(listing["price"] or 0) / max_log_price
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1, norms)
+
+    planes = rng.standard_normal((LSH_TABLES * LSH_BITS, vectors.shape[1])).astype(np.float32)
+    codes = _lsh_codes(vectors, planes)
+
+    version = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    version_dir = os.path.join(output_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+    np.save(os.path.join(version_dir, "vectors.npy"), vectors)
+    np.save(os.path.join(version_dir, "planes.npy"), planes)
+    np.save(os.path.join(version_dir, "codes.npy"), codes)
+    with open(os.path.join(version_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump([{key: listing[key] for key in ("type", "id", "title", "price")} for listing in listings],
+                  f, ensure_ascii=False)
+
+    # Переключение версии атомарно: читатели видят либо старый, либо новый CURRENT
+    pointer = os.path.join(output_dir, "CURRENT")
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer + ".tmp", pointer)
+    _prune_versions(output_dir, version)
+    logger.info(f"Индекс рекомендаций {version}: {n} объявлений, {vectors.shape[1]} признаков")
+    return version_dir
+
+
+def _prune_versions(output_dir: str, current: str) -> None:
+    """Удаляет версии индекса старше KEEP_VERSIONS последних (не новее current)."""
+    versions = sorted(
+        name for name in os.listdir(output_dir)
+        if name.isdigit() and name <= current and os.path.isdir(os.path.join(output_dir, name))
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+        logger.info(f"Удалена старая версия индекса рекомендаций {name}")
+
+
+def _lsh_codes(vectors, planes):
+    import numpy as np
+
+    bits = (vectors @ planes.T > 0).reshape(len(vectors), LSH_TABLES, LSH_BITS)
+    weights = (1 << np.arange(LSH_BITS, dtype=np.uint32))
+    return (bits * weights).sum(axis=2).astype(np.uint32)
+
+
+# --- Обслуживание запросов --------------------------------------------------
+
+class SimilarityIndex:
+    def __init__(self, path: str):
+        import numpy as np
+
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.planes = np.load(os.path.join(path, "planes.npy"))
+        self.codes = np.load(os.path.join(path, "codes.npy"))
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.rows = {(entry["type"], entry["id"]): row for row, entry in enumerate(self.meta)}
+        self.buckets = [self._bucket_table(self.codes[:, table]) for table in range(self.codes.shape[1])]
+
+    @staticmethod
+    def _bucket_table(codes) -> dict:
+        """LSH-код -> номера строк с этим кодом в одной таблице."""
+        import numpy as np
+
+        order = np.argsort(codes, kind="stable")
+        keys, starts = np.unique(codes[order], return_index=True)
+        return dict(zip(keys.tolist(), np.split(order, starts[1:])))
+
+    def similar(self, listing_type: str, listing_id: int, limit: int = 10) -> Optional[list[dict]]:
+        import numpy as np
+
+        row = self.rows.get((listing_type, listing_id))
+        if row is None:
+            return None
+        # Кандидаты — объединение корзин строки по всем таблицам, без прохода по матрице кодов
+        buckets = [table[code] for table, code in zip(self.buckets, self.codes[row].tolist())]
+        candidates = np.unique(np.concatenate(buckets))
+        candidates = candidates[candidates != row]
+        if len(candidates) < limit:
+            # Слишком узкая корзина — точный поиск по всей матрице
+            candidates = np.delete(np.arange(len(self.meta)), row)
+        if not len(candidates):
+            return []
+        scores = self.vectors[candidates] @ self.vectors[row]
+        top = np.argsort(-scores)[:limit]
+        return [{**self.meta[candidates[i]], "score": round(float(scores[i]), 4)} for i in top]
+
+
+_index_state = {"version": None, "index": None, "checked_at": 0.0}
+
+
+def get_similarity_index() -> Optional[SimilarityIndex]:
+    """Текущая версия индекса; CURRENT перечитывается не чаще раза в минуту."""
+    now = time.monotonic()
+    if _index_state["index"] is not None and now - _index_state["checked_at"] < RELOAD_INTERVAL_SECONDS:
+        return _index_state["index"]
+    _index_state["checked_at"] = now
+    try:
+        with open(os.path.join(settings.RECOMMENDATIONS_DIR, "CURRENT")) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    if version != _index_state["version"]:
+        _index_state["index"] = SimilarityIndex(os.path.join(settings.RECOMMENDATIONS_DIR, version))
+        _index_state["version"] = version
+    return _index_state["index"]
+
+
+# --- Популярное рядом -------------------------------------------------------
+
+def _popular_keys(lat: float, lon: float) -> list[str]:
+    return [f"{POPULAR_KEY_PREFIX}:{precision}:{geohash(lat, lon, precision)}" for precision in POPULAR_PRECISIONS]
+
+
+def _order_listings(connection, orders: list[Order]) -> list[tuple[int, str, Optional[str]]]:
+    """(order_id, member, location) объявлений заказов — один запрос на тип объявления."""
+    members = []
+    for listing_type, model, attr in (("item", Item, "item_id"), ("service", Service, "service_id")):
+        ordered = [order for order in orders if getattr(order, attr) is not None]
+        if not ordered:
+            continue
+        ids = {getattr(order, attr) for order in ordered}
+        locations = dict(connection.execute(select(model.id, model.location).where(model.id.in_(ids))).all())
+        members.extend((order.id, f"{listing_type}:{getattr(order, attr)}", locations.get(getattr(order, attr)))
+                       for order in ordered)
+    return members
+
+
+def _collect_orders(session, flush_context):
+    new_orders = [obj for obj in session.new if isinstance(obj, Order)]
+    if not new_orders:
+        return
+    listings = _order_listings(session.connection(), new_orders)
+    pending = session.info.setdefault("popular_updates", [])
+    pending.extend(listing for listing in listings if parse_location(listing[2]) is not None)
+
+
+def _apply_orders(session):
+    pending = session.info.pop("popular_updates", None)
+    if not pending:
+        return
+    from redis.exceptions import RedisError
+
+    try:
+        client = get_redis()
+        refreshing = client.exists(POPULAR_REFRESH_KEY)
+        pipe = client.pipeline(transaction=False)
+        for order_id, member, location in pending:
+            keys = _popular_keys(*parse_location(location))
+            for key in keys:
+                pipe.zincrby(key, 1, member)
+            if refreshing:
+                # Идет пересчет: при переключении заказ дольется в новые ключи
+                pipe.hset(POPULAR_PENDING_KEY, order_id, json.dumps([member, keys]))
+        pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Не удалось обновить популярное рядом: {e}")
+
+
+def _discard_orders(session):
+    session.info.pop("popular_updates", None)
+
+
+def install_listeners(session_factory) -> None:
+    event.listen(session_factory, "after_flush", _collect_orders)
+    event.listen(session_factory, "after_commit", _apply_orders)
+    event.listen(session_factory, "after_rollback", _discard_orders)
+
+
+# Переименовывает временные ключи поверх рабочих, удаляет ячейки без заказов и
+# доливает заказы пересчета, которых нет в снимке и в уже учтенных (ARGV-хвост)
+_SWAP_POPULAR_SCRIPT = """
+local renamed, stale = tonumber(ARGV[1]), tonumber(ARGV[2])
+local handled = {}
+for i = 3 + 2 * renamed + stale, #ARGV do
+    handled[ARGV[i]] = true
+end
+for i = 3, 2 + renamed do
+    redis.call('RENAME', ARGV[i + renamed], ARGV[i])
+end
+for i = 3 + 2 * renamed, 2 + 2 * renamed + stale do
+    redis.call('UNLINK', ARGV[i])
+end
+local pending = redis.call('HGETALL', KEYS[1])
+for i = 1, #pending, 2 do
+    if not handled[pending[i]] then
+        local entry = cjson.decode(pending[i + 1])
+        for _, key in ipairs(entry[2]) do
+            redis.call('ZINCRBY', key, 1, entry[1])
+        end
+    end
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+return renamed
+"""
+
+
+def _popular_scores(days: int) -> tuple[dict[str, Counter], set[int]]:
+    """Затухающие веса объявлений по ячейкам и id заказов, попавших в снимок."""
+    since = datetime.utcnow() - timedelta(days=days)
+    now = datetime.utcnow()
+    scores: dict[str, Counter] = {}
+    order_ids = set()
+    db = SessionLocal()
+    try:
+        for listing_type, model, column in (("item", Item, Order.item_id), ("service", Service, Order.service_id)):
+            result = db.execute(
+                select(model.id, model.location, Order.id.label("order_id"), Order.created_at)
+                .join(model, column == model.id)
+                .where(Order.created_at >= since),
+                execution_options={"yield_per": 5000},
+            )
+            for row in result:
+                order_ids.add(row.order_id)
+                point = parse_location(row.location)
+                if point is None:
+                    continue
+                age_days = (now - row.created_at).total_seconds() / 86400
+                weight = 0.5 ** (age_days / POPULAR_HALF_LIFE_DAYS)
+                for key in _popular_keys(*point):
+                    scores.setdefault(key, Counter())[f"{listing_type}:{row.id}"] += weight
+    finally:
+        db.close()
+    return scores, order_ids
+
+
+def refresh_popular(days: int = 30) -> int:
+    """Пересчитывает популярность по заказам за период с экспоненциальным затуханием."""
+    client = get_redis()
+    client.delete(POPULAR_PENDING_KEY)
+    # Флаг ставится до снимка: заказ, не попавший в снимок, уже увидит его
+    client.set(POPULAR_REFRESH_KEY, 1, ex=POPULAR_REFRESH_TTL_SECONDS)
+    try:
+        scores, order_ids = _popular_scores(days)
+        pending = client.hgetall(POPULAR_PENDING_KEY)
+        for order_id, raw in pending.items():
+            if int(order_id) in order_ids:
+                continue
+            member, keys = json.loads(raw)
+            for key in keys:
+                scores.setdefault(key, Counter())[member] += 1
+
+        keys = list(scores)
+        tmp_keys = [POPULAR_TMP_PREFIX + key[len(POPULAR_KEY_PREFIX):] for key in keys]
+        pipe = client.pipeline(transaction=False)
+        for tmp_key, key in zip(tmp_keys, keys):
+            pipe.delete(tmp_key)
+            pipe.zadd(tmp_key, dict(scores[key].most_common(POPULAR_MAX_MEMBERS)))
+        pipe.execute()
+        stale = list(set(client.scan_iter(match=f"{POPULAR_KEY_PREFIX}:*", count=1000)) - set(scores))
+        client.register_script(_SWAP_POPULAR_SCRIPT)(
+            keys=[POPULAR_PENDING_KEY, POPULAR_REFRESH_KEY],
+            args=[len(keys), len(stale), *keys, *tmp_keys, *stale, *pending],
+        )
+    finally:
+        client.delete(POPULAR_REFRESH_KEY)
+    logger.info(f"Популярное рядом пересчитано: {len(scores)} ячеек")
+    return len(scores)
+
+
+def popular_near(lat: float, lon: float, limit: int = 20) -> list[dict]:
+    """Популярные объявления в ячейке пользователя, добор — из более крупной ячейки."""
+    client = get_redis()
+    seen, result = set(), []
+    for key in _popular_keys(lat, lon):
+        for member, score in client.zrevrange(key, 0, limit - 1, withscores=True):
+            if member in seen:
+                continue
+            seen.add(member)
+            listing_type, listing_id = member.split(":")
+            result.append({"type": listing_type, "id": int(listing_id), "score": round(score, 3)})
+            if len(result) >= limit:
+                return result
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Рекомендации")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Построить индекс похожих объявлений")
+    build_parser.add_argument("--output-dir", default=None)
+    popular_parser = subparsers.add_parser("popular", help="Пересчитать популярное рядом")
+    popular_parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(build_similarity_index(args.output_dir))
+    elif args.command == "popular":
+        print(f"Ячеек: {refresh_popular(args.days)}")
+
+
+if __name__ == "__main__":
+    main()
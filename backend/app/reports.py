@@ -0,0 +1,319 @@
+# reports.py
+# Асинхронные отчеты администраторов. Запрос создает строку reports и задачу
+# build_report в очереди "reports" (tasks.py); воркер выполняет запрос на
+# реплике серверным курсором, пишет сжатый CSV (gzip) или Parquet (zstd)
+# пачками во временный файл и загружает его в Object Storage multipart-ом.
+# Ссылка на скачивание — presigned URL, выдается при запросе статуса.
+#
+# Локально: python -m app.reports run users_by_period 2026-01-01 2026-01-31 [--format parquet]
+import argparse
+import csv
+import gzip
+import io
+import logging
+import tempfile
+from datetime import date, datetime, time, timedelta
+from typing import IO, Callable
+
+from pydantic import BaseModel
+from sqlalchemy import and_, case, distinct, func, or_, select, update
+from sqlalchemy.orm import aliased
+
+from .config import settings
+from .database import SessionLocal, replica_engine
+from .models import (
+    Item,
+    Order,
+    OrderStatus,
+    ProductCategory,
+    Report,
+    ReportStatus,
+    Service,
+    ServiceCategory,
+    Transaction,
+    TransactionStatus,
+    User,
+)
+from .tasks import enqueue, task
+from .utils import get_s3_client
+
+logger = logging.getLogger("sakhshop")
+
+CHUNK_SIZE = 5000
+UPLOAD_PART_SIZE = 16 * 1024 * 1024
+STATEMENT_TIMEOUT = "30min"
+# Отчет в RUNNING дольше этого брошен умершим воркером, и повтор его перехватывает
+RUN_TIMEOUT = timedelta(minutes=45)
+CONTENT_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+EXTENSIONS = {"csv": "csv.gz", "parquet": "parquet"}
+
+
+def _period(params: dict) -> tuple[datetime, datetime]:
+    start = datetime.combine(date.fromisoformat(params["date_from"]), time.min)
+    end = datetime.combine(date.fromisoformat(params["date_to"]) + timedelta(days=1), time.min)
+    return start, end
+
+
+# --- Запросы отчетов ------------------------------------------------------
+
+def users_by_period(params: dict):
+    start, end = _period(params)
+    return (
+        select(
+            User.id, User.name, User.email, User.phone, User.is_seller,
+            User.email_verified, User.phone_verified, User.created_at,
+        )
+        .where(User.created_at >= start, User.created_at < end)
+        .order_by(User.created_at, User.id)
+    )
+
+
+def gmv_by_category(params: dict):
+    start, end = _period(params)
+    item_category = aliased(ProductCategory)
+    service_category = aliased(ServiceCategory)
+    return (
+        select(
+            case((Order.item_id.isnot(None), "item"), else_="service").label("listing_type"),
+            func.coalesce(item_category.name, service_category.name, "без категории").label("category"),
+            func.count(distinct(Order.id)).label("orders"),
+            func.sum(Transaction.amount).label("gmv"),
+            func.sum(Transaction.amount * func.coalesce(Transaction.platform_fee, 0)).label("platform_fees"),
+        )
+        # Ограничение по Order.created_at отсекает более поздние секции orders
+        .join(Order, and_(Transaction.order_id == Order.id, Order.created_at < end))
+        .outerjoin(Item, Order.item_id == Item.id)
+        .outerjoin(item_category, Item.category_id == item_category.id)
+        .outerjoin(Service, Order.service_id == Service.id)
+        .outerjoin(service_category, Service.category_id == service_category.id)
+        .where(
+            Transaction.status == TransactionStatus.COMPLETED,
+            Transaction.created_at >= start,
+            Transaction.created_at < end,
+        )
+        .group_by("listing_type", "category")
+        .order_by(func.sum(Transaction.amount).desc())
+    )
+
+
+def disputed_orders(params: dict):
+    start, end = _period(params)
+    return (
+        select(
+            Order.id, Order.buyer_id, Order.seller_id, Order.item_id, Order.service_id,
+            Transaction.amount, Transaction.status.label("transaction_status"), Transaction.payment_id,
+            Order.created_at, Order.updated_at,
+        )
+        .outerjoin(Transaction, and_(Transaction.order_id == Order.id, Transaction.created_at >= Order.created_at))
+        .where(Order.status == OrderStatus.DISPUTED, Order.created_at >= start, Order.created_at < end)
+        .order_by(Order.created_at, Order.id)
+    )
+
+
+REPORTS: dict[str, Callable[[dict], object]] = {
+    "users_by_period": users_by_period,
+    "gmv_by_category": gmv_by_category,
+    "disputed_orders": disputed_orders,
+}
+
+
+# --- Запись файлов --------------------------------------------------------
+
+def _plain(value):
+    return getattr(value, "value", value)
+
+
+def write_csv(result, out: IO[bytes], statement) -> int:
+    rows = 0
+    with gzip.GzipFile(fileobj=out, mode="wb") as compressed:
+        text = io.TextIOWrapper(compressed, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(result.keys())
+        for partition in result.partitions(CHUNK_SIZE):
+            writer.writerows([_plain(value) for value in row] for row in partition)
+            rows += len(partition)
+        text.flush()
+        text.detach()
+    return rows
+
+
+def _arrow_type(sql_type):
+    import pyarrow as pa
+    from sqlalchemy import types
+
+    for sql_class, arrow_type in (
+        (types.Boolean, pa.bool_()),
+        (types.Integer, pa.int64()),
+        (types.Float, pa.float64()),
+        (types.DateTime, pa.timestamp("us")),
+        (types.Date, pa.date32()),
+    ):
+        if isinstance(sql_type, sql_class):
+            return arrow_type
+    return pa.string()
+
+
+def write_parquet(result, out: IO[bytes], statement) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Схема берется из типов колонок запроса, а не из данных первой пачки
+    schema = pa.schema([(column.name, _arrow_type(column.type)) for column in statement.selected_columns])
+    rows = 0
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        for partition in result.partitions(CHUNK_SIZE):
+            data = [{name: _plain(value) for name, value in zip(schema.names, row)} for row in partition]
+            writer.write_table(pa.Table.from_pylist(data, schema=schema))
+            rows += len(partition)
+    return rows
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet}
+
+
+def _upload(out: IO[bytes], key: str, file_format: str) -> None:
+    from boto3.s3.transfer import TransferConfig
+
+    out.seek(0)
+    get_s3_client().upload_fileobj(
+        out, settings.YANDEX_S3_BUCKET, key,
+        ExtraArgs={"ContentType": CONTENT_TYPES[file_format]},
+        Config=TransferConfig(multipart_threshold=UPLOAD_PART_SIZE, multipart_chunksize=UPLOAD_PART_SIZE),
+    )
+
+
+def render(kind: str, params: dict, file_format: str, out: IO[bytes]) -> int:
+    """Выполняет отчет на реплике и пишет его в out; возвращает число строк."""
+    statement = REPORTS[kind](params)
+    with replica_engine.connect() as connection:
+        connection.exec_driver_sql(f"SET statement_timeout = '{STATEMENT_TIMEOUT}'")
+        # stream_results: psycopg2 читает через именованный (серверный) курсор
+        result = connection.execution_options(stream_results=True, max_row_buffer=CHUNK_SIZE).execute(statement)
+        rows = WRITERS[file_format](result, out, statement)
+        connection.rollback()
+    return rows
+
+
+def object_key(report: Report) -> str:
+    return f"{settings.REPORTS_PREFIX}/{report.created_at:%Y/%m}/{report.id}-{report.kind}.{EXTENSIONS[report.format]}"
+
+
+def download_url(report: Report) -> str | None:
+    if report.status != ReportStatus.DONE or not report.object_key:
+        return None
+    filename = report.object_key.rsplit("/", 1)[-1]
+    return get_s3_client().generate_presigned_url(
+        "get_object",
+        Params={
+            "Bucket": settings.YANDEX_S3_BUCKET,
+            "Key": report.object_key,
+            "ResponseContentDisposition": f'attachment; filename="{filename}"',
+        },
+        ExpiresIn=settings.REPORTS_LINK_TTL_SECONDS,
+    )
+
+
+def submit(db, requested_by: int, kind: str, file_format: str, params: dict) -> Report:
+    report = Report(kind=kind, format=file_format, params=params, requested_by=requested_by)
+    db.add(report)
+    db.flush()
+    enqueue(db, build_report, report_id=report.id)
+    db.commit()
+    db.refresh(report)
+    return report
+
+
+# --- Задача воркера ---------------------------------------------------------
+
+class BuildReportPayload(BaseModel):
+    report_id: int
+
+
+def _claim_report(db, report_id: int) -> bool:
+    """Переводит отчет в RUNNING, если его никто не строит; False — повтор не нужен."""
+    now = datetime.utcnow()
+    claimable = or_(
+        Report.status.in_((ReportStatus.PENDING, ReportStatus.FAILED)),
+        and_(Report.status == ReportStatus.RUNNING, Report.started_at < now - RUN_TIMEOUT),
+    )
+    claimed = db.execute(
+        update(Report).where(Report.id == report_id, claimable).values(status=ReportStatus.RUNNING, started_at=now)
+    ).rowcount
+    db.commit()
+    return bool(claimed)
+
+
+def _set_status(report_id: int, **values) -> None:
+    db = SessionLocal()
+    try:
+        db.query(Report).filter(Report.id == report_id).update(values)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _mark_dead(payload: BuildReportPayload, error: str) -> None:
+    """Попытки исчерпаны (или воркер падал на отчете): отчет не должен висеть в RUNNING."""
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Report)
+            .where(Report.id == payload.report_id, Report.status != ReportStatus.DONE)
+            .values(status=ReportStatus.FAILED, error=error, finished_at=datetime.utcnow())
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+@task("reports", max_attempts=3, on_dead=_mark_dead)
+def build_report(payload: BuildReportPayload):
+    db = SessionLocal()
+    try:
+        # Условный UPDATE: две копии задачи не построят один отчет в один ключ
+        if not _claim_report(db, payload.report_id):
+            logger.info(f"Отчет #{payload.report_id} уже строится или готов, задача пропущена")
+            return
+        report = db.get(Report, payload.report_id)
+        kind, file_format, params, key = report.kind, report.format, report.params, object_key(report)
+    finally:
+        db.close()
+
+    started = datetime.utcnow()
+    try:
+        with tempfile.TemporaryFile() as out:
+            rows = render(kind, params, file_format, out)
+            size = out.tell()
+            _upload(out, key, file_format)
+    except Exception as e:
+        # Повтор сделает очередь; статус FAILED виден админу до следующей попытки
+        _set_status(payload.report_id, status=ReportStatus.FAILED, error=f"{type(e).__name__}: {e}"[:2000])
+        raise
+    _set_status(
+        payload.report_id,
+        status=ReportStatus.DONE, object_key=key, row_count=rows, size_bytes=size,
+        error=None, finished_at=datetime.utcnow(),
+    )
+    logger.info(f"Отчет {kind}#{payload.report_id}: {rows} строк, {size} байт за {datetime.utcnow() - started}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Отчеты администраторов")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Построить отчет в локальный файл")
+    run_parser.add_argument("kind", choices=sorted(REPORTS))
+    run_parser.add_argument("date_from")
+    run_parser.add_argument("date_to")
+    run_parser.add_argument("--format", choices=sorted(WRITERS), default="csv")
+    run_parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    params = {"date_from": args.date_from, "date_to": args.date_to}
+    output = args.output or f"{args.kind}.{EXTENSIONS[args.format]}"
+    with open(output, "wb") as out:
+        rows = render(args.kind, params, args.format, out)
+    print(f"{output}: {rows} строк")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+# rollups.py
+# Инкрементальные роллапы для дашборда продавца (seller_daily_stats,
+# seller_product_daily_sales). Дельты считаются в after_flush по истории
+# атрибутов Order.status / Transaction.status и применяются UPSERT-ом в той же
+# транзакции. Ночная сверка пересчитывает диапазон дней из исходных таблиц:
+#   python -m app.rollups reconcile [--days 7]
+# Сверка и инкрементальные UPSERT-ы сериализуются advisory-блокировкой
+# ROLLUPS_LOCK_ID: дельты берут ее разделяемой, сверка — исключительной.
+import argparse
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import and_, case, delete, event, func, inspect, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from .database import SessionLocal
+from .models import (
+    Order,
+    OrderStatus,
+    SellerDailyStats,
+    SellerProductDailySales,
+    Transaction,
+    TransactionStatus,
+)
+
+logger = logging.getLogger("sakhshop")
+
+ORDER_STATUS_COLUMNS = {
+    OrderStatus.PENDING: "orders_pending",
+    OrderStatus.CONFIRMED: "orders_confirmed",
+    OrderStatus.DELIVERED: "orders_delivered",
+    OrderStatus.DISPUTED: "orders_disputed",
+    OrderStatus.CANCELLED: "orders_cancelled",
+}
+REVENUE_COLUMNS = ("completed_transactions", "gross_revenue", "platform_fees")
+ROLLUPS_LOCK_ID = 729001
+
+
+def _day(value: datetime | None) -> date:
+    return (value or datetime.utcnow()).date()
+
+
+class _Deltas:
+    def __init__(self):
+        # (seller_id, day) -> {колонка: приращение}
+        self.stats = defaultdict(lambda: defaultdict(float))
+        # (seller_id, day, product_type, product_id) -> [units, revenue]
+        self.products = defaultdict(lambda: [0, 0.0])
+
+    def __bool__(self):
+        return bool(self.stats or self.products)
+
+
+def _collect_order(order: Order, sign_by_status: dict, deltas: _Deltas) -> None:
+    if order.seller_id is None:
+        return
+    stats = deltas.stats[(order.seller_id, _day(order.created_at))]
+    for order_status, sign in sign_by_status.items():
+        if order_status in ORDER_STATUS_COLUMNS:
+            stats[ORDER_STATUS_COLUMNS[order_status]] += sign
+
+
+def _collect_transactions(connection, changes: list[tuple[Transaction, int]], deltas: _Deltas) -> None:
+    """Дельты выручки по (транзакция, знак); заказы читаются одним запросом на flush."""
+    order_ids = {transaction.order_id for transaction, _ in changes if transaction.order_id is not None}
+    if not order_ids:
+        return
+    query = select(Order.id, Order.seller_id, Order.item_id, Order.service_id).where(Order.id.in_(order_ids))
+    created = [transaction.created_at for transaction, _ in changes]
+    if all(created):
+        # Заказ создан не позже транзакции: более поздние секции orders не сканируются
+        query = query.where(Order.created_at <= max(created))
+    orders = {order.id: order for order in connection.execute(query)}
+    for transaction, sign in changes:
+        order = orders.get(transaction.order_id)
+        if order is not None and order.seller_id is not None:
+            _collect_transaction(order, transaction, sign, deltas)
+
+
+def _collect_transaction(order, transaction: Transaction, sign: int, deltas: _Deltas) -> None:
+    gross = transaction.amount or 0
+    fee = gross * (transaction.platform_fee or 0)
+    day = _day(transaction.created_at)
+
+    stats = deltas.stats[(order.seller_id, day)]
+    stats["completed_transactions"] += sign
+    stats["gross_revenue"] += sign * gross
+    stats["platform_fees"] += sign * fee
+
+    if order.item_id is not None:
+        product = ("item", order.item_id)
+    elif order.service_id is not None:
+        product = ("service", order.service_id)
+    else:
+        return
+    sales = deltas.products[(order.seller_id, day, *product)]
+    sales[0] += sign
+    sales[1] += sign * (gross - fee)
+
+
+def _status_change(obj, attr: str):
+    """Возвращает (старый, новый) статус, если он менялся в этом flush."""
+    history = inspect(obj).attrs[attr].history
+    if not history.added or not history.deleted:
+        return None
+    return history.deleted[0], history.added[0]
+
+
+def _apply(connection, deltas: _Deltas) -> None:
+    # Держится до конца транзакции: сверка не начнется, пока дельта не закоммичена,
+    # а дельта, посчитанная во время сверки, ляжет поверх ее результата
+    connection.execute(text("SELECT pg_advisory_xact_lock_shared(:id)"), {"id": ROLLUPS_LOCK_ID})
+    stats_table = SellerDailyStats.__table__
+    for (seller_id, day), values in deltas.stats.items():
+        values = {column: value for column, value in values.items() if value}
+        if not values:
+            continue
+        stmt = insert(stats_table).values(seller_id=seller_id, day=day, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[stats_table.c.seller_id, stats_table.c.day],
+            set_={column: stats_table.c[column] + stmt.excluded[column] for column in values},
+        )
+        connection.execute(stmt)
+
+    sales_table = SellerProductDailySales.__table__
+    for (seller_id, day, product_type, product_id), (units, revenue) in deltas.products.items():
+        if not units and not revenue:
+            continue
+        stmt = insert(sales_table).values(
+            seller_id=seller_id, day=day, product_type=product_type,
+            product_id=product_id, units=units, revenue=revenue,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[sales_table.c.seller_id, sales_table.c.day,
+                            sales_table.c.product_type, sales_table.c.product_id],
+            set_={
+                "units": sales_table.c.units + stmt.excluded.units,
+                "revenue": sales_table.c.revenue + stmt.excluded.revenue,
+            },
+        )
+        connection.execute(stmt)
+
+
+def _update_rollups(session, flush_context):
+    deltas = _Deltas()
+    transactions: list[tuple[Transaction, int]] = []
+    completed = TransactionStatus.COMPLETED
+
+    for obj in session.new:
+        if isinstance(obj, Order):
+            _collect_order(obj, {obj.status: 1}, deltas)
+        elif isinstance(obj, Transaction) and obj.status == completed:
+            transactions.append((obj, 1))
+
+    for obj in session.dirty:
+        if isinstance(obj, Order):
+            change = _status_change(obj, "status")
+            if change:
+                _collect_order(obj, {change[0]: -1, change[1]: 1}, deltas)
+        elif isinstance(obj, Transaction):
+            change = _status_change(obj, "status")
+            if change and (change[0] == completed) != (change[1] == completed):
+                transactions.append((obj, 1 if change[1] == completed else -1))
+
+    for obj in session.deleted:
+        if isinstance(obj, Order):
+            _collect_order(obj, {obj.status: -1}, deltas)
+        elif isinstance(obj, Transaction) and obj.status == completed:
+            transactions.append((obj, -1))
+
+    if transactions:
+        _collect_transactions(session.connection(), transactions, deltas)
+    if deltas:
+        _apply(session.connection(), deltas)
+
+
+def install_listeners(session_factory) -> None:
+    event.listen(session_factory, "after_flush", _update_rollups)
+
+
+def _empty_stats(seller_id: int, day: date) -> dict:
+    row = {"seller_id": seller_id, "day": day}
+    row.update({column: 0 for column in ORDER_STATUS_COLUMNS.values()})
+    row.update({column: 0 for column in REVENUE_COLUMNS})
+    return row
+
+
+def reconcile(date_from: date, date_to: date) -> int:
+    """Пересчитывает роллапы за [date_from, date_to] из orders/transactions.
+
+    Возвращает число записанных строк seller_daily_stats.
+    """
+    start = datetime.combine(date_from, time.min)
+    end = datetime.combine(date_to + timedelta(days=1), time.min)
+    fee = Transaction.amount * func.coalesce(Transaction.platform_fee, 0)
+
+    order_day = func.date(Order.created_at)
+    order_counts = (
+        select(
+            Order.seller_id, order_day.label("day"),
+            *[func.count().filter(Order.status == order_status).label(column)
+              for order_status, column in ORDER_STATUS_COLUMNS.items()],
+        )
+        .where(Order.created_at >= start, Order.created_at < end, Order.seller_id.isnot(None))
+        .group_by(Order.seller_id, order_day)
+    )
+
+    tx_day = func.date(Transaction.created_at)
+    completed_tx = (
+        select(Order.seller_id, tx_day.label("day"))
+        # Условие по Order.created_at отсекает секции orders позже периода
+        .join(Order, and_(Transaction.order_id == Order.id, Order.created_at < end))
+        .where(
+            Transaction.status == TransactionStatus.COMPLETED,
+            Transaction.created_at >= start,
+            Transaction.created_at < end,
+            Order.seller_id.isnot(None),
+        )
+    )
+    revenue = completed_tx.add_columns(
+        func.count().label("completed_transactions"),
+        func.coalesce(func.sum(Transaction.amount), 0).label("gross_revenue"),
+        func.coalesce(func.sum(fee), 0).label("platform_fees"),
+    ).group_by(Order.seller_id, tx_day)
+
+    product_type = case((Order.item_id.isnot(None), "item"), else_="service")
+    product_id = func.coalesce(Order.item_id, Order.service_id)
+    product_sales = completed_tx.add_columns(
+        product_type.label("product_type"),
+        product_id.label("product_id"),
+        func.count().label("units"),
+        func.coalesce(func.sum(Transaction.amount - fee), 0).label("revenue"),
+    ).where(product_id.isnot(None)).group_by(Order.seller_id, tx_day, product_type, product_id)
+
+    db = SessionLocal()
+    try:
+        # Ждет незакоммиченные дельты и не дает новым записаться до конца сверки
+        db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": ROLLUPS_LOCK_ID})
+        stats = {}
+        for row in db.execute(order_counts).mappings():
+            entry = stats.setdefault((row["seller_id"], row["day"]), _empty_stats(row["seller_id"], row["day"]))
+            entry.update({column: row[column] for column in ORDER_STATUS_COLUMNS.values()})
+        for row in db.execute(revenue).mappings():
+            entry = stats.setdefault((row["seller_id"], row["day"]), _empty_stats(row["seller_id"], row["day"]))
+            entry.update({column: row[column] for column in REVENUE_COLUMNS})
+        sales = [dict(row) for row in db.execute(product_sales).mappings()]
+
+        db.execute(delete(SellerDailyStats).where(SellerDailyStats.day.between(date_from, date_to)))
+        db.execute(delete(SellerProductDailySales).where(SellerProductDailySales.day.between(date_from, date_to)))
+        if stats:
+            db.execute(insert(SellerDailyStats), list(stats.values()))
+        if sales:
+            db.execute(insert(SellerProductDailySales), sales)
+        db.commit()
+    finally:
+        db.close()
+    logger.info(f"Сверка роллапов {date_from}..{date_to}: {len(stats)} строк статистики, {len(sales)} строк продаж")
+    return len(stats)
+
+
+def seller_dashboard(db, seller_id: int, date_from: date, date_to: date, top: int = 10) -> dict:
+    """Собирает дашборд продавца только из роллапов: O(дней + товаров)."""
+    rows = (
+        db.query(SellerDailyStats)
+        .filter(SellerDailyStats.seller_id == seller_id, SellerDailyStats.day.between(date_from, date_to))
+        .order_by(SellerDailyStats.day)
+        .all()
+    )
+    orders = {order_status: 0 for order_status in ORDER_STATUS_COLUMNS}
+    totals = {column: 0 for column in REVENUE_COLUMNS}
+    daily = []
+    for row in rows:
+        day_orders = {order_status: getattr(row, column) for order_status, column in ORDER_STATUS_COLUMNS.items()}
+        for order_status, count in day_orders.items():
+            orders[order_status] += count
+        for column in REVENUE_COLUMNS:
+            totals[column] += getattr(row, column)
+        daily.append({
+            "day": row.day,
+            "orders": day_orders,
+            "completed_transactions": row.completed_transactions,
+            "gross_revenue": row.gross_revenue,
+            "platform_fees": row.platform_fees,
+            "net_revenue": row.gross_revenue - row.platform_fees,
+        })
+
+    units = func.sum(SellerProductDailySales.units).label("units")
+    product_revenue = func.sum(SellerProductDailySales.revenue).label("revenue")
+    top_products = (
+        db.query(SellerProductDailySales.product_type, SellerProductDailySales.product_id, units, product_revenue)
+        .filter(
+            SellerProductDailySales.seller_id == seller_id,
+            SellerProductDailySales.day.between(date_from, date_to),
+        )
+        .group_by(SellerProductDailySales.product_type, SellerProductDailySales.product_id)
+        .order_by(product_revenue.desc())
+        .limit(top)
+        .all()
+    )
+
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "orders": orders,
+        **totals,
+        "net_revenue": totals["gross_revenue"] - totals["platform_fees"],
+        "daily": daily,
+        "top_products": [row._asdict() for row in top_products],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Роллапы дашборда продавца")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    reconcile_parser = subparsers.add_parser("reconcile", help="Пересчитать роллапы за последние дни")
+    reconcile_parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.command == "reconcile":
+        date_to = datetime.utcnow().date()
+        reconcile(date_to - timedelta(days=args.days - 1), date_to)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 # schemas.py
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import Any, Dict, Literal, Optional, List
+from datetime import date, datetime
 from enum import Enum
 
 class OrderStatus(str, Enum):
@@ -11,6 +11,12 @@ class OrderStatus(str, Enum):
     DISPUTED = "disputed"
     CANCELLED = "cancelled"
 
+class ReportStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
 class TransactionStatus(str, Enum):
     PENDING = "pending"
     HELD = "held"
@@ -88,6 +94,28 @@ class ItemBase(BaseModel):
 class ItemCreate(ItemBase):
     pass
 
+class ItemImportRow(ItemCreate):
+    location: Optional[str] = Field(None, pattern=r"^-?\d+(\.\d+)?,-?\d+(\.\d+)?$")
+    category_id: Optional[int] = None
+
+    @field_validator("location")
+    @classmethod
+    def location_in_range(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None:
+            lat, lon = map(float, value.split(","))
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError("широта должна быть в [-90, 90], долгота — в [-180, 180]")
+        return value
+
+class ItemImportError(BaseModel):
+    row: int
+    errors: List[str]
+
+class ItemImportReport(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ItemImportError]
+
 class ItemResponse(ItemBase):
     id: int
     owner_id: int
@@ -169,4 +197,52 @@ class TransactionResponse(BaseModel):
     updated_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class SellerDailyStatsResponse(BaseModel):
+    day: date
+    orders: Dict[OrderStatus, int]
+    completed_transactions: int
+    gross_revenue: float
+    platform_fees: float
+    net_revenue: float
+
+class SellerProductSalesResponse(BaseModel):
+    product_type: str
+    product_id: int
+    units: int
+    revenue: float
+
+class SellerDashboardResponse(BaseModel):
+    date_from: date
+    date_to: date
+    orders: Dict[OrderStatus, int]
+    completed_transactions: int
+    gross_revenue: float
+    platform_fees: float
+    net_revenue: float
+    daily: List[SellerDailyStatsResponse]
+    top_products: List[SellerProductSalesResponse]
+
+class ReportCreate(BaseModel):
+    kind: Literal["users_by_period", "gmv_by_category", "disputed_orders"]
+    format: Literal["csv", "parquet"] = "csv"
+    date_from: date
+    date_to: date
+
+class ReportResponse(BaseModel):
+    id: int
+    kind: str
+    format: str
+    params: Dict[str, Any]
+    status: ReportStatus
+    row_count: Optional[int]
+    size_bytes: Optional[int]
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    download_url: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
@@ -0,0 +1,67 @@
+# startup_budget.py
+# Проверка бюджета холодного старта воркера:
+#   python -m app.startup_budget [--budget-ms 1500]
+# Запускает импорт app.main под `python -X importtime` в отдельном процессе,
+# сравнивает суммарное время импорта с бюджетом и проверяет, что тяжелые
+# интеграции не подгружаются при импорте. Код выхода 1 при нарушении бюджета.
+import argparse
+import os
+import subprocess
+import sys
+
+TARGET_MODULE = "app.main"
+DEFAULT_BUDGET_MS = int(os.getenv("STARTUP_BUDGET_MS", 1500))
+
+# Модули, которые должны загружаться только по требованию
+LAZY_MODULES = (
+    "yookassa", "geopy", "phonenumbers", "smtplib", "requests", "passlib",
+    "numpy", "pyarrow", "boto3",
+)
+
+
+def measure_import(module: str = TARGET_MODULE) -> dict[str, int]:
+    """Возвращает {модуль: кумулятивное время импорта в мкс}."""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=backend_dir,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Не удалось импортировать {module}:\n{result.stderr}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бюджет времени импорта приложения")
+    parser.add_argument("--budget-ms", type=int, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+
+    timings = measure_import()
+    total_ms = timings[TARGET_MODULE] / 1000
+    eager = [name for name in LAZY_MODULES if name in timings]
+
+    print(f"{TARGET_MODULE}: {total_ms:.0f} мс (бюджет {args.budget_ms} мс)")
+    for name, us in sorted(timings.items(), key=lambda kv: kv[1], reverse=True)[:10]:
+        print(f"  {us / 1000:8.1f} мс  {name}")
+
+    failed = False
+    if total_ms > args.budget_ms:
+        print("Превышен бюджет времени импорта")
+        failed = True
+    if eager:
+        print(f"Загружены при импорте, хотя должны быть ленивыми: {', '.join(eager)}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
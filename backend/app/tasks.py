@@ -0,0 +1,469 @@
+# tasks.py
+# Надежная очередь фоновых задач на Postgres (FOR UPDATE SKIP LOCKED).
+# Задача ставится в той же транзакции, что и бизнес-данные, поэтому не теряется
+# при рестарте воркера API и не выполняется для откатившихся изменений.
+#
+#   @task("email", max_attempts=5)
+#   def deliver_email(payload: SendEmailPayload): ...
+#   enqueue(db, deliver_email, email=..., subject=..., body=...)   # до db.commit()
+#
+# Воркер: python -m app.tasks worker --concurrency email=4,sms=2,reports=1
+# Локально/в тестах: python -m app.tasks drain  (или drain() из кода)
+import argparse
+import importlib
+import logging
+import os
+import random
+import secrets
+import signal
+import socket
+import threading
+import time
+import typing
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Type
+
+from pydantic import BaseModel
+from sqlalchemy import and_, delete, insert, select, update
+
+from .database import engine
+from .models import Job, JobStatus
+
+logger = logging.getLogger("sakhshop")
+
+RETRY_BASE_SECONDS = 5
+RETRY_CAP_SECONDS = 3600
+VISIBILITY_TIMEOUT = timedelta(minutes=10)  # задача без heartbeat дольше этого возвращается в очередь
+HEARTBEAT_SECONDS = 60  # выполняющаяся задача продлевает locked_at, пока идет
+POLL_INTERVAL_SECONDS = 1.0
+REAP_INTERVAL_SECONDS = 60
+DRAIN_TIMEOUT_SECONDS = 30
+# Модули с задачами вне tasks.py: воркер импортирует их, чтобы заполнить registry
+TASK_MODULES = ("app.reports",)
+
+
+@dataclass(frozen=True)
+class TaskSpec:
+    name: str
+    queue: str
+    func: Callable
+    payload_model: Type[BaseModel]
+    max_attempts: int
+    on_dead: Optional[Callable[[BaseModel, str], None]] = None
+
+
+registry: dict[str, TaskSpec] = {}
+
+
+def task(queue: str, name: Optional[str] = None, max_attempts: int = 5,
+         on_dead: Optional[Callable[[BaseModel, str], None]] = None):
+    """Регистрирует функцию как задачу; единственный аргумент — pydantic-модель payload.
+
+    on_dead(payload, error) вызывается после переноса задачи в dead-letter —
+    например, чтобы пометить сбой в бизнес-данных, которые ждут задачу.
+    """
+
+    def decorator(func):
+        hints = typing.get_type_hints(func)
+        hints.pop("return", None)
+        payload_model = next(iter(hints.values()), None)
+        if payload_model is None or not issubclass(payload_model, BaseModel):
+            raise TypeError(f"Задача {func.__name__} должна принимать pydantic-модель payload")
+        spec = TaskSpec(name or func.__name__, queue, func, payload_model, max_attempts, on_dead)
+        if spec.name in registry:
+            raise ValueError(f"Задача {spec.name} уже зарегистрирована")
+        registry[spec.name] = spec
+        func.spec = spec
+        return func
+
+    return decorator
+
+
+def enqueue(db, func, delay: Optional[timedelta] = None, **payload) -> None:
+    """Ставит задачу в очередь в транзакции сессии db (коммит — за вызывающим)."""
+    spec: TaskSpec = func.spec
+    data = spec.payload_model(**payload).model_dump(mode="json")
+    db.execute(insert(Job).values(
+        queue=spec.queue,
+        task=spec.name,
+        payload=data,
+        status=JobStatus.QUEUED,
+        attempts=0,
+        max_attempts=spec.max_attempts,
+        run_at=datetime.utcnow() + (delay or timedelta()),
+    ))
+
+
+def retry_delay(attempts: int) -> timedelta:
+    # Экспоненциальная задержка с полным джиттером, чтобы повторы не шли волной
+    return timedelta(seconds=random.uniform(0, min(RETRY_CAP_SECONDS, RETRY_BASE_SECONDS * 2 ** attempts)))
+
+
+def _claim(queue: str, worker_id: str):
+    jobs = Job.__table__
+    now = datetime.utcnow()
+    next_job = (
+        select(jobs.c.id)
+        .where(jobs.c.queue == queue, jobs.c.status == JobStatus.QUEUED, jobs.c.run_at <= now)
+        .order_by(jobs.c.run_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(jobs)
+        .where(jobs.c.id == next_job)
+        .values(status=JobStatus.RUNNING, locked_at=now, locked_by=worker_id, attempts=jobs.c.attempts + 1)
+        .returning(jobs.c.id, jobs.c.task, jobs.c.payload, jobs.c.attempts, jobs.c.max_attempts, jobs.c.locked_by)
+    )
+    with engine.begin() as connection:
+        return connection.execute(stmt).first()
+
+
+def _dead_lettered(task_name: str, job_id: int, payload: dict, error: str) -> None:
+    spec = registry.get(task_name)
+    if spec is None or spec.on_dead is None:
+        return
+    try:
+        spec.on_dead(spec.payload_model.model_validate(payload), error)
+    except Exception as e:
+        logger.error(f"Ошибка обработчика dead-letter задачи {task_name}#{job_id}: {e}")
+
+
+def _finish(job, error: Optional[BaseException]) -> bool:
+    """Завершает задачу, если она все еще за этим воркером; False — ее уже забрал другой."""
+    jobs = Job.__table__
+    # Задачу могли вернуть в очередь (requeue_stale) и выдать другому воркеру —
+    # тогда ни удалять ее, ни менять ее статус этот воркер не вправе
+    owned = and_(jobs.c.id == job.id, jobs.c.status == JobStatus.RUNNING, jobs.c.locked_by == job.locked_by)
+    with engine.begin() as connection:
+        if error is None:
+            if connection.execute(delete(jobs).where(owned)).rowcount:
+                return True
+            logger.warning(f"Задача {job.task}#{job.id} выполнена, но уже не за воркером {job.locked_by}")
+            return False
+        last_error = f"{type(error).__name__}: {error}"[:2000]
+        values = {"locked_at": None, "locked_by": None, "last_error": last_error}
+        dead = job.attempts >= job.max_attempts
+        if dead:
+            values["status"] = JobStatus.DEAD
+        else:
+            values["status"] = JobStatus.QUEUED
+            values["run_at"] = datetime.utcnow() + retry_delay(job.attempts)
+        if not connection.execute(update(jobs).where(owned).values(**values)).rowcount:
+            logger.warning(f"Задача {job.task}#{job.id} упала, но уже не за воркером {job.locked_by}: {error}")
+            return False
+    if dead:
+        logger.error(f"Задача {job.task}#{job.id} перенесена в dead-letter после {job.attempts} попыток: {error}")
+        _dead_lettered(job.task, job.id, job.payload, last_error)
+    else:
+        logger.warning(f"Задача {job.task}#{job.id} упала (попытка {job.attempts}), повтор позже: {error}")
+    return True
+
+
+def _heartbeat(job) -> None:
+    jobs = Job.__table__
+    with engine.begin() as connection:
+        connection.execute(
+            update(jobs)
+            .where(jobs.c.id == job.id, jobs.c.status == JobStatus.RUNNING, jobs.c.locked_by == job.locked_by)
+            .values(locked_at=datetime.utcnow())
+        )
+
+
+@contextmanager
+def _heartbeating(job):
+    """Пока задача выполняется, раз в HEARTBEAT_SECONDS продлевает ее locked_at.
+
+    Задачи дольше VISIBILITY_TIMEOUT (отчеты) не возвращаются в очередь, пока
+    жив их воркер; requeue_stale забирает только задачи умерших воркеров.
+    """
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(HEARTBEAT_SECONDS):
+            try:
+                _heartbeat(job)
+            except Exception as e:
+                logger.error(f"Ошибка heartbeat задачи {job.task}#{job.id}: {e}")
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_job(job) -> bool:
+    spec = registry.get(job.task)
+    try:
+        if spec is None:
+            raise LookupError(f"Неизвестная задача {job.task}")
+        with _heartbeating(job):
+            spec.func(spec.payload_model.model_validate(job.payload))
+    except Exception as e:
+        _finish(job, e)
+        return False
+    _finish(job, None)
+    return True
+
+
+def requeue_stale() -> int:
+    """Возвращает в очередь задачи, чей воркер умер, не завершив их.
+
+    Живой воркер продлевает locked_at (_heartbeating), поэтому сюда попадают
+    только задачи без heartbeat дольше VISIBILITY_TIMEOUT.
+
+    Попытка засчитывается при выборке (_claim), поэтому задача, которая
+    раз за разом роняет воркер, после max_attempts уходит в dead-letter.
+    """
+    jobs = Job.__table__
+    now = datetime.utcnow()
+    stale = and_(jobs.c.status == JobStatus.RUNNING, jobs.c.locked_at < now - VISIBILITY_TIMEOUT)
+    error = f"Нет heartbeat от воркера дольше {VISIBILITY_TIMEOUT}"
+    with engine.begin() as connection:
+        dead = connection.execute(
+            update(jobs)
+            .where(stale, jobs.c.attempts >= jobs.c.max_attempts)
+            .values(status=JobStatus.DEAD, locked_at=None, locked_by=None, last_error=error)
+            .returning(jobs.c.id, jobs.c.task, jobs.c.payload)
+        ).all()
+        requeued = connection.execute(
+            update(jobs)
+            .where(stale)
+            .values(status=JobStatus.QUEUED, locked_at=None, locked_by=None, last_error=error, run_at=now)
+        ).rowcount
+    for job in dead:
+        logger.error(f"Задача {job.task}#{job.id} перенесена в dead-letter: {error}")
+        _dead_lettered(job.task, job.id, job.payload, error)
+    return requeued
+
+
+def retry_dead(queue: Optional[str] = None) -> int:
+    jobs = Job.__table__
+    conditions = [jobs.c.status == JobStatus.DEAD]
+    if queue:
+        conditions.append(jobs.c.queue == queue)
+    with engine.begin() as connection:
+        return connection.execute(
+            update(jobs).where(and_(*conditions)).values(
+                status=JobStatus.QUEUED, attempts=0, run_at=datetime.utcnow(), last_error=None,
+            )
+        ).rowcount
+
+
+class Worker:
+    """Пул потоков с ограничением параллелизма на каждую очередь."""
+
+    def __init__(self, concurrency: dict[str, int]):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self.threads: list[threading.Thread] = []
+
+    def _loop(self, queue: str) -> None:
+        while not self.stopping.is_set():
+            try:
+                job = _claim(queue, self.worker_id)
+            except Exception as e:
+                logger.error(f"Ошибка выборки задачи из очереди {queue}: {e}")
+                job = None
+            if job is None:
+                self.stopping.wait(POLL_INTERVAL_SECONDS)
+                continue
+            # Текущая задача всегда доводится до конца, даже после SIGTERM
+            try:
+                run_job(job)
+            except Exception as e:
+                # Не смогли записать результат: задачу вернет requeue_stale
+                logger.error(f"Ошибка завершения задачи {job.task}#{job.id}: {e}")
+
+    def stop(self, *_) -> None:
+        if not self.stopping.is_set():
+            logger.info("Получен сигнал остановки, дожидаемся текущих задач")
+        self.stopping.set()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for queue, threads in self.concurrency.items():
+            for i in range(threads):
+                thread = threading.Thread(target=self._loop, args=(queue,), name=f"tasks-{queue}-{i}")
+                thread.start()
+                self.threads.append(thread)
+        logger.info(f"Воркер задач {self.worker_id} запущен: {self.concurrency}")
+
+        while not self.stopping.wait(REAP_INTERVAL_SECONDS):
+            try:
+                requeued = requeue_stale()
+                if requeued:
+                    logger.warning(f"Возвращено в очередь зависших задач: {requeued}")
+            except Exception as e:
+                logger.error(f"Ошибка возврата зависших задач: {e}")
+
+        deadline = time.monotonic() + DRAIN_TIMEOUT_SECONDS
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        alive = [thread.name for thread in self.threads if thread.is_alive()]
+        if alive:
+            logger.error(f"Не успели завершиться за {DRAIN_TIMEOUT_SECONDS} с: {alive}")
+        else:
+            logger.info("Воркер задач остановлен")
+
+
+def drain(queues: Optional[list[str]] = None, max_jobs: Optional[int] = None) -> dict[str, int]:
+    """Локальный прогон: выполняет все готовые задачи в текущем процессе.
+
+    Для тестов и разработки без отдельного воркера; задачи с run_at в будущем
+    (отложенные повторы) не ждет.
+    """
+    queues = queues or sorted({spec.queue for spec in registry.values()})
+    stats = {"succeeded": 0, "failed": 0}
+    worker_id = f"drain:{os.getpid()}"
+    for queue in queues:
+        while max_jobs is None or stats["succeeded"] + stats["failed"] < max_jobs:
+            job = _claim(queue, worker_id)
+            if job is None:
+                break
+            stats["succeeded" if run_job(job) else "failed"] += 1
+    return stats
+
+
+def _parse_concurrency(value: str) -> dict[str, int]:
+    concurrency = {}
+    for part in value.split(","):
+        queue, _, threads = part.partition("=")
+        concurrency[queue.strip()] = int(threads or 1)
+    return concurrency
+
+
+# --- Задачи уведомлений -----------------------------------------------------
+
+class SendEmailPayload(BaseModel):
+    email: str
+    subject: str
+    body: str
+
+
+class SendSMSPayload(BaseModel):
+    phone: str
+    message: str
+
+
+# Одноразовые токены и SMS-коды создаются внутри задачи: в jobs.payload
+# (и в dead-letter) лежит только id пользователя, а не секрет
+class UserPayload(BaseModel):
+    user_id: int
+
+
+class DeliveryFailed(RuntimeError):
+    pass
+
+
+def _send_email(email: str, subject: str, body: str) -> None:
+    from .utils import send_email
+
+    if not send_email(email, subject, body):
+        raise DeliveryFailed(f"Не удалось отправить email на {email}")
+
+
+def _send_sms(phone: str, message: str) -> None:
+    from .utils import send_sms_secure
+
+    if not send_sms_secure(phone, message):
+        raise DeliveryFailed("Не удалось отправить SMS")
+
+
+def _load_user(user_id: int):
+    from .database import SessionLocal
+    from .models import User
+
+    db = SessionLocal()
+    try:
+        return db.get(User, user_id)
+    finally:
+        db.close()
+
+
+@task("email", max_attempts=8)
+def deliver_email(payload: SendEmailPayload):
+    _send_email(payload.email, payload.subject, payload.body)
+
+
+@task("sms", max_attempts=5)
+def deliver_sms(payload: SendSMSPayload):
+    _send_sms(payload.phone, payload.message)
+
+
+@task("email", max_attempts=8)
+def deliver_verification_email(payload: UserPayload):
+    from . import token_store
+    from .utils import verification_email_message
+
+    user = _load_user(payload.user_id)
+    if user is None or user.email_verified:
+        return
+    token = secrets.token_urlsafe(32)
+    token_store.get_token_store().issue(
+        token_store.EMAIL_VERIFICATION, token, str(user.id), token_store.EMAIL_VERIFICATION_TTL
+    )
+    _send_email(user.email, *verification_email_message(token))
+
+
+@task("email", max_attempts=8)
+def deliver_password_reset(payload: UserPayload):
+    from . import token_store
+    from .utils import password_reset_email_message
+
+    user = _load_user(payload.user_id)
+    if user is None:
+        return
+    token = secrets.token_urlsafe(32)
+    token_store.get_token_store().issue(token_store.PASSWORD_RESET, token, str(user.id), token_store.PASSWORD_RESET_TTL)
+    _send_email(user.email, *password_reset_email_message(token))
+
+
+@task("sms", max_attempts=5)
+def deliver_sms_code(payload: UserPayload):
+    from . import token_store
+
+    user = _load_user(payload.user_id)
+    if user is None or not user.phone:
+        return
+    code = f"{secrets.randbelow(10 ** 6):06d}"
+    token_store.get_token_store().issue(token_store.SMS_CODE, str(user.id), code, token_store.SMS_CODE_TTL)
+    _send_sms(user.phone, f"Код подтверждения SakhShop: {code}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Фоновые задачи")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser("worker", help="Запустить воркер")
+    worker_parser.add_argument("--concurrency", default="email=4,sms=2,reports=1",
+                               help="очередь=потоки через запятую")
+    drain_parser = subparsers.add_parser("drain", help="Выполнить готовые задачи и выйти")
+    drain_parser.add_argument("--queues", default=None)
+    retry_parser = subparsers.add_parser("retry-dead", help="Вернуть задачи из dead-letter в очередь")
+    retry_parser.add_argument("--queue", default=None)
+    args = parser.parse_args()
+
+    from logging.config import dictConfig
+    from .config import LogConfig
+
+    dictConfig(LogConfig().dict())
+    for module in TASK_MODULES:
+        importlib.import_module(module)
+    if args.command == "worker":
+        Worker(_parse_concurrency(args.concurrency)).run()
+    elif args.command == "drain":
+        print(drain(args.queues.split(",") if args.queues else None))
+    elif args.command == "retry-dead":
+        print(f"Возвращено в очередь: {retry_dead(args.queue)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# token_store.py
+# Хранилище одноразовых токенов (подтверждение email, сброс пароля, SMS-коды).
+# Основное хранилище — Redis с нативным TTL и атомарным «прочитать и удалить»;
+# при недоступности Redis токены пишутся в таблицу one_time_tokens, которую
+# периодически чистит пакетный purge:
+#   python -m app.token_store purge [--batch-size 5000]
+import argparse
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import and_, delete, text
+from sqlalchemy.dialects.postgresql import insert
+
+from .database import engine
+from .models import OneTimeToken
+from .utils import get_redis
+
+logger = logging.getLogger("sakhshop")
+
+EMAIL_VERIFICATION = "email_verification"
+PASSWORD_RESET = "password_reset"
+SMS_CODE = "sms_code"
+GOSUSLUGI_STATE = "gosuslugi_state"
+
+EMAIL_VERIFICATION_TTL = timedelta(hours=24)
+PASSWORD_RESET_TTL = timedelta(hours=1)
+SMS_CODE_TTL = timedelta(minutes=5)
+GOSUSLUGI_STATE_TTL = timedelta(minutes=10)
+
+PURGE_BATCH_SIZE = 5000
+
+
+def _hash_key(key: str) -> str:
+    # В хранилище лежит только хэш ключа, сами токены не сохраняются
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class RedisTokenStore:
+    # GET + DEL одной операцией, только если значение совпало с ожидаемым
+    _CONSUME_IF_EQUAL = """
+    local value = redis.call('GET', KEYS[1])
+    if value and value == ARGV[1] then
+        redis.call('DEL', KEYS[1])
+        return value
+    end
+    return false
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._consume_if_equal = client.register_script(self._CONSUME_IF_EQUAL)
+
+    @staticmethod
+    def _key(kind: str, key: str) -> str:
+        return f"token:{kind}:{_hash_key(key)}"
+
+    def issue(self, kind: str, key: str, value: str, ttl: timedelta) -> None:
+        self.client.set(self._key(kind, key), value, ex=ttl)
+
+    def consume(self, kind: str, key: str, expected: Optional[str] = None) -> Optional[str]:
+        if expected is None:
+            return self.client.getdel(self._key(kind, key))
+        return self._consume_if_equal(keys=[self._key(kind, key)], args=[expected]) or None
+
+
+class PostgresTokenStore:
+    def __init__(self, bind=engine):
+        self.bind = bind
+
+    def issue(self, kind: str, key: str, value: str, ttl: timedelta) -> None:
+        stmt = insert(OneTimeToken).values(
+            kind=kind, key=_hash_key(key), value=value, expires_at=datetime.utcnow() + ttl
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[OneTimeToken.kind, OneTimeToken.key],
+            set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+        )
+        with self.bind.begin() as connection:
+            connection.execute(stmt)
+
+    def consume(self, kind: str, key: str, expected: Optional[str] = None) -> Optional[str]:
+        conditions = [
+            OneTimeToken.kind == kind,
+            OneTimeToken.key == _hash_key(key),
+            OneTimeToken.expires_at > datetime.utcnow(),
+        ]
+        if expected is not None:
+            conditions.append(OneTimeToken.value == expected)
+        stmt = delete(OneTimeToken).where(and_(*conditions)).returning(OneTimeToken.value)
+        with self.bind.begin() as connection:
+            return connection.execute(stmt).scalar()
+
+    def purge_expired(self, batch_size: int = PURGE_BATCH_SIZE) -> int:
+        """Удаляет просроченные токены пачками, не держа длинных блокировок."""
+        removed = _purge_batches(
+            self.bind,
+            "DELETE FROM one_time_tokens WHERE ctid IN "
+            "(SELECT ctid FROM one_time_tokens WHERE expires_at < :now LIMIT :limit)",
+            batch_size,
+        )
+        # Старая таблица сброса пароля больше не пополняется, дочищаем ее
+        removed += _purge_batches(
+            self.bind,
+            "DELETE FROM password_reset_tokens WHERE id IN "
+            "(SELECT id FROM password_reset_tokens WHERE expires_at < :now OR is_used LIMIT :limit)",
+            batch_size,
+        )
+        return removed
+
+
+def _purge_batches(bind, statement: str, batch_size: int) -> int:
+    removed = 0
+    now = datetime.utcnow()
+    while True:
+        with bind.begin() as connection:
+            deleted = connection.execute(text(statement), {"now": now, "limit": batch_size}).rowcount
+        removed += deleted
+        if deleted < batch_size:
+            return removed
+
+
+class FallbackTokenStore:
+    """Redis с откатом на Postgres: пишет в Redis, если он доступен."""
+
+    def __init__(self, primary: RedisTokenStore, fallback: PostgresTokenStore):
+        self.primary = primary
+        self.fallback = fallback
+
+    def issue(self, kind: str, key: str, value: str, ttl: timedelta) -> None:
+        from redis.exceptions import RedisError
+
+        try:
+            self.primary.issue(kind, key, value, ttl)
+        except RedisError as e:
+            logger.warning(f"Redis недоступен, токен {kind} сохраняется в Postgres: {e}")
+            self.fallback.issue(kind, key, value, ttl)
+
+    def consume(self, kind: str, key: str, expected: Optional[str] = None) -> Optional[str]:
+        from redis.exceptions import RedisError
+
+        try:
+            value = self.primary.consume(kind, key, expected)
+        except RedisError as e:
+            logger.warning(f"Redis недоступен при проверке токена {kind}: {e}")
+            value = None
+        if value is not None:
+            return value
+        return self.fallback.consume(kind, key, expected)
+
+
+@lru_cache(maxsize=1)
+def get_token_store() -> FallbackTokenStore:
+    return FallbackTokenStore(RedisTokenStore(get_redis()), PostgresTokenStore())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Хранилище одноразовых токенов")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    purge_parser = subparsers.add_parser("purge", help="Удалить просроченные токены из Postgres")
+    purge_parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "purge":
+        removed = PostgresTokenStore().purge_expired(args.batch_size)
+        logger.info(f"Удалено просроченных токенов: {removed}")
+        print(f"Удалено просроченных токенов: {removed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,6 @@
 # utils.py
-import smtplib
-from email.mime.text import MIMEText
-import requests
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
-import os
-import secrets
+from functools import lru_cache
 from jose import jwt
 from typing import Optional
 from fastapi import HTTPException, status
@@ -14,25 +9,46 @@ from .config import settings
 
 logger = logging.getLogger("sakhshop")
 
-# Настройки
-SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.yandex.ru")
-SMTP_PORT = int(os.getenv("SMTP_PORT", 465))
-SMTP_USER = os.getenv("SMTP_USER")
-SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
-SMS_API_KEY = os.getenv("SMS_API_KEY")
+# Настройки (единый источник — config.settings)
+SMS_API_KEY = settings.SMS_API_KEY
 SMS_SENDER = "SakhShop"
-SECRET_KEY = os.getenv("SECRET_KEY", secrets.token_urlsafe(32))
-REFRESH_SECRET_KEY = os.getenv("REFRESH_SECRET_KEY", secrets.token_urlsafe(32))
+SECRET_KEY = settings.SECRET_KEY
+REFRESH_SECRET_KEY = settings.REFRESH_SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Единственный CryptContext на процесс, создается при первом обращении
+@lru_cache(maxsize=1)
+def get_pwd_context():
+    from passlib.context import CryptContext
 
-def send_verification_email(email: str, token: str):
-    verification_url = f"https://sakhshop.ru/verify-email?token={token}"
-    message = MIMEText(
-        f"Для подтверждения email перейдите по ссылке: {verification_url}"
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# Синхронный клиент Redis на процесс (token_store, публикация событий)
+@lru_cache(maxsize=1)
+def get_redis():
+    import redis
+
+    return redis.Redis.from_url(settings.REDIS_URL, decode_responses=True, socket_timeout=2)
+
+# Клиент Yandex Object Storage (S3 API) на процесс: архив, выгрузки отчетов
+@lru_cache(maxsize=1)
+def get_s3_client():
+    import boto3
+
+    return boto3.client(
+        "s3",
+        endpoint_url=settings.YANDEX_S3_ENDPOINT,
+        aws_access_key_id=settings.YANDEX_S3_ACCESS_KEY,
+        aws_secret_access_key=settings.YANDEX_S3_SECRET_KEY,
+        region_name="ru-central1",
     )
-    message["Subject"] = "Подтверждение email в SakhShop"
+
+def send_email(email: str, subject: str, body: str) -> bool:
+    import smtplib
+    from email.mime.text import MIMEText
+
+    message = MIMEText(body)
+    message["Subject"] = subject
     message["From"] = settings.SMTP_USER
     message["To"] = email
     
@@ -46,10 +62,33 @@ def send_verification_email(email: str, token: str):
         logger.error(f"Ошибка отправки email: {e}")
         return False
 
+def verification_email_message(token: str) -> tuple[str, str]:
+    verification_url = f"https://sakhshop.ru/verify-email?token={token}"
+    return (
+        "Подтверждение email в SakhShop",
+        f"Для подтверждения email перейдите по ссылке: {verification_url}",
+    )
+
+def password_reset_email_message(token: str) -> tuple[str, str]:
+    reset_url = f"https://sakhshop.ru/reset-password?token={token}"
+    return (
+        "Сброс пароля в SakhShop",
+        f"Для сброса пароля перейдите по ссылке: {reset_url}\n"
+        "Если вы не запрашивали сброс, просто проигнорируйте это письмо.",
+    )
+
+def send_verification_email(email: str, token: str):
+    return send_email(email, *verification_email_message(token))
+
+def send_password_reset_email(email: str, token: str):
+    return send_email(email, *password_reset_email_message(token))
+
 def send_sms_secure(phone: str, message: str) -> bool:
     if not SMS_API_KEY:
         logger.error("SMS_API_KEY не настроен")
         return False
+    import requests
+
     try:
         response = requests.post(
             "https://sms.ru/sms/send",
@@ -68,10 +107,10 @@ def send_sms_secure(phone: str, message: str) -> bool:
         return False
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -86,4 +125,10 @@ def create_refresh_token(data: dict, expires_delta: timedelta = timedelta(days=7
     to_encode = data.copy()
     expire = datetime.utcnow() + expires_delta
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, REFRESH_SECRET_KEY, algorithm=ALGORITHM)
\ No newline at end of file
+    return jwt.encode(to_encode, REFRESH_SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_access_token(token: str) -> dict:
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+def decode_refresh_token(token: str) -> dict:
+    return jwt.decode(token, REFRESH_SECRET_KEY, algorithms=[ALGORITHM])
\ No newline at end of file
@@ -0,0 +1,35 @@
+# gunicorn.conf.py
+# Профиль для многопроцессного запуска: gunicorn -c gunicorn.conf.py app.main:app
+# Все разделяемое состояние (ключи JWT, rate limiting, кэш) берется из
+# config.settings / Redis, поэтому воркеры взаимозаменяемы.
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# WEB_CONCURRENCY задается явно в Kubernetes (по лимиту CPU пода),
+# иначе берем классическую формулу 2 * CPU + 1
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+max_workers = int(os.getenv("MAX_WORKERS", 0))
+if max_workers:
+    workers = min(workers, max_workers)
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Перезапуск воркеров с разбросом, чтобы они не рестартовали одновременно
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 1000))
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+
+def on_starting(server):
+    from app.config import settings
+
+    # Падаем до форка воркеров: с ключами-заглушками токены можно подделать
+    settings.check_jwt_keys()
+    server.log.info(f"Запуск {workers} воркеров")
@@ -21,9 +21,25 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
-from models import Base  # Импортируйте ваши модели
+import re
+
+from app.config import settings
+from app.models import Base  # Импортируйте ваши модели
+from app.partitions import PARTITIONED_TABLES
 target_metadata = Base.metadata
 
+# Помесячные секции и DEFAULT-секция создаются app.partitions, в моделях их нет
+PARTITION_RE = re.compile(rf"({'|'.join(PARTITIONED_TABLES)})_(p\d{{4}}_\d{{2}}|default)")
+
+
+def include_name(name, type_, parent_names):
+    if type_ == "table":
+        return not PARTITION_RE.fullmatch(name)
+    return True
+
+# URL базы берется из той же конфигурации, что и у приложения
+config.set_main_option("sqlalchemy.url", settings.DATABASE_URL)
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -46,6 +62,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -69,7 +86,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_name=include_name
         )
 
         with context.begin_transaction():
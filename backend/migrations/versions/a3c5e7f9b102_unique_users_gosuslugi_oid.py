@@ -0,0 +1,43 @@
+"""Make users.gosuslugi_oid unique
+
+Revision ID: a3c5e7f9b102
+Revises: f6d2a8c3e419
+Create Date: 2026-10-19 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c5e7f9b102'
+down_revision: Union[str, None] = 'f6d2a8c3e419'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Учетная запись ЕСИА остается только у пользователя с самой свежей проверкой
+    op.execute(sa.text("""
+        UPDATE users SET gosuslugi_oid = NULL, gosuslugi_verified = false, gosuslugi_checked_at = NULL
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY gosuslugi_oid ORDER BY gosuslugi_checked_at DESC NULLS LAST, id DESC
+                ) AS position
+                FROM users WHERE gosuslugi_oid IS NOT NULL
+            ) ranked
+            WHERE position > 1
+        )
+    """))
+    op.drop_index(op.f('ix_users_gosuslugi_oid'), table_name='users')
+    op.create_index(op.f('ix_users_gosuslugi_oid'), 'users', ['gosuslugi_oid'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_users_gosuslugi_oid'), table_name='users')
+    op.create_index(op.f('ix_users_gosuslugi_oid'), 'users', ['gosuslugi_oid'], unique=False)
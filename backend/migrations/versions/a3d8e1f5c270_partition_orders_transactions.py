@@ -0,0 +1,117 @@
+"""Partition orders and transactions by month
+
+Revision ID: a3d8e1f5c270
+Revises: f1a4c8e6b352
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3d8e1f5c270'
+down_revision: Union[str, None] = 'f1a4c8e6b352'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Секции на этот срок вперед; дальше их создает python -m app.partitions create
+MONTHS_AHEAD = 3
+
+FOREIGN_KEYS = {
+    'orders': [
+        ('buyer_id', 'users'),
+        ('seller_id', 'users'),
+        ('item_id', 'items'),
+        ('service_id', 'services'),
+    ],
+    'transactions': [],
+}
+EXTRA_INDEXES = {
+    'orders': [
+        ('ix_orders_buyer_id_created_at', ['buyer_id', 'created_at']),
+        ('ix_orders_seller_id_created_at', ['seller_id', 'created_at']),
+    ],
+    'transactions': [
+        ('ix_transactions_order_id', ['order_id']),
+    ],
+}
+
+
+def _add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition(table: str) -> None:
+    bind = op.get_bind()
+    legacy = f'{table}_legacy'
+    op.rename_table(table, legacy)
+    op.execute(f'ALTER INDEX ix_{table}_id RENAME TO ix_{legacy}_id')
+    op.execute(f'ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey')
+    # Последовательность id переезжает в новую таблицу вместе с текущим значением
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY NONE')
+    op.execute(f'UPDATE {legacy} SET created_at = COALESCE(updated_at, now()) WHERE created_at IS NULL')
+
+    op.execute(f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)')
+    op.alter_column(table, 'created_at', nullable=False)
+    op.create_primary_key(f'{table}_pkey', table, ['id', 'created_at'])
+    op.create_index(op.f(f'ix_{table}_id'), table, ['id'], unique=False)
+    for name, columns in EXTRA_INDEXES[table]:
+        op.create_index(name, table, columns, unique=False)
+    for column, referred in FOREIGN_KEYS[table]:
+        op.create_foreign_key(f'{table}_{column}_fkey', table, referred, [column], ['id'])
+
+    current = date.today().replace(day=1)
+    oldest = bind.execute(sa.text(f'SELECT min(created_at) FROM {legacy}')).scalar()
+    month = min(oldest.date().replace(day=1), current) if oldest else current
+    while month <= _add_months(current, MONTHS_AHEAD):
+        op.execute(
+            f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        month = _add_months(month, 1)
+    op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+    op.execute(f'INSERT INTO {table} SELECT * FROM {legacy}')
+    op.drop_table(legacy)
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+
+
+def _unpartition(table: str) -> None:
+    partitioned = f'{table}_partitioned'
+    op.rename_table(table, partitioned)
+    op.execute(f'ALTER INDEX ix_{table}_id RENAME TO ix_{partitioned}_id')
+    op.execute(f'ALTER TABLE {partitioned} RENAME CONSTRAINT {table}_pkey TO {partitioned}_pkey')
+    for name, _ in EXTRA_INDEXES[table]:
+        op.drop_index(name, table_name=partitioned)
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY NONE')
+
+    op.execute(f'CREATE TABLE {table} (LIKE {partitioned} INCLUDING DEFAULTS)')
+    op.alter_column(table, 'created_at', nullable=True)
+    op.create_primary_key(f'{table}_pkey', table, ['id'])
+    op.create_index(op.f(f'ix_{table}_id'), table, ['id'], unique=False)
+    op.execute(f'INSERT INTO {table} SELECT * FROM {partitioned}')
+    op.execute(f'DROP TABLE {partitioned} CASCADE')
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+    for column, referred in FOREIGN_KEYS[table]:
+        op.create_foreign_key(f'{table}_{column}_fkey', table, referred, [column], ['id'])
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Секционированный orders уникален только по (id, created_at), поэтому
+    # transactions.order_id больше не внешний ключ
+    op.drop_constraint('transactions_order_id_fkey', 'transactions', type_='foreignkey')
+    _partition('transactions')
+    _partition('orders')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _unpartition('orders')
+    _unpartition('transactions')
+    op.create_foreign_key('transactions_order_id_fkey', 'transactions', 'orders', ['order_id'], ['id'])
@@ -0,0 +1,204 @@
+"""Sync schema with models
+
+Revision ID: b41f0c9e2d7a
+Revises: 7573b121ae14
+Create Date: 2026-10-19 10:00:00.000000
+
+Схема раньше частично создавалась через Base.metadata.create_all при импорте
+приложения. Миграция догоняет модели и пропускает уже существующие таблицы и
+колонки, поэтому безопасна и для баз, созданных через create_all.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b41f0c9e2d7a'
+down_revision: Union[str, None] = '7573b121ae14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+ORDER_STATUS = ('PENDING', 'CONFIRMED', 'DELIVERED', 'DISPUTED', 'CANCELLED')
+TRANSACTION_STATUS = ('PENDING', 'HELD', 'COMPLETED', 'DISPUTED', 'REFUNDED')
+
+
+def _has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def _columns(table: str) -> set[str]:
+    return {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+# Значения для NOT NULL колонок в уже существующих строках: колонка добавляется
+# nullable, заполняется и только потом получает NOT NULL
+BACKFILL = {
+    ('users', 'email'): "'user' || id || '@sakhshop.invalid'",
+    ('users', 'phone'): "''",
+    ('users', 'name'): "''",
+    ('users', 'hashed_password'): "''",
+}
+
+
+def _users_columns() -> list:
+    return [
+        sa.Column('email', sa.String(length=255), nullable=False),
+        sa.Column('phone', sa.String(length=20), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('hashed_password', sa.String(length=255), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('is_admin', sa.Boolean(), nullable=True),
+        sa.Column('email_verified', sa.Boolean(), nullable=True),
+        sa.Column('phone_verified', sa.Boolean(), nullable=True),
+        sa.Column('verification_token', sa.String(length=255), nullable=True),
+        sa.Column('verification_token_expires', sa.DateTime(), nullable=True),
+        sa.Column('sms_code', sa.String(length=255), nullable=True),
+        sa.Column('sms_code_created_at', sa.DateTime(), nullable=True),
+        sa.Column('failed_login_attempts', sa.Integer(), nullable=True),
+        sa.Column('last_failed_login', sa.DateTime(), nullable=True),
+        sa.Column('refresh_token', sa.String(length=512), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    ]
+
+
+def _items_columns() -> list:
+    return [
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('characteristics', postgresql.JSON(), nullable=True),
+        sa.Column('location', sa.String(), nullable=True),
+        sa.Column('category_id', sa.Integer(), sa.ForeignKey('product_categories.id'), nullable=True),
+    ]
+
+
+def _services_columns() -> list:
+    return [
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('schedule', postgresql.JSON(), nullable=True),
+        sa.Column('location', sa.String(), nullable=True),
+        sa.Column('category_id', sa.Integer(), sa.ForeignKey('service_categories.id'), nullable=True),
+    ]
+
+
+def _add_missing_columns(table: str, columns: list) -> None:
+    existing = _columns(table)
+    for column in columns:
+        if column.name in existing:
+            continue
+        backfill = BACKFILL.get((table, column.name))
+        if backfill is None:
+            op.add_column(table, column)
+            continue
+        column.nullable = True
+        op.add_column(table, column)
+        op.execute(f'UPDATE {table} SET {column.name} = {backfill}')
+        op.alter_column(table, column.name, nullable=False)
+
+
+def _drop_columns(table: str, columns: list) -> None:
+    existing = _columns(table)
+    for column in reversed(columns):
+        if column.name in existing:
+            op.drop_column(table, column.name)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _add_missing_columns('users', _users_columns())
+    unique_constraints = sa.inspect(op.get_bind()).get_unique_constraints('users')
+    if not any(uc['column_names'] == ['email'] for uc in unique_constraints):
+        op.create_unique_constraint('users_email_key', 'users', ['email'])
+
+    if not _has_table('product_categories'):
+        op.create_table('product_categories',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=True),
+        sa.Column('parent_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['parent_id'], ['product_categories.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if not _has_table('service_categories'):
+        op.create_table('service_categories',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=True),
+        sa.Column('parent_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['parent_id'], ['service_categories.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    _add_missing_columns('items', _items_columns())
+    _add_missing_columns('services', _services_columns())
+
+    if not _has_table('password_reset_tokens'):
+        op.create_table('password_reset_tokens',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=255), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('is_used', sa.Boolean(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('token')
+        )
+        op.create_index(op.f('ix_password_reset_tokens_id'), 'password_reset_tokens', ['id'], unique=False)
+
+    if not _has_table('orders'):
+        op.create_table('orders',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('buyer_id', sa.Integer(), nullable=True),
+        sa.Column('seller_id', sa.Integer(), nullable=True),
+        sa.Column('item_id', sa.Integer(), nullable=True),
+        sa.Column('service_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.Enum(*ORDER_STATUS, name='orderstatus'), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['buyer_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['seller_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['item_id'], ['items.id'], ),
+        sa.ForeignKeyConstraint(['service_id'], ['services.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_orders_id'), 'orders', ['id'], unique=False)
+
+    if not _has_table('transactions'):
+        op.create_table('transactions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=True),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('platform_fee', sa.Float(), nullable=True),
+        sa.Column('status', sa.Enum(*TRANSACTION_STATUS, name='transactionstatus'), nullable=True),
+        sa.Column('payment_id', sa.String(length=100), nullable=True),
+        sa.Column('payment_method', sa.String(length=50), nullable=True),
+        sa.Column('payment_metadata', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['order_id'], ['orders.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_transactions_id'), 'transactions', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # upgrade пропускал существующие объекты, поэтому и здесь удаляется только
+    # то, что есть; до b41f0c9e2d7a схема совпадает с 7573b121ae14
+    op.execute('DROP INDEX IF EXISTS ix_transactions_id')
+    op.execute('DROP TABLE IF EXISTS transactions')
+    op.execute('DROP INDEX IF EXISTS ix_orders_id')
+    op.execute('DROP TABLE IF EXISTS orders')
+    op.execute('DROP INDEX IF EXISTS ix_password_reset_tokens_id')
+    op.execute('DROP TABLE IF EXISTS password_reset_tokens')
+    sa.Enum(name='transactionstatus').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='orderstatus').drop(op.get_bind(), checkfirst=True)
+    _drop_columns('services', _services_columns())
+    _drop_columns('items', _items_columns())
+    op.execute('DROP TABLE IF EXISTS service_categories')
+    op.execute('DROP TABLE IF EXISTS product_categories')
+    op.execute('ALTER TABLE users DROP CONSTRAINT IF EXISTS users_email_key')
+    _drop_columns('users', _users_columns())
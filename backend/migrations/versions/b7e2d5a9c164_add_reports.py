@@ -0,0 +1,47 @@
+"""Add reports
+
+Revision ID: b7e2d5a9c164
+Revises: a3d8e1f5c270
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d5a9c164'
+down_revision: Union[str, None] = 'a3d8e1f5c270'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('reports',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('format', sa.String(length=10), nullable=False),
+    sa.Column('params', postgresql.JSON(), nullable=False),
+    sa.Column('status', sa.Enum('PENDING', 'RUNNING', 'DONE', 'FAILED', name='reportstatus'), nullable=False),
+    sa.Column('requested_by', sa.Integer(), nullable=False),
+    sa.Column('object_key', sa.String(length=500), nullable=True),
+    sa.Column('row_count', sa.Integer(), nullable=True),
+    sa.Column('size_bytes', sa.BigInteger(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['requested_by'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_reports_requested_by'), 'reports', ['requested_by'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_reports_requested_by'), table_name='reports')
+    op.drop_table('reports')
+    sa.Enum(name='reportstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,31 @@
+"""Add users.phone_e164
+
+Revision ID: c2a8e5f17b30
+Revises: b41f0c9e2d7a
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2a8e5f17b30'
+down_revision: Union[str, None] = 'b41f0c9e2d7a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('phone_e164', sa.String(length=16), nullable=True))
+    op.create_index(op.f('ix_users_phone_e164'), 'users', ['phone_e164'], unique=False)
+    # Существующие номера заполняются отдельно: python -m app.phones backfill
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_users_phone_e164'), table_name='users')
+    op.drop_column('users', 'phone_e164')
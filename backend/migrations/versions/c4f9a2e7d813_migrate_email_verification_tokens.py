@@ -0,0 +1,44 @@
+"""Move pending email verification tokens to one_time_tokens
+
+Revision ID: c4f9a2e7d813
+Revises: b7e2d5a9c164
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f9a2e7d813'
+down_revision: Union[str, None] = 'b7e2d5a9c164'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Ссылки из писем, отправленных до token_store, продолжают работать:
+    # ключ — sha256 токена, как в token_store._hash_key; verify-email находит
+    # их в Postgres-хранилище, когда в Redis токена нет
+    op.execute("""
+        INSERT INTO one_time_tokens (kind, key, value, expires_at)
+        SELECT 'email_verification', encode(sha256(convert_to(verification_token, 'UTF8')), 'hex'),
+               id::text, verification_token_expires
+        FROM users
+        WHERE verification_token IS NOT NULL
+          AND NOT coalesce(email_verified, false)
+          AND verification_token_expires > (now() AT TIME ZONE 'utc')
+        ON CONFLICT (kind, key) DO NOTHING
+    """)
+    op.execute("""
+        UPDATE users SET verification_token = NULL, verification_token_expires = NULL
+        WHERE verification_token IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Перенесенные токены остаются в one_time_tokens и дочищаются purge
+    pass
@@ -0,0 +1,35 @@
+"""Add Gosuslugi verification to users
+
+Revision ID: d8b3f6c1a927
+Revises: c4f9a2e7d813
+Create Date: 2026-10-19 19:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8b3f6c1a927'
+down_revision: Union[str, None] = 'c4f9a2e7d813'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Проверки, которые до сих пор жили только в Redis, пользователям нужно пройти заново
+    op.add_column('users', sa.Column('gosuslugi_oid', sa.String(length=32), nullable=True))
+    op.add_column('users', sa.Column('gosuslugi_verified', sa.Boolean(), nullable=True, server_default=sa.false()))
+    op.add_column('users', sa.Column('gosuslugi_checked_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_users_gosuslugi_oid'), 'users', ['gosuslugi_oid'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_users_gosuslugi_oid'), table_name='users')
+    op.drop_column('users', 'gosuslugi_checked_at')
+    op.drop_column('users', 'gosuslugi_verified')
+    op.drop_column('users', 'gosuslugi_oid')
@@ -0,0 +1,53 @@
+"""Add seller dashboard rollups
+
+Revision ID: d9f3b6a4c815
+Revises: c2a8e5f17b30
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9f3b6a4c815'
+down_revision: Union[str, None] = 'c2a8e5f17b30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('seller_daily_stats',
+    sa.Column('seller_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('orders_pending', sa.Integer(), nullable=False),
+    sa.Column('orders_confirmed', sa.Integer(), nullable=False),
+    sa.Column('orders_delivered', sa.Integer(), nullable=False),
+    sa.Column('orders_disputed', sa.Integer(), nullable=False),
+    sa.Column('orders_cancelled', sa.Integer(), nullable=False),
+    sa.Column('completed_transactions', sa.Integer(), nullable=False),
+    sa.Column('gross_revenue', sa.Float(), nullable=False),
+    sa.Column('platform_fees', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['seller_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('seller_id', 'day')
+    )
+    op.create_table('seller_product_daily_sales',
+    sa.Column('seller_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('product_type', sa.String(length=10), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('units', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['seller_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('seller_id', 'day', 'product_type', 'product_id')
+    )
+    # Первичное заполнение: python -m app.rollups reconcile --days <глубина истории>
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('seller_product_daily_sales')
+    op.drop_table('seller_daily_stats')
@@ -0,0 +1,69 @@
+"""Check transactions.order_id against partitioned orders
+
+Revision ID: e2a7c9d4b618
+Revises: d8b3f6c1a927
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a7c9d4b618'
+down_revision: Union[str, None] = 'd8b3f6c1a927'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Внешний ключ transactions.order_id -> orders(id) невозможен: секционированный
+    # orders уникален только по (id, created_at). Ту же проверку делают триггеры.
+    # Заказ создается раньше своей транзакции, поэтому поиск ограничен секциями
+    # orders не позже transactions.created_at.
+    op.execute("""
+        CREATE FUNCTION transactions_check_order() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.order_id IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM orders WHERE id = NEW.order_id AND created_at <= NEW.created_at
+            ) THEN
+                RAISE EXCEPTION 'transactions.order_id=% не найден в orders', NEW.order_id
+                    USING ERRCODE = 'foreign_key_violation';
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER transactions_check_order
+        BEFORE INSERT OR UPDATE OF order_id, created_at ON transactions
+        FOR EACH ROW EXECUTE FUNCTION transactions_check_order()
+    """)
+    # Удаление заказа с транзакциями запрещено, как при ON DELETE NO ACTION;
+    # DROP секций при архивации (app.partitions) строковые триггеры не вызывает
+    op.execute("""
+        CREATE FUNCTION orders_check_transactions() RETURNS trigger AS $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM transactions WHERE order_id = OLD.id AND created_at >= OLD.created_at) THEN
+                RAISE EXCEPTION 'на заказ % ссылаются транзакции', OLD.id
+                    USING ERRCODE = 'foreign_key_violation';
+            END IF;
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER orders_check_transactions
+        BEFORE DELETE ON orders
+        FOR EACH ROW EXECUTE FUNCTION orders_check_transactions()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP TRIGGER orders_check_transactions ON orders')
+    op.execute('DROP FUNCTION orders_check_transactions()')
+    op.execute('DROP TRIGGER transactions_check_order ON transactions')
+    op.execute('DROP FUNCTION transactions_check_order()')
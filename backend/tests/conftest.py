@@ -0,0 +1,126 @@
+# conftest.py
+# Общие фикстуры тестов бэкенда. Тесты, которым нужны Postgres или Redis,
+# берут адреса из DATABASE_URL / REDIS_URL (как приложение) и пропускаются,
+# если сервис недоступен. Фикстуры БД работают только с базой, имя которой
+# оканчивается на _test: схема накатывается alembic-ом, таблицы очищаются
+# после каждого теста.
+import os
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+# Ключи JWT обязательны (Settings.check_jwt_keys); тесты подставляют свои
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("REFRESH_SECRET_KEY", "test-refresh-secret-key")
+
+from app.config import settings  # noqa: E402
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _redis_available() -> bool:
+    import redis
+
+    try:
+        return redis.Redis.from_url(settings.REDIS_URL, socket_connect_timeout=1).ping()
+    except redis.RedisError:
+        return False
+
+
+@pytest.fixture(scope="session")
+def redis_url() -> str:
+    if not _redis_available():
+        pytest.skip(f"Redis недоступен: {settings.REDIS_URL}")
+    return settings.REDIS_URL
+
+
+@pytest.fixture(scope="session")
+def alembic_config():
+    from alembic.config import Config
+
+    config = Config(str(BACKEND_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(BACKEND_DIR / "migrations"))
+    return config
+
+
+@pytest.fixture(scope="session")
+def db_engine(alembic_config):
+    from sqlalchemy.engine import make_url
+    from sqlalchemy.exc import OperationalError
+
+    if not (make_url(settings.DATABASE_URL).database or "").endswith("_test"):
+        pytest.skip("DATABASE_URL должен указывать на тестовую базу *_test")
+    from app.database import engine
+
+    try:
+        engine.connect().close()
+    except OperationalError as e:
+        pytest.skip(f"Postgres недоступен: {e}")
+
+    from alembic import command
+
+    command.upgrade(alembic_config, "head")
+    return engine
+
+
+@pytest.fixture
+def db(db_engine):
+    from sqlalchemy import text
+
+    from app.database import SessionLocal
+    from app.models import Base
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        tables = ", ".join(table.name for table in Base.metadata.sorted_tables)
+        with db_engine.begin() as connection:
+            connection.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+
+@pytest.fixture
+def make_user(db):
+    from app.models import User
+
+    counter = iter(range(1, 10 ** 6))
+
+    def _make_user(**values) -> User:
+        index = next(counter)
+        defaults = dict(
+            inn=f"{index:012d}", email=f"user{index}@example.com", phone="+79140000000",
+            name=f"User {index}", hashed_password="x",
+        )
+        user = User(**{**defaults, **values})
+        db.add(user)
+        db.flush()
+        return user
+
+    return _make_user
+
+
+@pytest.fixture
+def api_queries(db_engine):
+    """Запрос к API тестовым клиентом: возвращает ответ и SQL, выполненный за запрос.
+
+    С budget падает (QueryBudgetExceeded), если запрос выполнил больше budget SQL.
+    """
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.query_shaping import assert_max_queries, count_queries
+
+    client = TestClient(app)
+
+    def _request(method: str, url: str, budget: Optional[int] = None, **kwargs):
+        if budget is None:
+            counter = count_queries(db_engine)
+        else:
+            counter = assert_max_queries(budget, db_engine, label=f"{method} {url}")
+        with counter as statements:
+            response = client.request(method, url, **kwargs)
+        return response, statements
+
+    return _request
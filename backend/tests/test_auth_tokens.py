@@ -0,0 +1,50 @@
+# test_auth_tokens.py
+import re
+from datetime import datetime, timedelta
+
+from alembic import command
+from fastapi.testclient import TestClient
+from sqlalchemy import select, text
+
+from app import tasks, utils
+from app.main import app
+from app.models import Job, User
+
+
+def test_legacy_verification_link_survives_migration(db, db_engine, alembic_config):
+    command.downgrade(alembic_config, "b7e2d5a9c164")
+    try:
+        with db_engine.begin() as connection:
+            user_id = connection.execute(text(
+                "INSERT INTO users (inn, email, phone, name, hashed_password, email_verified, "
+                "verification_token, verification_token_expires) "
+                "VALUES ('000000000001', 'legacy@example.com', '+79140000000', 'Legacy', 'x', false, "
+                ":token, :expires) RETURNING id"
+            ), {"token": "legacy-token", "expires": datetime.utcnow() + timedelta(hours=1)}).scalar()
+    finally:
+        command.upgrade(alembic_config, "head")
+
+    response = TestClient(app).post("/api/auth/verify-email", json={"token": "legacy-token"})
+
+    assert response.status_code == 200
+    user = db.get(User, user_id)
+    assert user.email_verified
+    assert user.verification_token is None
+    # Токен одноразовый
+    assert TestClient(app).post("/api/auth/verify-email", json={"token": "legacy-token"}).status_code == 400
+
+
+def test_reset_token_is_created_by_task_not_stored_in_queue(db, make_user, redis_url, monkeypatch):
+    sent = []
+    monkeypatch.setattr(utils, "send_email", lambda email, subject, body: sent.append(body) or True)
+    user = make_user()
+    tasks.enqueue(db, tasks.deliver_password_reset, user_id=user.id)
+    db.commit()
+
+    (payload,) = db.execute(select(Job.payload)).scalars()
+    assert payload == {"user_id": user.id}
+    assert tasks.drain(["email"]) == {"succeeded": 1, "failed": 0}
+
+    token = re.search(r"token=(\S+)", sent[0])[1]
+    response = TestClient(app).post("/api/auth/password-reset/confirm", json={"token": token, "new_password": "new-password"})
+    assert response.status_code == 200
@@ -0,0 +1,75 @@
+# test_catalog_io.py
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.catalog_io import ImportFileError, import_items, iter_csv_rows, iter_parquet_rows
+from app.main import app
+from app.models import Item, ProductCategory
+from app.utils import create_access_token
+
+
+def _csv(*lines: str):
+    return iter_csv_rows(io.BytesIO("\n".join(["title,price,category_id", *lines]).encode("utf-8")))
+
+
+def test_unknown_category_is_reported_per_row(db, make_user):
+    seller = make_user(is_seller=True)
+    category = ProductCategory(name="Снасти")
+    db.add(category)
+    db.commit()
+
+    rows = _csv(f"Удочка,500,{category.id}", "Катушка,700,999999", "Леска,100,", "Блесна,-1,")
+    report = import_items(db, seller.id, rows, chunk_size=2)
+
+    assert report.imported == 2
+    assert report.failed == 2
+    assert [error.row for error in report.errors] == [2, 4]
+    assert "категория 999999" in report.errors[0].errors[0]
+    titles = {title for (title,) in db.query(Item.title).filter(Item.owner_id == seller.id)}
+    assert titles == {"Удочка", "Леска"}
+
+
+def test_undecodable_row_stops_import_with_offset(db, make_user):
+    seller = make_user(is_seller=True)
+    body = "title,price\n" + "".join(f"Товар {i},100\n" for i in range(5))
+    rows = iter_csv_rows(io.BytesIO(body.encode("utf-8") + "Сеть,200\n".encode("cp1251")))
+
+    with pytest.raises(ImportFileError) as error:
+        import_items(db, seller.id, rows, chunk_size=2)
+
+    assert error.value.row == 6
+    assert error.value.imported == 4
+    assert db.query(Item).filter(Item.owner_id == seller.id).count() == 4
+
+
+def test_broken_parquet_is_reported_as_file_error():
+    with pytest.raises(ImportFileError) as error:
+        list(iter_parquet_rows(io.BytesIO(b"not a parquet file")))
+    assert error.value.row == 1
+
+
+def test_location_out_of_range_is_rejected(db, make_user):
+    seller = make_user(is_seller=True)
+    rows = iter_csv_rows(io.BytesIO('title,price,location\nA,1,"46.9,142.7"\nB,1,"95,142.7"\nC,1,"46.9,190"\n'.encode()))
+
+    report = import_items(db, seller.id, rows)
+
+    assert report.imported == 1
+    assert [error.row for error in report.errors] == [2, 3]
+
+
+def test_import_endpoint_returns_400_for_unreadable_file(db, make_user):
+    seller = make_user(is_seller=True)
+    db.commit()
+    token = create_access_token(data={"sub": seller.inn})
+
+    response = TestClient(app).post(
+        "/api/sellers/me/items/import",
+        files={"file": ("catalog.csv", "title,price\nСеть,200\n".encode("cp1251"), "text/csv")},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 400
+    assert "Строка 1" in response.json()["detail"]
@@ -0,0 +1,123 @@
+# test_geo_tiles.py
+import threading
+
+import pytest
+
+from app import geo_tiles
+from app.models import Item
+from app.utils import get_redis
+
+POINTS = [(46.95, 142.73), (47.05, 142.05), (43.1, 131.9), (55.75, 37.62)]
+
+
+def _summary(member_id: int, lat: float, lon: float) -> dict:
+    return {"id": member_id, "type": "item", "title": "t", "price": 1, "lat": lat, "lon": lon, "updated_at": 0}
+
+
+def _tiles_with(client, member: str, z: int) -> list[str]:
+    return [key for key in client.scan_iter(match=f"geo:0:t:{z}:*") if client.zscore(key, member) is not None]
+
+
+def test_script_places_listing_in_python_tiles(redis_url):
+    client = get_redis()
+    geo_tiles._unlink_matching(client, "geo:*")
+    lat, lon = POINTS[0]
+
+    geo_tiles.index_listings([("item:1", _summary(1, lat, lon))])
+
+    for z in range(geo_tiles.MIN_ZOOM, geo_tiles.MAX_ZOOM + 1):
+        x, y = geo_tiles.lat_lon_to_tile(lat, lon, z)
+        cx, cy = geo_tiles.lat_lon_to_tile(lat, lon, z + geo_tiles.CLUSTER_DEPTH)
+        assert _tiles_with(client, "item:1", z) == [geo_tiles._tile_key("t", "0", z, x, y)]
+        assert client.hgetall(geo_tiles._tile_key("c", "0", z, x, y)) == {f"{cx}:{cy}": "1"}
+
+    geo_tiles.index_listings([("item:1", None)])
+    assert _tiles_with(client, "item:1", geo_tiles.MAX_ZOOM) == []
+    assert not list(client.scan_iter(match="geo:0:c:*"))
+    geo_tiles._unlink_matching(client, "geo:*")
+
+
+def test_concurrent_moves_leave_listing_in_one_tile(redis_url):
+    client = get_redis()
+    geo_tiles._unlink_matching(client, "geo:*")
+
+    errors = []
+
+    def move(offset: int):
+        try:
+            for i in range(20):
+                lat, lon = POINTS[(offset + i) % len(POINTS)]
+                geo_tiles.index_listings([("item:1", _summary(1, lat, lon))])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=move, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    for z in (geo_tiles.MIN_ZOOM, geo_tiles.MAX_ZOOM):
+        assert len(_tiles_with(client, "item:1", z)) == 1
+    cells = [int(value) for key in client.scan_iter(match=f"geo:0:c:{geo_tiles.MAX_ZOOM}:*")
+             for value in client.hvals(key)]
+    assert max(cells) == 1 and sum(cells) == 1
+    geo_tiles._unlink_matching(client, "geo:*")
+
+
+def test_rebuild_swaps_in_fresh_keys(db, make_user, redis_url):
+    client = get_redis()
+    seller = make_user(is_seller=True)
+    item = Item(title="Лодка", price=1000, owner_id=seller.id, location="46.95,142.73")
+    db.add(item)
+    db.commit()
+    stale = geo_tiles._tile_key("t", "0", 5, 0, 0)
+    client.zadd(stale, {"item:999999": 1})
+
+    assert geo_tiles.rebuild() == 1
+
+    generation = client.get(geo_tiles.GENERATION_KEY)
+    assert not client.exists(stale)
+    assert not client.exists(geo_tiles.BUILD_KEY)
+    assert {key.split(":")[1] for key in client.scan_iter(match="geo:*")} - {"gen", "seq"} == {generation}
+    x, y = geo_tiles.lat_lon_to_tile(46.95, 142.73, 10)
+    tile = geo_tiles.get_tile(10, x, y)
+    assert [entry["id"] for entry in tile["items"]] == [item.id]
+    geo_tiles._unlink_matching(client, "geo:*")
+
+
+def test_rebuild_keeps_writes_made_while_it_runs(db, make_user, redis_url, monkeypatch):
+    client = get_redis()
+    geo_tiles._unlink_matching(client, "geo:*")
+    seller = make_user(is_seller=True)
+    item = Item(title="Лодка", price=1000, owner_id=seller.id, location="46.95,142.73")
+    db.add(item)
+    db.commit()
+    member = f"item:{item.id}"
+    index_listings = geo_tiles.index_listings
+
+    def index_with_concurrent_move(entries, client=None, generation=None):
+        if generation is not None:
+            # Объявление передвинули после снимка перестройки, но до переключения
+            index_listings([(member, _summary(item.id, 55.75, 37.62))])
+        index_listings(entries, client, generation)
+
+    monkeypatch.setattr(geo_tiles, "index_listings", index_with_concurrent_move)
+    geo_tiles.rebuild()
+
+    old_x, old_y = geo_tiles.lat_lon_to_tile(46.95, 142.73, 10)
+    new_x, new_y = geo_tiles.lat_lon_to_tile(55.75, 37.62, 10)
+    assert geo_tiles.get_tile(10, old_x, old_y)["count"] == 0
+    assert [entry["id"] for entry in geo_tiles.get_tile(10, new_x, new_y)["items"]] == [item.id]
+    geo_tiles._unlink_matching(client, "geo:*")
+
+
+def test_second_rebuild_is_refused_while_one_runs(redis_url):
+    client = get_redis()
+    geo_tiles._unlink_matching(client, "geo:*")
+    client.set(geo_tiles.BUILD_KEY, "7")
+    with pytest.raises(geo_tiles.RebuildInProgress):
+        geo_tiles.rebuild()
+    assert client.get(geo_tiles.BUILD_KEY) == "7"
+    geo_tiles._unlink_matching(client, "geo:*")
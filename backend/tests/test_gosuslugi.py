@@ -0,0 +1,153 @@
+# test_gosuslugi.py
+import asyncio
+import base64
+import shutil
+import subprocess
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+
+from app import gosuslugi, gosuslugi_mock
+from app.config import settings
+from app.models import User
+
+
+@pytest.fixture
+def signing_cert(tmp_path, monkeypatch):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "sakhshop-test")])
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name).public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(datetime.utcnow()).not_valid_after(datetime.utcnow() + timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = tmp_path / "esia.crt", tmp_path / "esia.key"
+    cert_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    ))
+    monkeypatch.setattr(settings, "GOSUSLUGI_CERT_PATH", str(cert_path))
+    monkeypatch.setattr(settings, "GOSUSLUGI_KEY_PATH", str(key_path))
+    return cert_path
+
+
+def test_authorization_url_carries_signature(signing_cert, tmp_path):
+    url = gosuslugi.GosuslugiClient("https://esia.test").authorization_url("state-1")
+    params = {key: values[0] for key, values in parse_qs(urlparse(url).query).items()}
+
+    assert params["state"] == "state-1"
+    message = f"{params['scope']}{params['timestamp']}{params['client_id']}{params['state']}"
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl не установлен")
+    signature, content = tmp_path / "secret.der", tmp_path / "message"
+    signature.write_bytes(base64.urlsafe_b64decode(params["client_secret"]))
+    content.write_text(message, encoding="utf-8")
+    result = subprocess.run(
+        ["openssl", "cms", "-verify", "-binary", "-inform", "DER", "-in", signature,
+         "-content", content, "-CAfile", signing_cert, "-out", "/dev/null"],
+        capture_output=True, text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_unconfigured_signing_is_unavailable(monkeypatch):
+    monkeypatch.setattr(settings, "GOSUSLUGI_CERT_PATH", None)
+    with pytest.raises(gosuslugi.HTTPException) as error:
+        gosuslugi.GosuslugiClient("https://esia.test").authorization_url("state-1")
+    assert error.value.status_code == 503
+
+
+def test_verification_is_persisted_on_user(db, make_user, signing_cert):
+    user = make_user()
+    db.commit()
+
+    async def verify():
+        client = gosuslugi.GosuslugiClient("http://esia.test")
+        client._http = httpx.AsyncClient(transport=httpx.ASGITransport(app=gosuslugi_mock.app), base_url=client.base_url)
+        try:
+            return await client.verify_user(user.id, "code-1")
+        finally:
+            await client.close()
+
+    verification = asyncio.run(verify())
+
+    db.expire_all()
+    stored = db.get(User, user.id)
+    assert verification.verified
+    assert stored.gosuslugi_oid == verification.oid
+    assert gosuslugi.is_verified(stored)
+    expired = stored.gosuslugi_checked_at + timedelta(seconds=settings.GOSUSLUGI_VERIFICATION_TTL_SECONDS + 1)
+    assert not gosuslugi.is_verified(stored, now=expired)
+
+
+def test_breaker_opens_then_lets_one_probe_through(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(gosuslugi.time, "monotonic", lambda: now[0])
+    breaker = gosuslugi.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    for _ in range(2):
+        assert breaker.before_request() is False
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(gosuslugi.GosuslugiUnavailable):
+        breaker.before_request()
+
+    now[0] += 30
+    assert breaker.state == "half-open"
+    assert breaker.before_request() is True
+    with pytest.raises(gosuslugi.GosuslugiUnavailable):
+        breaker.before_request()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    now[0] += 30
+    assert breaker.before_request() is True
+    breaker.record_success()
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+
+
+def test_cancelled_probe_releases_half_open_slot(monkeypatch):
+    async def hang(request):
+        await asyncio.sleep(10)
+
+    async def probe_and_cancel():
+        client = gosuslugi.GosuslugiClient("http://esia.test")
+        client._http = httpx.AsyncClient(transport=httpx.MockTransport(hang), base_url=client.base_url)
+        client.breaker.opened_at = gosuslugi.time.monotonic() - client.breaker.reset_timeout
+        request = asyncio.create_task(client._request("GET", "/ping"))
+        await asyncio.sleep(0.05)
+        assert client.breaker.probing
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        await client.close()
+        return client.breaker
+
+    breaker = asyncio.run(probe_and_cancel())
+
+    assert breaker.state == "half-open"
+    assert breaker.probing is False
+    assert breaker.before_request() is True
+
+
+def test_esia_account_cannot_be_linked_twice(db, make_user):
+    first, second = make_user(), make_user()
+    db.commit()
+    verification = gosuslugi.Verification(oid="1000001", verified=True, checked_at=datetime.utcnow())
+
+    gosuslugi.save_verification(first.id, verification)
+    with pytest.raises(gosuslugi.HTTPException) as error:
+        gosuslugi.save_verification(second.id, verification)
+
+    assert error.value.status_code == 409
+    db.expire_all()
+    assert db.get(User, second.id).gosuslugi_oid is None
@@ -0,0 +1,77 @@
+# test_http_cache.py
+from datetime import datetime, timedelta
+from email.utils import format_datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.http_cache import make_etag
+from app.main import app
+from app.models import Item
+
+PRODUCTS = "/api/mobile/products"
+
+
+@pytest.fixture
+def client(db, make_user):
+    seller = make_user(is_seller=True)
+    db.add_all(
+        Item(title=f"Товар {i}", description="Описание товара " * 5, price=100 + i, owner_id=seller.id)
+        for i in range(30)
+    )
+    db.commit()
+    return TestClient(app)
+
+
+def test_etag_depends_on_every_part():
+    assert make_etag("items", 3, None) == make_etag("items", 3, None)
+    assert make_etag("items", 3, None) != make_etag("items", 4, None)
+    assert make_etag("items", 3, None).startswith('W/"')
+
+
+def test_if_none_match_returns_304(client):
+    first = client.get(PRODUCTS)
+    etag = first.headers["etag"]
+
+    cached = client.get(PRODUCTS, headers={"If-None-Match": etag.removeprefix("W/")})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+    assert "Accept-Encoding" in cached.headers["vary"]
+
+    assert client.get(PRODUCTS, headers={"If-None-Match": '"other"'}).status_code == 200
+    # Разные страницы — разные валидаторы
+    assert client.get(f"{PRODUCTS}?limit=5").headers["etag"] != etag
+
+
+def test_if_modified_since_returns_304(client):
+    last_modified = client.get(PRODUCTS).headers["last-modified"]
+
+    assert client.get(PRODUCTS, headers={"If-Modified-Since": last_modified}).status_code == 304
+    earlier = format_datetime(datetime.utcnow() - timedelta(days=1), usegmt=False)
+    assert client.get(PRODUCTS, headers={"If-Modified-Since": earlier}).status_code == 200
+
+
+def test_change_invalidates_etag(client, db):
+    etag = client.get(PRODUCTS).headers["etag"]
+    item = db.query(Item).first()
+    item.price += 1
+    db.commit()
+
+    response = client.get(PRODUCTS, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("br, gzip", "br"),
+    ("gzip", "gzip"),
+    ("identity", None),
+])
+def test_compression_negotiation(client, accept_encoding, expected):
+    response = client.get(PRODUCTS, headers={"Accept-Encoding": accept_encoding})
+
+    assert response.status_code == 200
+    assert response.headers.get("content-encoding") == expected
+    assert response.headers["vary"].split(", ").count("Accept-Encoding") == 1
+    assert len(response.json()) == 30
@@ -0,0 +1,43 @@
+# test_listeners.py
+# Обработчики событий сессии регистрируются при первой сессии, а не импортом
+# модулей; роллапы читают заказы одним запросом на flush.
+import pytest
+from sqlalchemy import event
+
+from app import geo_tiles, realtime, recommendations, rollups
+from app.database import SessionLocal
+from app.models import Item, Order, OrderStatus, SellerDailyStats, Transaction, TransactionStatus
+from app.query_shaping import count_queries
+
+
+@pytest.mark.parametrize("module, name, handler", [
+    (rollups, "after_flush", "_update_rollups"),
+    (realtime, "after_commit", "_publish_events"),
+    (geo_tiles, "after_commit", "_apply_updates"),
+    (recommendations, "after_flush", "_collect_orders"),
+])
+def test_first_session_installs_listeners(module, name, handler):
+    SessionLocal().close()
+    assert event.contains(SessionLocal, name, getattr(module, handler))
+
+
+def test_rollups_read_orders_once_per_flush(db, make_user):
+    seller, buyer = make_user(is_seller=True), make_user()
+    item = Item(title="Лодка", price=1000, owner_id=seller.id)
+    db.add(item)
+    db.flush()
+    orders = [Order(buyer_id=buyer.id, seller_id=seller.id, item_id=item.id, status=OrderStatus.CONFIRMED)
+              for _ in range(3)]
+    db.add_all(orders)
+    db.commit()
+
+    db.add_all(Transaction(order_id=order.id, amount=1000, status=TransactionStatus.COMPLETED) for order in orders)
+    with count_queries() as statements:
+        db.commit()
+
+    order_reads = [statement for statement in statements if statement.lstrip().startswith("SELECT") and "FROM orders" in statement]
+    assert len(order_reads) == 1
+    stats = db.query(SellerDailyStats).filter(SellerDailyStats.seller_id == seller.id).one()
+    assert stats.completed_transactions == 3
+    assert stats.gross_revenue == 3000
+    assert stats.orders_confirmed == 3
@@ -0,0 +1,24 @@
+# test_migrations.py
+from alembic import command
+from sqlalchemy import inspect, text
+
+
+def test_sync_schema_backfills_existing_users(db, db_engine, alembic_config):
+    command.downgrade(alembic_config, "7573b121ae14")
+    try:
+        assert "email" not in {c["name"] for c in inspect(db_engine).get_columns("users")}
+        with db_engine.begin() as connection:
+            user_id = connection.execute(text(
+                "INSERT INTO users (inn, is_seller) VALUES ('000000000001', false) RETURNING id"
+            )).scalar()
+    finally:
+        command.upgrade(alembic_config, "head")
+
+    with db_engine.connect() as connection:
+        email, phone = connection.execute(
+            text("SELECT email, phone FROM users WHERE id = :id"), {"id": user_id}
+        ).one()
+    assert email == f"user{user_id}@sakhshop.invalid"
+    assert phone == ""
+    columns = {c["name"]: c for c in inspect(db_engine).get_columns("users")}
+    assert not columns["email"]["nullable"]
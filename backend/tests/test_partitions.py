@@ -0,0 +1,42 @@
+# test_partitions.py
+from datetime import datetime
+
+import pytest
+from sqlalchemy import delete, text
+from sqlalchemy.exc import IntegrityError
+
+from app import partitions
+from app.models import Order, Transaction
+
+
+def test_ensure_partitions_moves_rows_out_of_default(db, db_engine):
+    month = partitions.add_months(partitions.month_start(datetime.utcnow().date()), partitions.PARTITION_MONTHS_AHEAD)
+    name = partitions.partition_name("orders", month)
+    with db_engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE {name}"))
+    db.add(Order(created_at=datetime(month.year, month.month, 15)))
+    db.commit()
+
+    assert partitions.ensure_partitions() == 1
+
+    with db_engine.connect() as connection:
+        assert connection.execute(text(f"SELECT count(*) FROM {name}")).scalar() == 1
+        assert connection.execute(text("SELECT count(*) FROM orders_default")).scalar() == 0
+        assert month in partitions._partitions(connection, "orders")
+
+
+def test_transaction_order_id_is_checked(db):
+    order = Order()
+    db.add(order)
+    db.commit()
+    db.add(Transaction(order_id=order.id, amount=100))
+    db.commit()
+
+    db.add(Transaction(order_id=order.id + 1000, amount=100))
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+
+    # Core-удаление: ORM сам обнулил бы transactions.order_id, как и при обычном FK
+    with pytest.raises(IntegrityError):
+        db.execute(delete(Order).where(Order.id == order.id))
@@ -0,0 +1,35 @@
+# test_phones.py
+import pytest
+
+from app import phones
+from app.models import User
+
+
+@pytest.mark.parametrize("phone", [
+    "89141234567",
+    "+79141234567",
+    "+7 914 123-45-67",
+    "8 (914) 123 45 67",
+])
+def test_normalize_phone_to_e164(phone):
+    assert phones.normalize_phone(phone) == "+79141234567"
+
+
+@pytest.mark.parametrize("phone", ["12345", "abc", "", "+7 000 000-00-00"])
+def test_invalid_phone_is_rejected(phone):
+    assert phones.normalize_phone(phone) is None
+    assert not phones.is_valid_phone(phone)
+
+
+def test_backfill_fills_e164_in_chunks(db, make_user):
+    valid = [make_user(phone=phone) for phone in ("89141234567", "+7 914 765-43-21", "8 (914) 000 11 22")]
+    invalid = make_user(phone="12345")
+    done = make_user(phone="89140000001", phone_e164="+79140000001")
+    db.commit()
+
+    assert phones.backfill(chunk_size=2, processes=1) == (4, 1)
+
+    db.expire_all()
+    assert [user.phone_e164 for user in valid] == ["+79141234567", "+79147654321", "+79140001122"]
+    assert db.get(User, invalid.id).phone_e164 is None
+    assert db.get(User, done.id).phone_e164 == "+79140000001"
@@ -0,0 +1,61 @@
+# test_query_budgets.py
+# Бюджеты SQL-запросов эндпоинтов: число запросов не зависит от размера выдачи.
+import pytest
+
+from app.models import Item, Report, Service
+from app.query_shaping import QueryBudgetExceeded
+from app.utils import create_access_token
+
+LISTINGS = 30
+
+
+@pytest.fixture
+def catalog(db, make_user):
+    seller = make_user(is_seller=True)
+    db.add_all(
+        Item(title=f"Товар {i}", price=100 + i, owner_id=seller.id, location=f"46.9{i % 10},142.7{i % 10}")
+        for i in range(LISTINGS)
+    )
+    db.add_all(
+        Service(title=f"Услуга {i}", price=500 + i, provider_id=seller.id, location=f"46.9{i % 10},142.7{i % 10}")
+        for i in range(LISTINGS)
+    )
+    db.commit()
+
+
+@pytest.mark.parametrize("path, budget", [
+    ("/api/mobile/products?limit=100", 2),
+    ("/api/mobile/services?limit=100", 2),
+    ("/api/mobile/search/nearby?lat=46.96&lon=142.73&radius=10", 2),
+])
+def test_catalog_listing_budget(catalog, api_queries, path, budget):
+    response, _ = api_queries("GET", path, budget=budget)
+
+    assert response.status_code == 200
+    assert len(response.json()) >= LISTINGS
+
+
+def test_admin_reports_listing_budget(db, make_user, api_queries):
+    admin = make_user(is_admin=True)
+    db.add_all(
+        Report(kind="users_by_period", format="csv", params={}, requested_by=admin.id)
+        for _ in range(LISTINGS)
+    )
+    db.commit()
+    token = create_access_token(data={"sub": admin.inn})
+
+    # Пользователь из токена + страница отчетов
+    response, _ = api_queries(
+        "GET", "/api/admin/reports", budget=2, headers={"Authorization": f"Bearer {token}"},
+    )
+
+    assert response.status_code == 200
+    assert len(response.json()) == LISTINGS
+
+
+def test_budget_overrun_lists_statements(catalog, api_queries):
+    with pytest.raises(QueryBudgetExceeded) as error:
+        api_queries("GET", "/api/mobile/products?limit=100", budget=0)
+
+    assert "GET /api/mobile/products?limit=100" in str(error.value)
+    assert "SELECT" in str(error.value)
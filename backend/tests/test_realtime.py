@@ -0,0 +1,83 @@
+# test_realtime.py
+import asyncio
+import threading
+
+import pytest
+
+from app import realtime
+
+
+async def _next_batch(subscriber: realtime.Subscriber, heartbeat: float = 1.0):
+    return await asyncio.wait_for(anext(subscriber.batches(heartbeat)), 5)
+
+
+def test_events_for_one_entity_are_coalesced():
+    async def scenario():
+        subscriber = realtime.Subscriber()
+        subscriber.push({"type": "order", "id": 1, "status": "pending"})
+        subscriber.push({"type": "order", "id": 1, "status": "confirmed"})
+        subscriber.push({"type": "slot", "id": 1, "is_booked": True})
+        return await _next_batch(subscriber)
+
+    batch = asyncio.run(scenario())
+    assert batch == [{"type": "order", "id": 1, "status": "confirmed"}, {"type": "slot", "id": 1, "is_booked": True}]
+
+
+def test_overflow_raises_slow_consumer():
+    async def scenario():
+        subscriber = realtime.Subscriber(max_pending=2)
+        for order_id in range(3):
+            subscriber.push({"type": "order", "id": order_id, "status": "pending"})
+        await _next_batch(subscriber)
+
+    with pytest.raises(realtime.SlowConsumer):
+        asyncio.run(scenario())
+
+
+def test_publish_reaches_subscriber_until_disconnect(redis_url):
+    channel = realtime.user_orders_channel(424242)
+
+    async def scenario():
+        hub = realtime.Hub()
+        subscriber = realtime.Subscriber()
+        await hub.subscribe(subscriber, [channel])
+        try:
+            await asyncio.to_thread(realtime.publish, [(channel, {"type": "order", "id": 7, "status": "delivered"})])
+            batch = await _next_batch(subscriber)
+
+            hub.unsubscribe(subscriber, [channel])
+            await asyncio.sleep(0)
+            remaining = [batch async for batch in subscriber.batches(heartbeat=1.0)]
+            return batch, remaining, dict(hub.channels)
+        finally:
+            await hub.close()
+
+    batch, remaining, channels = asyncio.run(scenario())
+    assert batch == [{"type": "order", "id": 7, "status": "delivered"}]
+    assert remaining == []
+    assert channels == {}
+
+
+def test_service_ids_are_validated_and_capped():
+    assert realtime.parse_service_ids("3,1,3,") == [3, 1]
+    for value in ("1,x", "0", "-5", ",".join(map(str, range(1, realtime.MAX_SERVICE_SUBSCRIPTIONS + 2)))):
+        with pytest.raises(ValueError):
+            realtime.parse_service_ids(value)
+
+
+def test_commit_does_not_wait_for_redis(monkeypatch):
+    released = threading.Event()
+    published = []
+
+    def slow_publish(events):
+        released.wait(5)
+        published.extend(events)
+
+    monkeypatch.setattr(realtime, "publish", slow_publish)
+    publisher = realtime.Publisher()
+    publisher.submit([("rt:test", {"type": "order", "id": 1})])
+    assert published == []
+
+    released.set()
+    publisher.join()
+    assert published == [("rt:test", {"type": "order", "id": 1})]
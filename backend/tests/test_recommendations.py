@@ -0,0 +1,103 @@
+# test_recommendations.py
+import json
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+
+from app import recommendations
+from app.recommendations import SimilarityIndex, _lsh_codes
+from app.utils import get_redis
+
+
+def _write_index(path, n: int = 2000, dim: int = 16):
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    planes = rng.standard_normal((recommendations.LSH_TABLES * recommendations.LSH_BITS, dim)).astype(np.float32)
+    np.save(path / "vectors.npy", vectors)
+    np.save(path / "planes.npy", planes)
+    np.save(path / "codes.npy", _lsh_codes(vectors, planes))
+    meta = [{"type": "item", "id": i, "title": f"t{i}", "price": i} for i in range(n)]
+    (path / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+
+def test_bucket_candidates_match_full_code_scan(tmp_path):
+    _write_index(tmp_path)
+    index = SimilarityIndex(str(tmp_path))
+
+    for row in (0, 17, 1999):
+        codes = index.codes[row]
+        bucketed = np.unique(np.concatenate([table[code] for table, code in zip(index.buckets, codes.tolist())]))
+        assert np.array_equal(bucketed, np.flatnonzero((index.codes == codes).any(axis=1)))
+
+
+def test_similar_returns_ranked_neighbours(tmp_path):
+    _write_index(tmp_path)
+    index = SimilarityIndex(str(tmp_path))
+
+    result = index.similar("item", 17, limit=5)
+
+    assert len(result) == 5
+    assert all(entry["id"] != 17 for entry in result)
+    scores = [entry["score"] for entry in result]
+    assert scores == sorted(scores, reverse=True)
+    assert index.similar("item", 10 ** 6) is None
+
+
+def test_prune_keeps_current_and_previous_versions(tmp_path):
+    for version in ("20240101000000", "20240102000000", "20240103000000", "20240104000000"):
+        (tmp_path / version).mkdir()
+    (tmp_path / "CURRENT").write_text("20240103000000")
+
+    recommendations._prune_versions(str(tmp_path), "20240103000000")
+
+    # Более новая версия — сборка, которая еще не переключила CURRENT
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "20240102000000", "20240103000000", "20240104000000", "CURRENT"]
+
+
+def test_refresh_popular_keeps_orders_made_while_it_runs(redis_url, monkeypatch):
+    client = get_redis()
+    for key in client.scan_iter(match="reco:*"):
+        client.delete(key)
+    location = "46.95,142.73"
+    key = recommendations._popular_keys(46.95, 142.73)[0]
+    client.zadd("reco:popular:5:stale", {"item:9": 1})
+
+    def scores_with_concurrent_order(days):
+        # Заказ 2 закоммичен после снимка, пока пересчет еще идет
+        session = SimpleNamespace(info={"popular_updates": [(2, "item:5", location)]})
+        recommendations._apply_orders(session)
+        return {key: Counter({"item:1": 3.0})}, {1}
+
+    monkeypatch.setattr(recommendations, "_popular_scores", scores_with_concurrent_order)
+    recommendations.refresh_popular()
+
+    assert client.zrange(key, 0, -1, withscores=True) == [("item:5", 1.0), ("item:1", 3.0)]
+    assert not client.exists("reco:popular:5:stale")
+    assert not list(client.scan_iter(match="reco:popular_*"))
+
+
+def test_refresh_popular_replays_orders_after_pending_read(redis_url, monkeypatch):
+    client = get_redis()
+    for key in client.scan_iter(match="reco:*"):
+        client.delete(key)
+    key = recommendations._popular_keys(46.95, 142.73)[0]
+
+    class LateOrderClient:
+        def __getattr__(self, name):
+            return getattr(client, name)
+
+        def hgetall(self, name):
+            pending = client.hgetall(name)
+            # Заказ 3 закоммичен между чтением очереди и переключением ключей
+            recommendations._apply_orders(SimpleNamespace(info={"popular_updates": [(3, "item:7", "46.95,142.73")]}))
+            return pending
+
+    monkeypatch.setattr(recommendations, "get_redis", LateOrderClient)
+    monkeypatch.setattr(recommendations, "_popular_scores", lambda days: ({key: Counter({"item:1": 3.0})}, {1}))
+    recommendations.refresh_popular()
+
+    assert client.zrange(key, 0, -1, withscores=True) == [("item:7", 1.0), ("item:1", 3.0)]
+    assert not client.exists(recommendations.POPULAR_PENDING_KEY)
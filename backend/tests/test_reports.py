@@ -0,0 +1,70 @@
+# test_reports.py
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app import reports, tasks
+from app.models import Job, JobStatus, Report, ReportStatus
+
+
+@pytest.fixture
+def report(db, make_user):
+    report = Report(kind="users_by_period", format="csv", requested_by=make_user(is_admin=True).id,
+                    params={"date_from": "2026-01-01", "date_to": "2026-01-31"})
+    db.add(report)
+    db.commit()
+    return report
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    keys = []
+
+    def render(kind, params, file_format, out):
+        out.write(b"id\n")
+        return 0
+
+    monkeypatch.setattr(reports, "render", render)
+    monkeypatch.setattr(reports, "_upload", lambda out, key, file_format: keys.append(key))
+    return keys
+
+
+def test_build_report_skips_report_already_running(db, report, uploads):
+    report.status, report.started_at = ReportStatus.RUNNING, datetime.utcnow()
+    db.commit()
+
+    reports.build_report(reports.BuildReportPayload(report_id=report.id))
+
+    assert uploads == []
+    db.refresh(report)
+    assert report.status == ReportStatus.RUNNING
+
+
+def test_build_report_takes_over_abandoned_report(db, report, uploads):
+    report.status = ReportStatus.RUNNING
+    report.started_at = datetime.utcnow() - reports.RUN_TIMEOUT - timedelta(minutes=1)
+    db.commit()
+
+    reports.build_report(reports.BuildReportPayload(report_id=report.id))
+    reports.build_report(reports.BuildReportPayload(report_id=report.id))
+
+    assert uploads == [reports.object_key(report)]
+    db.refresh(report)
+    assert report.status == ReportStatus.DONE
+
+
+def test_dead_lettered_job_fails_its_report(db, report):
+    tasks.enqueue(db, reports.build_report, report_id=report.id)
+    report.status, report.started_at = ReportStatus.RUNNING, datetime.utcnow()
+    db.commit()
+    # Воркер падал на отчете все попытки и перестал слать heartbeat
+    stale = datetime.utcnow() - tasks.VISIBILITY_TIMEOUT - timedelta(minutes=1)
+    db.execute(update(Job).values(status=JobStatus.RUNNING, attempts=Job.max_attempts, locked_at=stale))
+    db.commit()
+
+    assert tasks.requeue_stale() == 0
+
+    db.refresh(report)
+    assert report.status == ReportStatus.FAILED
+    assert report.error.startswith("Нет heartbeat")
@@ -0,0 +1,105 @@
+# test_rollups.py
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import update
+
+from app import rollups
+from app.database import SessionLocal
+from app.models import (
+    Item,
+    Order,
+    OrderStatus,
+    SellerDailyStats,
+    SellerProductDailySales,
+    Transaction,
+    TransactionStatus,
+)
+
+
+@pytest.fixture
+def sale(db, make_user):
+    seller, buyer = make_user(is_seller=True), make_user()
+    item = Item(title="Лодка", price=1000, owner_id=seller.id)
+    db.add(item)
+    db.flush()
+    order = Order(buyer_id=buyer.id, seller_id=seller.id, item_id=item.id, status=OrderStatus.PENDING)
+    db.add(order)
+    db.commit()
+    return seller, item, order
+
+
+def _stats(db, seller_id: int) -> SellerDailyStats:
+    db.expire_all()
+    return db.query(SellerDailyStats).filter(SellerDailyStats.seller_id == seller_id).one()
+
+
+def test_order_status_transitions_move_counts(db, sale):
+    seller, _, order = sale
+    assert _stats(db, seller.id).orders_pending == 1
+
+    order.status = OrderStatus.CONFIRMED
+    db.commit()
+    order.status = OrderStatus.CANCELLED
+    db.commit()
+
+    stats = _stats(db, seller.id)
+    assert (stats.orders_pending, stats.orders_confirmed, stats.orders_cancelled) == (0, 0, 1)
+
+
+def test_refund_reverses_revenue(db, sale):
+    seller, item, order = sale
+    transaction = Transaction(order_id=order.id, amount=1000, platform_fee=0.1, status=TransactionStatus.PENDING)
+    db.add(transaction)
+    db.commit()
+    assert _stats(db, seller.id).completed_transactions == 0
+
+    transaction.status = TransactionStatus.COMPLETED
+    db.commit()
+    stats = _stats(db, seller.id)
+    assert (stats.completed_transactions, stats.gross_revenue, stats.platform_fees) == (1, 1000, 100)
+    sales = db.query(SellerProductDailySales).filter(SellerProductDailySales.product_id == item.id).one()
+    assert (sales.units, sales.revenue) == (1, 900)
+
+    transaction.status = TransactionStatus.REFUNDED
+    db.commit()
+    stats = _stats(db, seller.id)
+    assert (stats.completed_transactions, stats.gross_revenue, stats.platform_fees) == (0, 0, 0)
+
+
+def test_reconcile_corrects_drift(db, sale):
+    seller, _, order = sale
+    db.add(Transaction(order_id=order.id, amount=500, platform_fee=0, status=TransactionStatus.COMPLETED))
+    db.commit()
+    db.execute(update(SellerDailyStats).values(orders_pending=7, gross_revenue=1))
+    db.commit()
+
+    today = datetime.utcnow().date()
+    assert rollups.reconcile(today, today) == 1
+
+    stats = _stats(db, seller.id)
+    assert (stats.orders_pending, stats.completed_transactions, stats.gross_revenue) == (1, 1, 500)
+
+
+def test_reconcile_waits_for_uncommitted_deltas(db, sale):
+    seller, _, order = sale
+    writer = SessionLocal()
+    try:
+        writer.get(Order, order.id).status = OrderStatus.CONFIRMED
+        writer.flush()
+
+        today = datetime.utcnow().date()
+        reconciler = threading.Thread(target=rollups.reconcile, args=(today, today))
+        reconciler.start()
+        reconciler.join(0.5)
+        assert reconciler.is_alive()
+
+        writer.commit()
+        reconciler.join(10)
+        assert not reconciler.is_alive()
+    finally:
+        writer.close()
+
+    stats = _stats(db, seller.id)
+    assert (stats.orders_pending, stats.orders_confirmed) == (0, 1)
@@ -0,0 +1,22 @@
+# test_startup.py
+# Бюджет холодного старта: импорт app.main в отдельном процессе под
+# `python -X importtime` (см. app/startup_budget.py)
+import pytest
+
+from app.startup_budget import DEFAULT_BUDGET_MS, LAZY_MODULES, TARGET_MODULE, measure_import
+
+
+@pytest.fixture(scope="module")
+def import_timings():
+    return measure_import()
+
+
+def test_import_fits_budget(import_timings):
+    total_ms = import_timings[TARGET_MODULE] / 1000
+    slowest = sorted(import_timings.items(), key=lambda kv: kv[1], reverse=True)[:10]
+    assert total_ms <= DEFAULT_BUDGET_MS, f"{TARGET_MODULE}: {total_ms:.0f} мс > {DEFAULT_BUDGET_MS} мс; {slowest}"
+
+
+@pytest.mark.parametrize("module", LAZY_MODULES)
+def test_heavy_module_stays_lazy(import_timings, module):
+    assert module not in import_timings, f"{module} загружается при импорте {TARGET_MODULE}"
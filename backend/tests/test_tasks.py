@@ -0,0 +1,165 @@
+# test_tasks.py
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from pydantic import BaseModel
+from sqlalchemy import select, update
+
+from app import tasks
+from app.models import Job, JobStatus
+
+QUEUE = "test"
+calls: list[str] = []
+
+
+class EchoPayload(BaseModel):
+    value: str
+
+
+@tasks.task(QUEUE, name="test_echo")
+def echo(payload: EchoPayload):
+    calls.append(payload.value)
+
+
+@tasks.task(QUEUE, name="test_broken", max_attempts=2)
+def broken(payload: EchoPayload):
+    raise RuntimeError(payload.value)
+
+
+@tasks.task(QUEUE, name="test_slow")
+def slow(payload: EchoPayload):
+    # Задача «идет» дольше VISIBILITY_TIMEOUT: locked_at сдвигается в прошлое
+    stale = datetime.utcnow() - tasks.VISIBILITY_TIMEOUT - timedelta(minutes=1)
+    with tasks.engine.begin() as connection:
+        connection.execute(update(Job).where(Job.task == "test_slow").values(locked_at=stale))
+    time.sleep(0.3)
+    calls.append(f"requeued={tasks.requeue_stale()}")
+
+
+@pytest.fixture(autouse=True)
+def _reset_calls():
+    calls.clear()
+
+
+def _jobs(db) -> list[Job]:
+    db.expire_all()
+    return db.execute(select(Job).order_by(Job.id)).scalars().all()
+
+
+def test_claim_skips_rows_locked_by_another_worker(db, db_engine):
+    tasks.enqueue(db, echo, value="first")
+    tasks.enqueue(db, echo, value="second")
+    db.commit()
+    first, second = _jobs(db)
+
+    with db_engine.connect() as other:
+        other.execute(select(Job.id).where(Job.id == first.id).with_for_update())
+        claimed = tasks._claim(QUEUE, "test-worker")
+        other.rollback()
+
+    assert claimed.id == second.id
+    assert claimed.attempts == 1
+    assert tasks._claim(QUEUE, "test-worker").id == first.id
+    assert tasks._claim(QUEUE, "test-worker") is None
+
+
+def test_failure_is_retried_with_backoff(db, monkeypatch):
+    monkeypatch.setattr(tasks.random, "uniform", lambda low, high: high)
+    tasks.enqueue(db, broken, value="boom")
+    db.commit()
+
+    started = datetime.utcnow()
+    assert tasks.drain([QUEUE]) == {"succeeded": 0, "failed": 1}
+
+    (job,) = _jobs(db)
+    assert job.status == JobStatus.QUEUED
+    assert job.attempts == 1
+    assert job.last_error == "RuntimeError: boom"
+    expected = tasks.RETRY_BASE_SECONDS * 2
+    assert started + timedelta(seconds=expected - 1) <= job.run_at <= datetime.utcnow() + timedelta(seconds=expected)
+
+
+def test_retry_delay_is_capped():
+    for attempts in (0, 3, 30):
+        cap = min(tasks.RETRY_CAP_SECONDS, tasks.RETRY_BASE_SECONDS * 2 ** attempts)
+        assert timedelta() <= tasks.retry_delay(attempts) <= timedelta(seconds=cap)
+
+
+def test_exhausted_job_is_dead_lettered(db):
+    tasks.enqueue(db, broken, value="boom")
+    db.commit()
+    tasks.drain([QUEUE])
+    db.execute(update(Job).values(run_at=datetime.utcnow()))
+    db.commit()
+
+    assert tasks.drain([QUEUE]) == {"succeeded": 0, "failed": 1}
+    (job,) = _jobs(db)
+    assert job.status == JobStatus.DEAD
+    assert job.attempts == 2
+
+    assert tasks.retry_dead(QUEUE) == 1
+    (job,) = _jobs(db)
+    assert (job.status, job.attempts) == (JobStatus.QUEUED, 0)
+
+
+def test_requeue_stale_dead_letters_exhausted_jobs(db):
+    tasks.enqueue(db, echo, value="crashed-once")
+    tasks.enqueue(db, broken, value="crashes-worker")
+    db.commit()
+    crashed_once, poison = _jobs(db)
+    stale = datetime.utcnow() - tasks.VISIBILITY_TIMEOUT - timedelta(minutes=1)
+    db.execute(update(Job).where(Job.id == crashed_once.id).values(status=JobStatus.RUNNING, attempts=1, locked_at=stale))
+    db.execute(update(Job).where(Job.id == poison.id).values(status=JobStatus.RUNNING, attempts=2, locked_at=stale))
+    db.commit()
+
+    assert tasks.requeue_stale() == 1
+
+    crashed_once, poison = _jobs(db)
+    assert (crashed_once.status, crashed_once.locked_at) == (JobStatus.QUEUED, None)
+    assert poison.status == JobStatus.DEAD
+    assert tasks.drain([QUEUE]) == {"succeeded": 1, "failed": 0}
+    assert calls == ["crashed-once"]
+
+
+def test_drain_runs_ready_jobs_only(db):
+    for value in ("a", "b", "c"):
+        tasks.enqueue(db, echo, value=value)
+    tasks.enqueue(db, echo, delay=timedelta(hours=1), value="later")
+    db.commit()
+
+    assert tasks.drain([QUEUE], max_jobs=2) == {"succeeded": 2, "failed": 0}
+    assert tasks.drain([QUEUE]) == {"succeeded": 1, "failed": 0}
+    assert calls == ["a", "b", "c"]
+    (job,) = _jobs(db)
+    assert job.payload == {"value": "later"}
+
+
+def test_heartbeat_keeps_long_job_claimed(db, monkeypatch):
+    monkeypatch.setattr(tasks, "HEARTBEAT_SECONDS", 0.05)
+    tasks.enqueue(db, slow, value="long")
+    db.commit()
+
+    assert tasks.drain([QUEUE]) == {"succeeded": 1, "failed": 0}
+    assert calls == ["requeued=0"]
+    assert _jobs(db) == []
+
+
+def test_finish_leaves_job_reclaimed_by_another_worker(db):
+    tasks.enqueue(db, echo, value="reclaimed")
+    db.commit()
+    first = tasks._claim(QUEUE, "worker-a")
+    stale = datetime.utcnow() - tasks.VISIBILITY_TIMEOUT - timedelta(minutes=1)
+    db.execute(update(Job).values(locked_at=stale))
+    db.commit()
+    assert tasks.requeue_stale() == 1
+    second = tasks._claim(QUEUE, "worker-b")
+
+    assert tasks._finish(first, None) is False
+    assert tasks._finish(first, RuntimeError("late")) is False
+    (job,) = _jobs(db)
+    assert (job.status, job.locked_by) == (JobStatus.RUNNING, "worker-b")
+    assert job.last_error.startswith("Нет heartbeat")
+
+    assert tasks._finish(second, None) is True
+    assert _jobs(db) == []
@@ -0,0 +1,98 @@
+# test_workers.py
+# Многопроцессный запуск: gunicorn с несколькими воркерами, токены, выданные
+# одним воркером, принимаются остальными. Нужен Redis (rate limiting на старте).
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from app.utils import create_refresh_token
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKERS = 4
+MAX_PROBES = 200
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(base_url: str, server: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn завершился с кодом {server.returncode}")
+        try:
+            if httpx.get(f"{base_url}/healthz", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("gunicorn не поднялся вовремя")
+
+
+def _post(base_url: str, path: str, **kwargs) -> httpx.Response:
+    # Новое соединение на каждый запрос, чтобы запросы расходились по воркерам
+    with httpx.Client(base_url=base_url, timeout=5) as client:
+        return client.post(path, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def gunicorn_server(redis_url):
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "WEB_CONCURRENCY": str(WORKERS),
+        "BIND": f"127.0.0.1:{port}",
+        "REDIS_URL": redis_url,
+        "EXPOSE_WORKER_PID": "true",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(base_url, server)
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def test_refresh_tokens_are_accepted_across_workers(gunicorn_server):
+    refresh_token = create_refresh_token(data={"sub": "0000000000"})
+    pids = set()
+    for probe in range(MAX_PROBES):
+        response = _post(gunicorn_server, "/api/auth/refresh", json={"refresh_token": refresh_token})
+        assert response.status_code == 200, response.text
+        pids.add(response.headers["X-Worker-Pid"])
+        # Следующий запрос идет с токеном, выданным (возможно) другим воркером
+        refresh_token = response.json()["refresh_token"]
+        if len(pids) >= 2 and probe >= 20:
+            break
+
+    assert len(pids) > 1, "все запросы обработал один воркер — проверка между воркерами не состоялась"
+
+
+def test_gunicorn_refuses_placeholder_keys():
+    env = {**os.environ, "SECRET_KEY": "change-me", "BIND": f"127.0.0.1:{_free_port()}"}
+    server = subprocess.run(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=30,
+    )
+    assert server.returncode != 0
+    assert "SECRET_KEY" in server.stderr